@@ -0,0 +1,116 @@
+"""
+In-process response cache for the read endpoints.
+
+Entries are keyed by endpoint and query parameters and live in a bounded
+LRU map:
+- Fresh (age < ttl): served directly.
+- Stale (ttl <= age < ttl + stale): served immediately while one background
+  refresh runs (stale-while-revalidate).
+- Missing or expired: loaded. Concurrent misses for the same key share a
+  single in-flight load (single-flight), so a burst of identical dashboard
+  requests runs one BigQuery job instead of many.
+
+Failed loads are not cached. Lookups are counted per endpoint (the first
+element of the key) in api_response_cache_requests_total.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import RESPONSE_CACHE_REQUESTS
+
+CACHE_TTL_S = float(os.getenv("API_CACHE_TTL_S", "30"))
+CACHE_STALE_S = float(os.getenv("API_CACHE_STALE_S", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "256"))
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class ResponseCache:
+    """TTL + LRU cache with single-flight loading and stale-while-revalidate."""
+
+    def __init__(
+        self,
+        ttl_s: float = CACHE_TTL_S,
+        stale_s: float = CACHE_STALE_S,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key: Hashable, loader: Loader) -> Any:
+        """Return the cached value for key, loading it with loader() when needed."""
+        endpoint = key[0] if isinstance(key, tuple) and key else "other"
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl_s:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                RESPONSE_CACHE_REQUESTS.inc(endpoint=endpoint, result="hit")
+                return value
+            if age < self.ttl_s + self.stale_s:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                RESPONSE_CACHE_REQUESTS.inc(endpoint=endpoint, result="stale")
+                self._start_load(key, loader)
+                return value
+
+        self.misses += 1
+        if key in self._inflight:
+            self.coalesced += 1
+            RESPONSE_CACHE_REQUESTS.inc(endpoint=endpoint, result="coalesced")
+        else:
+            RESPONSE_CACHE_REQUESTS.inc(endpoint=endpoint, result="miss")
+        # shield: a cancelled request must not cancel the load other callers share
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def _start_load(self, key: Hashable, loader: Loader) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    async def _fill(self, key: Hashable, loader: Loader) -> Any:
+        value = await loader()
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # Retrieve the exception so background refresh failures are logged, not warned about
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Cache load failed for {key}: {task.exception()}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Shared by all routes in this process
+response_cache = ResponseCache()
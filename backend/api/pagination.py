@@ -0,0 +1,37 @@
+"""
+Opaque keyset cursors for the thread list.
+
+The thread list is ordered by (last_message_ts DESC, thread_id DESC). A
+cursor encodes the sort key of the last row on a page; the next page starts
+strictly after it, so paging is stable while new threads arrive and costs
+the same at page 1 and page 500 (no OFFSET scans).
+
+Clients must treat cursors as opaque strings.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not produced by encode_cursor."""
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Cursor pointing just past row."""
+    ts = row["last_message_ts"]
+    if isinstance(ts, datetime):
+        ts = ts.isoformat()
+    payload = json.dumps({"ts": ts, "id": row["thread_id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Return the (last_message_ts, thread_id) sort key encoded in cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["ts"]), str(payload["id"])
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
@@ -2,30 +2,52 @@
 FastAPI routes for thread data endpoints.
 
 These endpoints provide the contract between frontend and backend.
-All data access is delegated to the repository layer.
+All data access is delegated to the repository layer; responses are cached
+briefly per endpoint and parameters (see api.cache).
 """
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import List, Dict, Any, Optional
+import asyncio
 
-# Import BigQuery repository functions
-from data.bigquery_repo import get_threads, get_monthly_aggregates
+# Data access goes through the backend selected by DATA_BACKEND (see data.registry)
+from data.registry import get_repository
+from data.repository import AGGREGATE_DIMENSIONS, AGGREGATE_GRAINS
+from api.cache import response_cache
+from api.pagination import InvalidCursor, decode_cursor, encode_cursor
 
 router = APIRouter()
 
 
 @router.get("/threads")
-async def list_threads(limit: int = 200) -> List[Dict[str, Any]]:
+async def list_threads(
+    response: Response,
+    limit: int = 200,
+    cursor: Optional[str] = None,
+    thread_status: Optional[List[str]] = Query(None),
+    sentiment: Optional[List[str]] = Query(None),
+    next_action_owner: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
     """
-    Retrieve a list of threads from v_thread_state_final view.
+    Retrieve a page of threads (v_thread_state_final columns).
     
     Args:
         limit: Maximum number of threads to return (default: 200, max: 200)
+        cursor: Opaque cursor from a previous page's X-Next-Cursor header
+        thread_status, sentiment, next_action_owner: Only return threads with
+            one of these values (repeat the parameter to pass several)
+        since, until: Only return threads whose last_message_ts is in [since, until)
         
     Returns:
-        List of thread objects with fields:
+        List of thread objects, newest first, with fields:
         - thread_id, last_message_ts, message_count, thread_status
         - sentiment, confidence, prompt_version, model_name
         - next_action_owner, status_reason, status_source, status_confidence (if LLM explanation available)
+        
+        When more threads match, the X-Next-Cursor response header holds the
+        cursor for the next page.
     """
     try:
         if limit < 1 or limit > 200:
@@ -33,7 +55,42 @@ async def list_threads(limit: int = 200) -> List[Dict[str, Any]]:
                 status_code=400,
                 detail="Limit must be between 1 and 200"
             )
-        return get_threads(limit)
+        after = decode_cursor(cursor) if cursor else None
+        filters = {
+            "thread_status": thread_status,
+            "sentiment": sentiment,
+            "next_action_owner": next_action_owner,
+            "since": since,
+            "until": until,
+        }
+        cache_key = (
+            "threads", limit, cursor,
+            tuple(sorted(thread_status or ())),
+            tuple(sorted(sentiment or ())),
+            tuple(sorted(next_action_owner or ())),
+            since, until,
+        )
+        # Fetch one extra row to learn whether another page exists
+        rows = await response_cache.get_or_load(
+            cache_key,
+            lambda: get_repository().get_threads_async(limit + 1, after, filters),
+        )
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+        return rows
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor"
+        )
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Timed out retrieving threads"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -58,10 +115,79 @@ async def get_monthly_aggregates_endpoint(months: int = 6) -> List[Dict[str, Any
                 status_code=400,
                 detail="Months must be between 1 and 24"
             )
-        return get_monthly_aggregates(months)
+        return await response_cache.get_or_load(
+            ("monthly_aggregates", months),
+            lambda: get_repository().get_monthly_aggregates_async(months),
+        )
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Timed out retrieving monthly aggregates"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error retrieving monthly aggregates: {str(e)}"
         )
 
+
+# Most recent buckets a single aggregates request may cover, per grain
+MAX_AGGREGATE_PERIODS = {"day": 366, "week": 104, "month": 60}
+
+
+@router.get("/threads/aggregates")
+async def get_aggregates_endpoint(
+    grain: str = "day",
+    periods: int = 30,
+    group_by: Optional[List[str]] = Query(None),
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve thread counts per day, week or month, served from the daily rollup.
+    
+    Args:
+        grain: "day", "week" (starting Monday) or "month" (default: day)
+        periods: Number of most recent buckets, including the current one
+            (default: 30; max 366 days, 104 weeks or 60 months)
+        group_by: Break counts down by sentiment, thread_status,
+            next_action_owner and/or model_name (repeat the parameter)
+        
+    Returns:
+        List of {period_start, <group_by columns>, thread_count}, newest bucket first
+    """
+    try:
+        if grain not in AGGREGATE_GRAINS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Grain must be one of: {', '.join(AGGREGATE_GRAINS)}"
+            )
+        max_periods = MAX_AGGREGATE_PERIODS[grain]
+        if periods < 1 or periods > max_periods:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Periods must be between 1 and {max_periods} for grain {grain}"
+            )
+        group_by = sorted(set(group_by or []))
+        unknown = [d for d in group_by if d not in AGGREGATE_DIMENSIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"group_by must be among: {', '.join(AGGREGATE_DIMENSIONS)}"
+            )
+        return await response_cache.get_or_load(
+            ("aggregates", grain, periods, tuple(group_by)),
+            lambda: get_repository().get_aggregates_async(grain, periods, group_by),
+        )
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Timed out retrieving aggregates"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving aggregates: {str(e)}"
+        )
@@ -12,9 +12,27 @@ Authentication is handled by:
 
 ⚠️ NO SERVICE ACCOUNT KEYS. NO ENV VARS. NO SECRETS.
 """
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from google.cloud import bigquery
+import asyncio
+import functools
 import os
+import threading
+import time
+
+from data.repository import AGGREGATE_DIMENSIONS, AGGREGATE_GRAINS, THREAD_FILTER_COLUMNS
+from metrics import (
+    BIGQUERY_BYTES_BILLED,
+    BIGQUERY_BYTES_PROCESSED,
+    BIGQUERY_CACHE_HITS,
+    BIGQUERY_ESTIMATED_BYTES,
+    BIGQUERY_QUERIES,
+    BIGQUERY_QUERY_DURATION,
+    BIGQUERY_SLOT_MS,
+)
 
 # These should be set via environment variables at deployment time
 PROJECT_ID = os.getenv("GCP_PROJECT_ID", "clariversev1")
@@ -44,26 +62,257 @@ MESSAGE_SENTIMENT_TABLE = os.getenv("BIGQUERY_MESSAGE_SENTIMENT_TABLE", "message
 # Whether to use views (preferred) or direct table queries
 USE_VIEWS = os.getenv("BIGQUERY_USE_VIEWS", "true").lower() == "true"
 
+# Read the thread list from the MERGE-maintained thread_state_final table
+# (see workers/thread_state_final.py) instead of the view or the fallback query
+THREAD_STATE_FINAL_TABLE = os.getenv("BIGQUERY_THREAD_STATE_FINAL_TABLE", "thread_state_final")
+USE_THREAD_STATE_FINAL = os.getenv("BIGQUERY_USE_THREAD_STATE_FINAL", "false").lower() == "true"
+
+# Read monthly aggregates from the pre-aggregated monthly_thread_rollup table
+# (see workers/rollups.py) instead of regrouping all threads
+MONTHLY_ROLLUP_TABLE = os.getenv("BIGQUERY_MONTHLY_ROLLUP_TABLE", "monthly_thread_rollup")
+USE_MONTHLY_ROLLUP = os.getenv("BIGQUERY_USE_MONTHLY_ROLLUP", "false").lower() == "true"
+
+# Source of the general aggregates endpoint (see workers/rollups.py)
+DAILY_ROLLUP_TABLE = os.getenv("BIGQUERY_DAILY_ROLLUP_TABLE", "daily_thread_rollup")
+
+# DATE_TRUNC part for each of AGGREGATE_GRAINS
+_GRAIN_TRUNC = {"day": "DAY", "week": "ISOWEEK", "month": "MONTH"}
+
+# Async access: queries run on a dedicated bounded pool so the event loop never
+# blocks on BigQuery, and each query is cancelled if it exceeds its timeout.
+MAX_CONCURRENT_QUERIES = int(os.getenv("BIGQUERY_MAX_CONCURRENT_QUERIES", "16"))
+QUERY_TIMEOUT_S = float(os.getenv("BIGQUERY_QUERY_TIMEOUT_S", "30"))
+# The job's own result() wait outlasts the caller's by this much, so the
+# caller's asyncio timeout (and its timeout response) always fires first
+QUERY_TIMEOUT_GRACE_S = 5.0
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES, thread_name_prefix="bigquery")
+
+# Cost guardrails: every query is capped with maximum_bytes_billed, so
+# BigQuery rejects one that would bill more before it runs (at no charge).
+# BIGQUERY_MAX_BYTES_BILLED_<QUERY> overrides the cap for one call site, e.g.
+# BIGQUERY_MAX_BYTES_BILLED_THREADS; 0 disables it.
+MAX_BYTES_BILLED = int(os.getenv("BIGQUERY_MAX_BYTES_BILLED", str(10 * 1024 ** 3)))
+# Attached to every job, so cost can be broken down per call site in the
+# billing export and INFORMATION_SCHEMA.JOBS
+JOB_LABELS = {"app": "thread-analytics-api"}
+
+# Set by estimate_query: _run_query dry-runs instead of running
+_dry_run: ContextVar[bool] = ContextVar("bigquery_dry_run", default=False)
+
+
+class QueryHandle:
+    """
+    Tracks the BigQuery job started for one call so it can be cancelled from
+    another thread (e.g. when the awaiting request times out).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._job = None
+        self._cancelled = False
+
+    def attach(self, job) -> None:
+        with self._lock:
+            self._job = job
+            cancel = self._cancelled
+        if cancel:
+            job.cancel()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            job = self._job
+        if job is not None:
+            try:
+                job.cancel()
+            except Exception as e:
+                print(f"WARNING: Failed to cancel BigQuery job {job.job_id}: {e}")
+
 
 def _get_table_name(table_name: str) -> str:
     """Construct fully qualified BigQuery table/view name."""
     return f"`{PROJECT_ID}.{DATASET_ID}.{table_name}`"
 
 
-def get_threads(limit: int) -> List[Dict[str, Any]]:
+def max_bytes_billed(name: str) -> int:
+    """Billed-bytes cap for the call site name (0 = uncapped)."""
+    return int(os.getenv(f"BIGQUERY_MAX_BYTES_BILLED_{name.upper()}", str(MAX_BYTES_BILLED)))
+
+
+def _run_query(
+    query: str,
+    job_config: bigquery.QueryJobConfig,
+    handle: Optional[QueryHandle] = None,
+    timeout: Optional[float] = None,
+    name: str = "query",
+) -> List[Dict[str, Any]]:
+    """
+    Run a query and return its rows as dictionaries.
+    
+    The job is labelled with the call site name and capped at
+    max_bytes_billed(name). Duration, outcome, bytes processed/billed and
+    slot-ms are recorded in the bigquery_* metrics under the query label
+    name. Under estimate_query the query is only dry-run.
+    """
+    if client is None:
+        raise Exception("BigQuery client not initialized. Run: gcloud auth application-default login")
+    cap = max_bytes_billed(name)
+    if _dry_run.get():
+        dry_config = bigquery.QueryJobConfig(
+            dry_run=True, use_query_cache=False, query_parameters=job_config.query_parameters
+        )
+        job = client.query(query, job_config=dry_config)
+        BIGQUERY_ESTIMATED_BYTES.set(job.total_bytes_processed or 0, query=name)
+        return [{"query": name, "estimated_bytes": job.total_bytes_processed or 0, "maximum_bytes_billed": cap}]
+    
+    if cap > 0:
+        job_config.maximum_bytes_billed = cap
+    job_config.labels = {**JOB_LABELS, "call_site": name}
+    started = time.perf_counter()
+    try:
+        job = client.query(query, job_config=job_config)
+        if handle is not None:
+            handle.attach(job)
+        results = job.result(timeout=timeout)
+        # Convert BigQuery Row objects to dictionaries
+        rows = [dict(row) for row in results]
+    except Exception as e:
+        status = "bytes_limit" if "bytesBilledLimitExceeded" in str(e) else "error"
+        BIGQUERY_QUERIES.inc(query=name, status=status)
+        raise
+    finally:
+        BIGQUERY_QUERY_DURATION.observe(time.perf_counter() - started, query=name)
+    BIGQUERY_QUERIES.inc(query=name, status="ok")
+    BIGQUERY_BYTES_PROCESSED.inc(job.total_bytes_processed or 0, query=name)
+    BIGQUERY_BYTES_BILLED.inc(job.total_bytes_billed or 0, query=name)
+    BIGQUERY_SLOT_MS.inc(job.slot_millis or 0, query=name)
+    if job.cache_hit:
+        BIGQUERY_CACHE_HITS.inc(query=name)
+    return rows
+
+
+def estimate_query(fn, *args, **kwargs) -> Dict[str, Any]:
+    """
+    Dry-run the query a repository function (get_threads, ...) would run
+    with these arguments, without running it.
+    
+    Returns {"query", "estimated_bytes", "maximum_bytes_billed"}.
+    """
+    token = _dry_run.set(True)
+    try:
+        return fn(*args, **kwargs)[0]
+    finally:
+        _dry_run.reset(token)
+
+
+async def _run_in_executor(fn, *args, timeout_s: float = None) -> List[Dict[str, Any]]:
+    """
+    Run a blocking repository function on the BigQuery pool.
+    
+    The caller waits at most timeout_s; on timeout or cancellation the
+    underlying BigQuery job is cancelled too, so abandoned queries don't keep
+    burning slots.
+    """
+    if timeout_s is None:
+        timeout_s = QUERY_TIMEOUT_S
+    handle = QueryHandle()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _executor, functools.partial(fn, *args, handle=handle, timeout=timeout_s + QUERY_TIMEOUT_GRACE_S)
+    )
+    try:
+        return await asyncio.wait_for(future, timeout_s)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        handle.cancel()
+        raise
+
+
+def _thread_list_where(
+    after: Optional[Tuple[datetime, str]],
+    filters: Optional[Dict[str, Any]],
+) -> Tuple[str, list]:
+    """
+    Build the WHERE clause and parameters for a thread list page.
+    
+    after is the (last_message_ts, thread_id) key of the previous page's last
+    row. filters may hold value lists for THREAD_FILTER_COLUMNS plus
+    since/until bounds on last_message_ts (until is exclusive).
+    """
+    conditions = []
+    params = []
+    filters = filters or {}
+    for column in THREAD_FILTER_COLUMNS:
+        values = filters.get(column)
+        if values:
+            conditions.append(f"{column} IN UNNEST(@{column})")
+            params.append(bigquery.ArrayQueryParameter(column, "STRING", list(values)))
+    if filters.get("since") is not None:
+        conditions.append("last_message_ts >= @since")
+        params.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", filters["since"]))
+    if filters.get("until") is not None:
+        conditions.append("last_message_ts < @until")
+        params.append(bigquery.ScalarQueryParameter("until", "TIMESTAMP", filters["until"]))
+    if after is not None:
+        conditions.append(
+            "(last_message_ts < @after_ts OR (last_message_ts = @after_ts AND thread_id < @after_thread_id))"
+        )
+        params.append(bigquery.ScalarQueryParameter("after_ts", "TIMESTAMP", after[0]))
+        params.append(bigquery.ScalarQueryParameter("after_thread_id", "STRING", after[1]))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def get_threads(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    handle: Optional[QueryHandle] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
     """
     Retrieve threads from BigQuery.
     
-    Uses views if available, otherwise queries tables directly.
+    Reads thread_state_final when BIGQUERY_USE_THREAD_STATE_FINAL is set;
+    otherwise uses views if available, otherwise queries tables directly.
     Uses parameterized queries to prevent SQL injection.
-    Returns thread data with sentiment information.
+    Returns thread data with sentiment information, ordered by
+    (last_message_ts, thread_id) descending. Pass the last row's key as after
+    to fetch the next page; filters are pushed into the query (see
+    _thread_list_where).
+    
+    Blocks the calling thread; async code should use get_threads_async.
     """
-    if USE_VIEWS:
+    where, filter_params = _thread_list_where(after, filters)
+    if USE_THREAD_STATE_FINAL:
+        # One pre-joined row per thread; partitioned on last_message_ts and
+        # clustered on the filter columns
+        query = f"""
+        SELECT
+          thread_id,
+          last_message_ts,
+          message_count,
+          thread_status,
+          sentiment,
+          confidence,
+          prompt_version,
+          model_name,
+          next_action_owner,
+          status_reason,
+          status_source,
+          status_confidence
+        FROM {_get_table_name(THREAD_STATE_FINAL_TABLE)}
+        {where}
+        ORDER BY last_message_ts DESC, thread_id DESC
+        LIMIT @limit
+        """
+    elif USE_VIEWS:
         # Use view (preferred - faster and cleaner)
         query = f"""
         SELECT *
         FROM {_get_table_name(THREAD_LIST_VIEW)}
-        ORDER BY last_message_ts DESC
+        {where}
+        ORDER BY last_message_ts DESC, thread_id DESC
         LIMIT @limit
         """
     else:
@@ -135,43 +384,74 @@ def get_threads(limit: int) -> List[Dict[str, Any]]:
           USING (thread_id)
         LEFT JOIN latest_explain e
           USING (thread_id)
-        ORDER BY t.last_message_ts DESC
+        """
+        # Filter on the output columns (e.g. the LLM-overridden thread_status)
+        query = f"""
+        SELECT *
+        FROM ({query})
+        {where}
+        ORDER BY last_message_ts DESC, thread_id DESC
         LIMIT @limit
         """
     
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
             bigquery.ScalarQueryParameter("limit", "INT64", limit)
-        ]
+        ] + filter_params
     )
     
     try:
-        job = client.query(query, job_config=job_config)
-        results = job.result()
-        
-        # Convert BigQuery Row objects to dictionaries
-        return [dict(row) for row in results]
+        return _run_query(query, job_config, handle, timeout, name="threads")
+    except (FuturesTimeoutError, asyncio.TimeoutError):
+        raise
     except Exception as e:
         # Log detailed error for debugging
         error_msg = str(e)
         print(f"ERROR in get_threads:")
         print(f"  Project: {PROJECT_ID}, Dataset: {DATASET_ID}")
-        print(f"  Using views: {USE_VIEWS}")
+        print(f"  Using views: {USE_VIEWS}, thread_state_final: {USE_THREAD_STATE_FINAL}")
         print(f"  Error: {error_msg}")
         if "Not found" in error_msg or "does not exist" in error_msg:
-            raise Exception(f"Table or view not found. Backend team needs to create: {THREAD_STATE_TABLE if not USE_VIEWS else THREAD_LIST_VIEW}")
+            if USE_THREAD_STATE_FINAL:
+                missing = THREAD_STATE_FINAL_TABLE
+            else:
+                missing = THREAD_LIST_VIEW if USE_VIEWS else THREAD_STATE_TABLE
+            raise Exception(f"Table or view not found. Backend team needs to create: {missing}")
         raise Exception(f"BigQuery error: {error_msg}")
 
 
-def get_monthly_aggregates(months: int) -> List[Dict[str, Any]]:
+def get_monthly_aggregates(
+    months: int,
+    handle: Optional[QueryHandle] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
     """
     Retrieve monthly aggregates from BigQuery.
     
-    Uses views if available, otherwise queries tables directly.
+    Reads monthly_thread_rollup when BIGQUERY_USE_MONTHLY_ROLLUP is set;
+    otherwise uses views if available, otherwise queries tables directly.
     Uses parameterized queries to prevent SQL injection.
     Returns monthly thread aggregates with sentiment distribution.
+    
+    Blocks the calling thread; async code should use get_monthly_aggregates_async.
     """
-    if USE_VIEWS:
+    if USE_MONTHLY_ROLLUP:
+        # One stored row per month; months whose threads all moved on are kept at 0
+        query = f"""
+        SELECT
+          month,
+          thread_count,
+          happy_threads,
+          bit_irritated_threads,
+          moderately_concerned_threads,
+          anger_threads,
+          frustrated_threads
+        FROM {_get_table_name(MONTHLY_ROLLUP_TABLE)}
+        WHERE thread_count > 0
+        ORDER BY month_start DESC
+        LIMIT @months
+        """
+    elif USE_VIEWS:
         # Use view (preferred - faster and cleaner)
         query = f"""
         SELECT *
@@ -198,12 +478,15 @@ def get_monthly_aggregates(months: int) -> List[Dict[str, Any]]:
           WHERE thread_id IS NOT NULL
           GROUP BY thread_id
         )
+        -- Same columns as v_monthly_thread_aggregates (1-5 sentiment scale)
         SELECT
           FORMAT_TIMESTAMP('%Y-%m', t.last_message_ts) AS month,
           COUNT(*) AS thread_count,
-          COUNTIF(s.sentiment = 'pos') AS pos_threads,
-          COUNTIF(s.sentiment = 'neutral') AS neutral_threads,
-          COUNTIF(s.sentiment = 'neg') AS neg_threads
+          COUNTIF(SAFE_CAST(s.sentiment AS INT64) = 1) AS happy_threads,
+          COUNTIF(SAFE_CAST(s.sentiment AS INT64) = 2) AS bit_irritated_threads,
+          COUNTIF(SAFE_CAST(s.sentiment AS INT64) = 3) AS moderately_concerned_threads,
+          COUNTIF(SAFE_CAST(s.sentiment AS INT64) = 4) AS anger_threads,
+          COUNTIF(SAFE_CAST(s.sentiment AS INT64) = 5) AS frustrated_threads
         FROM thread_summary t
         LEFT JOIN latest_sentiment s
           USING (thread_id)
@@ -218,26 +501,109 @@ def get_monthly_aggregates(months: int) -> List[Dict[str, Any]]:
         ]
     )
     
-    if client is None:
-        raise Exception("BigQuery client not initialized. Run: gcloud auth application-default login")
-    
     try:
-        job = client.query(query, job_config=job_config)
-        results = job.result()
-        
-        # Convert BigQuery Row objects to dictionaries
-        return [dict(row) for row in results]
+        return _run_query(query, job_config, handle, timeout, name="monthly_aggregates")
+    except (FuturesTimeoutError, asyncio.TimeoutError):
+        raise
     except Exception as e:
         # Log detailed error for debugging
         error_msg = str(e)
         print(f"ERROR in get_monthly_aggregates:")
         print(f"  Project: {PROJECT_ID}, Dataset: {DATASET_ID}")
-        print(f"  Using views: {USE_VIEWS}")
+        print(f"  Using views: {USE_VIEWS}, monthly rollup: {USE_MONTHLY_ROLLUP}")
         print(f"  Error: {error_msg}")
         if "Not found" in error_msg or "does not exist" in error_msg or "404" in error_msg:
-            missing = MONTHLY_AGGREGATES_VIEW if USE_VIEWS else THREAD_STATE_TABLE
+            if USE_MONTHLY_ROLLUP:
+                missing = MONTHLY_ROLLUP_TABLE
+            else:
+                missing = MONTHLY_AGGREGATES_VIEW if USE_VIEWS else THREAD_STATE_TABLE
             raise Exception(f"Table/view not found: {PROJECT_ID}.{DATASET_ID}.{missing}. Backend team needs to create this.")
         if "403" in error_msg or "permission" in error_msg.lower():
             raise Exception(f"Permission denied. Check BigQuery access for project {PROJECT_ID}")
         raise Exception(f"BigQuery error: {error_msg}")
 
+
+
+def get_aggregates(
+    grain: str,
+    periods: int,
+    group_by: Optional[List[str]] = None,
+    handle: Optional[QueryHandle] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve thread counts per time bucket, optionally broken down by dimensions.
+    
+    Reads the precomputed daily_thread_rollup and sums it up to the requested
+    grain (day, week starting Monday, or month) over the latest periods
+    buckets, including the current one. group_by is any subset of
+    AGGREGATE_DIMENSIONS.
+    
+    Returns rows of period_start (DATE), the group_by columns and
+    thread_count, newest period first.
+    """
+    if grain not in AGGREGATE_GRAINS:
+        raise ValueError(f"Unknown grain: {grain}. Must be one of {list(AGGREGATE_GRAINS)}")
+    group_by = list(dict.fromkeys(group_by or []))
+    unknown = [d for d in group_by if d not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {unknown}. Must be among {list(AGGREGATE_DIMENSIONS)}")
+    
+    # Only whitelisted names are interpolated into the SQL
+    trunc = _GRAIN_TRUNC[grain]
+    interval = "WEEK" if grain == "week" else trunc
+    dimensions = "".join(f"{d},\n          " for d in group_by)
+    group_columns = "".join(f", {d}" for d in group_by)
+    query = f"""
+        SELECT
+          DATE_TRUNC(day, {trunc}) AS period_start,
+          {dimensions}SUM(thread_count) AS thread_count
+        FROM {_get_table_name(DAILY_ROLLUP_TABLE)}
+        WHERE day >= DATE_SUB(DATE_TRUNC(CURRENT_DATE(), {trunc}), INTERVAL @periods - 1 {interval})
+        GROUP BY period_start{group_columns}
+        ORDER BY period_start DESC{group_columns}
+        """
+    
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("periods", "INT64", periods)
+        ]
+    )
+    
+    try:
+        return _run_query(query, job_config, handle, timeout, name="aggregates")
+    except (FuturesTimeoutError, asyncio.TimeoutError):
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        print("ERROR in get_aggregates:")
+        print(f"  Project: {PROJECT_ID}, Dataset: {DATASET_ID}")
+        print(f"  Error: {error_msg}")
+        if "Not found" in error_msg or "does not exist" in error_msg or "404" in error_msg:
+            raise Exception(f"Table not found: {PROJECT_ID}.{DATASET_ID}.{DAILY_ROLLUP_TABLE}. Run workers/thread_state_final.py --full to create it.")
+        raise Exception(f"BigQuery error: {error_msg}")
+
+
+async def get_threads_async(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    timeout_s: float = None,
+) -> List[Dict[str, Any]]:
+    """Non-blocking get_threads; raises asyncio.TimeoutError after timeout_s."""
+    return await _run_in_executor(get_threads, limit, after, filters, timeout_s=timeout_s)
+
+
+async def get_monthly_aggregates_async(months: int, timeout_s: float = None) -> List[Dict[str, Any]]:
+    """Non-blocking get_monthly_aggregates; raises asyncio.TimeoutError after timeout_s."""
+    return await _run_in_executor(get_monthly_aggregates, months, timeout_s=timeout_s)
+
+
+async def get_aggregates_async(
+    grain: str,
+    periods: int,
+    group_by: Optional[List[str]] = None,
+    timeout_s: float = None,
+) -> List[Dict[str, Any]]:
+    """Non-blocking get_aggregates; raises asyncio.TimeoutError after timeout_s."""
+    return await _run_in_executor(get_aggregates, grain, periods, group_by, timeout_s=timeout_s)
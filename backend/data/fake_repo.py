@@ -0,0 +1,185 @@
+"""
+Latency-injecting fake repository for load tests (DATA_BACKEND=fake).
+
+Serves a fixed set of synthetic threads from memory. Every call first waits
+a random latency (FAKE_REPO_LATENCY_MS +/- FAKE_REPO_JITTER_MS), by default
+by blocking a thread of a pool sized like the BigQuery one. That way
+executor saturation and event-loop behaviour look like production, but no
+cloud calls are made. With FAKE_REPO_MODE=async the wait is an
+asyncio.sleep instead, which isolates the API's own overhead.
+"""
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from data.repository import AGGREGATE_DIMENSIONS, AGGREGATE_GRAINS, THREAD_FILTER_COLUMNS, period_start
+
+FAKE_REPO_THREADS = int(os.getenv("FAKE_REPO_THREADS", "20000"))
+FAKE_REPO_LATENCY_MS = float(os.getenv("FAKE_REPO_LATENCY_MS", "50"))
+FAKE_REPO_JITTER_MS = float(os.getenv("FAKE_REPO_JITTER_MS", "20"))
+FAKE_REPO_MODE = os.getenv("FAKE_REPO_MODE", "thread").lower()  # thread | async
+FAKE_REPO_POOL_SIZE = int(os.getenv("FAKE_REPO_POOL_SIZE", os.getenv("BIGQUERY_MAX_CONCURRENT_QUERIES", "16")))
+
+SENTIMENTS = ["Happy", "Bit Irritated", "Moderately Concerned", "Anger", "Frustrated"]
+
+_executor = ThreadPoolExecutor(max_workers=FAKE_REPO_POOL_SIZE, thread_name_prefix="fake-repo")
+_rng = random.Random(0)
+_threads: Optional[List[Dict[str, Any]]] = None
+# Aggregates are computed once per argument set and window; the data never changes
+_memo: Dict[tuple, List[Dict[str, Any]]] = {}
+
+# Calls served, for load test reports
+calls = 0
+
+
+def _generate(count: int) -> List[Dict[str, Any]]:
+    """Synthetic thread rows spread over the last year, newest first."""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        explained = rng.random() < 0.7
+        rows.append({
+            "thread_id": f"t-{i:07d}",
+            "last_message_ts": now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+            "message_count": rng.randint(1, 20),
+            "thread_status": rng.choice(["open", "closed"]),
+            "sentiment": rng.choice(SENTIMENTS),
+            "confidence": round(rng.uniform(0.5, 1.0), 2),
+            "prompt_version": "sentiment_v0.2",
+            "model_name": rng.choice(["gemini-2.0-flash", "local-rules-v1"]),
+            "next_action_owner": rng.choice(["org", "customer", "none"]) if explained else None,
+            "status_reason": "Synthetic status reason." if explained else None,
+            "status_source": "llm" if explained else "heuristic",
+            "status_confidence": round(rng.uniform(0.5, 1.0), 2) if explained else None,
+        })
+    rows.sort(key=lambda r: (r["last_message_ts"], r["thread_id"]), reverse=True)
+    return rows
+
+
+def _all_threads() -> List[Dict[str, Any]]:
+    global _threads
+    if _threads is None:
+        _threads = _generate(FAKE_REPO_THREADS)
+    return _threads
+
+
+def _latency_s() -> float:
+    return max(0.0, FAKE_REPO_LATENCY_MS + _rng.uniform(-FAKE_REPO_JITTER_MS, FAKE_REPO_JITTER_MS)) / 1000
+
+
+def get_threads(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Filter and page the synthetic threads (see data.repository)."""
+    filters = filters or {}
+    out = []
+    for row in _all_threads():
+        if after is not None and (row["last_message_ts"], row["thread_id"]) >= (after[0].replace(tzinfo=None), after[1]):
+            continue
+        if any(filters.get(c) and row[c] not in filters[c] for c in THREAD_FILTER_COLUMNS):
+            continue
+        if filters.get("since") is not None and row["last_message_ts"] < filters["since"].replace(tzinfo=None):
+            continue
+        if filters.get("until") is not None and row["last_message_ts"] >= filters["until"].replace(tzinfo=None):
+            continue
+        out.append(dict(row))
+        if len(out) >= limit:
+            break
+    return out
+
+
+def get_monthly_aggregates(months: int) -> List[Dict[str, Any]]:
+    """Monthly counts over the synthetic threads, newest month first."""
+    key = ("monthly", months)
+    if key in _memo:
+        return _memo[key]
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for row in _all_threads():
+        month = row["last_message_ts"].strftime("%Y-%m")
+        bucket = buckets.setdefault(month, {
+            "month": month, "thread_count": 0, "happy_threads": 0, "bit_irritated_threads": 0,
+            "moderately_concerned_threads": 0, "anger_threads": 0, "frustrated_threads": 0,
+        })
+        bucket["thread_count"] += 1
+        bucket[row["sentiment"].lower().replace(" ", "_") + "_threads"] += 1
+    _memo[key] = [buckets[m] for m in sorted(buckets, reverse=True)[:months]]
+    return _memo[key]
+
+
+def get_aggregates(grain: str, periods: int, group_by: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Per-bucket counts over the synthetic threads (see data.repository)."""
+    if grain not in AGGREGATE_GRAINS:
+        raise ValueError(f"Unknown grain: {grain}. Must be one of {list(AGGREGATE_GRAINS)}")
+    group_by = list(dict.fromkeys(group_by or []))
+    unknown = [d for d in group_by if d not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {unknown}. Must be among {list(AGGREGATE_DIMENSIONS)}")
+    window_start = period_start(grain, periods, datetime.utcnow().date())
+    memo_key = ("aggregates", grain, window_start, tuple(group_by))
+    if memo_key in _memo:
+        return _memo[memo_key]
+    counts: Dict[tuple, int] = {}
+    for row in _all_threads():
+        day = row["last_message_ts"].date()
+        if day < window_start:
+            continue
+        if grain == "week":
+            start = day - timedelta(days=day.weekday())
+        elif grain == "month":
+            start = day.replace(day=1)
+        else:
+            start = day
+        key = (start,) + tuple(row[d] for d in group_by)
+        counts[key] = counts.get(key, 0) + 1
+    rows = [
+        dict(zip(["period_start"] + group_by, key), thread_count=count)
+        for key, count in counts.items()
+    ]
+    rows.sort(key=lambda r: r["period_start"], reverse=True)
+    _memo[memo_key] = rows
+    return rows
+
+
+async def _call(fn, *args, timeout_s: float = None):
+    global calls
+    calls += 1
+    delay = _latency_s()
+    if FAKE_REPO_MODE == "async":
+        await asyncio.sleep(delay)
+        return fn(*args)
+
+    def _blocking():
+        time.sleep(delay)
+        return fn(*args)
+
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(_executor, _blocking), timeout_s)
+
+
+async def get_threads_async(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    timeout_s: float = None,
+) -> List[Dict[str, Any]]:
+    return await _call(get_threads, limit, after, filters, timeout_s=timeout_s)
+
+
+async def get_monthly_aggregates_async(months: int, timeout_s: float = None) -> List[Dict[str, Any]]:
+    return await _call(get_monthly_aggregates, months, timeout_s=timeout_s)
+
+
+async def get_aggregates_async(
+    grain: str,
+    periods: int,
+    group_by: Optional[List[str]] = None,
+    timeout_s: float = None,
+) -> List[Dict[str, Any]]:
+    return await _call(get_aggregates, grain, periods, group_by, timeout_s=timeout_s)
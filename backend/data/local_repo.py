@@ -0,0 +1,309 @@
+"""
+Local repository implementation using DuckDB over exported tables.
+
+Runs the v_thread_state_final logic over Parquet or NDJSON exports, for
+development, load testing and offline benchmarks without BigQuery. Put one
+export per table in LOCAL_DATA_DIR, as <table>.parquet, <table>.ndjson,
+<table>.jsonl or a <table>/ directory of such files:
+
+- interaction_event (required unless thread_state is present)
+- thread_state (optional; derived from interaction_event when missing)
+- message_sentiment (optional)
+- thread_state_explain (optional)
+
+Export from BigQuery with e.g.
+  bq extract --destination_format PARQUET flipkart_slices.message_sentiment gs://bucket/message_sentiment/*.parquet
+
+On first use the exports are joined once into an in-memory
+thread_state_final table, so each request is a millisecond-scale scan of
+one small table. Call reload() after replacing the files.
+
+Requires the optional duckdb package (pip install duckdb).
+"""
+import asyncio
+import glob
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import duckdb
+except ImportError:  # optional dependency, only needed for DATA_BACKEND=local
+    duckdb = None
+
+from data.repository import AGGREGATE_DIMENSIONS, AGGREGATE_GRAINS, THREAD_FILTER_COLUMNS, period_start
+
+LOCAL_DATA_DIR = os.getenv("LOCAL_DATA_DIR", "local_data")
+
+# Same heuristic as thread_state: threads with activity within N days are open
+OPEN_THREAD_DAYS = int(os.getenv("LOCAL_OPEN_THREAD_DAYS", "7"))
+
+SOURCE_TABLES = ("interaction_event", "thread_state", "message_sentiment", "thread_state_explain")
+
+# Stand-ins for optional exports that are missing, so the join still runs
+_EMPTY_TABLES = {
+    "message_sentiment": """
+        SELECT NULL::VARCHAR AS message_id, NULL::VARCHAR AS thread_id, NULL::VARCHAR AS sentiment,
+               NULL::DOUBLE AS confidence, NULL::VARCHAR AS prompt_version,
+               NULL::VARCHAR AS model_name, NULL::VARCHAR AS created_at
+        WHERE FALSE""",
+    "thread_state_explain": """
+        SELECT NULL::VARCHAR AS thread_id, NULL::VARCHAR AS thread_status,
+               NULL::VARCHAR AS next_action_owner, NULL::VARCHAR AS status_reason,
+               NULL::DOUBLE AS confidence, NULL::VARCHAR AS prompt_version,
+               NULL::VARCHAR AS model_name, NULL::TIMESTAMP AS created_at
+        WHERE FALSE""",
+}
+
+_THREAD_STATE_FINAL_SQL = """
+CREATE OR REPLACE TABLE thread_state_final AS
+WITH thread_base AS (
+  {thread_base}
+),
+latest_explain AS (
+  SELECT *
+  FROM thread_state_explain
+  WHERE thread_id IS NOT NULL
+  QUALIFY ROW_NUMBER() OVER (PARTITION BY thread_id ORDER BY CAST(created_at AS TIMESTAMP) DESC) = 1
+),
+latest_sentiment AS (
+  SELECT *
+  FROM message_sentiment
+  WHERE thread_id IS NOT NULL
+  QUALIFY ROW_NUMBER() OVER (PARTITION BY thread_id ORDER BY TRY_CAST(created_at AS TIMESTAMP) DESC) = 1
+)
+SELECT
+  t.thread_id,
+  t.last_message_ts,
+  t.message_count,
+  COALESCE(e.thread_status, t.thread_status) AS thread_status,
+  CASE
+    WHEN TRY_CAST(s.sentiment AS INTEGER) = 1 THEN 'Happy'
+    WHEN TRY_CAST(s.sentiment AS INTEGER) = 2 THEN 'Bit Irritated'
+    WHEN TRY_CAST(s.sentiment AS INTEGER) = 3 THEN 'Moderately Concerned'
+    WHEN TRY_CAST(s.sentiment AS INTEGER) = 4 THEN 'Anger'
+    WHEN TRY_CAST(s.sentiment AS INTEGER) = 5 THEN 'Frustrated'
+    WHEN LOWER(CAST(s.sentiment AS VARCHAR)) = 'happy' THEN 'Happy'
+    WHEN LOWER(CAST(s.sentiment AS VARCHAR)) = 'bit irritated' THEN 'Bit Irritated'
+    WHEN LOWER(CAST(s.sentiment AS VARCHAR)) = 'moderately concerned' THEN 'Moderately Concerned'
+    WHEN LOWER(CAST(s.sentiment AS VARCHAR)) = 'anger' THEN 'Anger'
+    WHEN LOWER(CAST(s.sentiment AS VARCHAR)) = 'frustrated' THEN 'Frustrated'
+    ELSE CAST(s.sentiment AS VARCHAR)
+  END AS sentiment,
+  s.confidence,
+  s.prompt_version,
+  s.model_name,
+  e.next_action_owner,
+  e.status_reason,
+  CASE WHEN e.thread_status IS NOT NULL THEN 'llm' ELSE 'heuristic' END AS status_source,
+  e.confidence AS status_confidence
+FROM thread_base t
+LEFT JOIN latest_explain e USING (thread_id)
+LEFT JOIN latest_sentiment s USING (thread_id)
+"""
+
+_THREAD_BASE_FROM_STATE = """
+  SELECT thread_id, CAST(last_message_ts AS TIMESTAMP) AS last_message_ts, message_count, thread_status
+  FROM thread_state
+  WHERE thread_id IS NOT NULL"""
+
+_THREAD_BASE_FROM_EVENTS = """
+  SELECT
+    thread_id,
+    MAX(CAST(event_ts AS TIMESTAMP)) AS last_message_ts,
+    COUNT(*) AS message_count,
+    CASE WHEN MAX(CAST(event_ts AS TIMESTAMP)) >= $open_since THEN 'open' ELSE 'closed' END AS thread_status
+  FROM interaction_event
+  WHERE thread_id IS NOT NULL
+  GROUP BY thread_id"""
+
+_THREAD_COLUMNS = """
+  thread_id, last_message_ts, message_count, thread_status, sentiment, confidence,
+  prompt_version, model_name, next_action_owner, status_reason, status_source, status_confidence"""
+
+_con = None
+_con_lock = threading.Lock()
+
+
+def _source_sql(data_dir: str, table: str) -> Optional[str]:
+    """DuckDB table function reading the export of table, or None if there is none."""
+    candidates = [
+        (f"{table}.parquet", "read_parquet"),
+        (os.path.join(table, "*.parquet"), "read_parquet"),
+        (f"{table}.ndjson", "read_json_auto"),
+        (f"{table}.jsonl", "read_json_auto"),
+        (os.path.join(table, "*.json*"), "read_json_auto"),
+    ]
+    for pattern, reader in candidates:
+        path = os.path.join(data_dir, pattern)
+        if glob.glob(path):
+            quoted = path.replace("'", "''")
+            if reader == "read_json_auto":
+                return f"read_json_auto('{quoted}', format = 'newline_delimited')"
+            return f"{reader}('{quoted}')"
+    return None
+
+
+def _connect(data_dir: str):
+    if duckdb is None:
+        raise Exception("DATA_BACKEND=local requires duckdb. Run: pip install duckdb")
+    con = duckdb.connect(":memory:")
+    available = set()
+    for table in SOURCE_TABLES:
+        source = _source_sql(data_dir, table)
+        if source is not None:
+            con.execute(f"CREATE VIEW {table} AS SELECT * FROM {source}")
+            available.add(table)
+        elif table in _EMPTY_TABLES:
+            con.execute(f"CREATE VIEW {table} AS {_EMPTY_TABLES[table]}")
+
+    if "thread_state" in available:
+        thread_base, params = _THREAD_BASE_FROM_STATE, {}
+    elif "interaction_event" in available:
+        open_since = datetime.utcnow() - timedelta(days=OPEN_THREAD_DAYS)
+        thread_base, params = _THREAD_BASE_FROM_EVENTS, {"open_since": open_since}
+    else:
+        raise Exception(f"No interaction_event or thread_state export found in {os.path.abspath(data_dir)}")
+
+    con.execute(_THREAD_STATE_FINAL_SQL.format(thread_base=thread_base), params)
+    count = con.execute("SELECT COUNT(*) FROM thread_state_final").fetchone()[0]
+    print(f"Local repository loaded {count} threads from {os.path.abspath(data_dir)} ({', '.join(sorted(available))}).")
+    return con
+
+
+def _cursor():
+    """Per-call cursor on the shared in-memory database (cursors are thread-safe)."""
+    global _con
+    with _con_lock:
+        if _con is None:
+            _con = _connect(LOCAL_DATA_DIR)
+        return _con.cursor()
+
+
+def reload(data_dir: Optional[str] = None) -> None:
+    """Re-read the exports (from data_dir, or LOCAL_DATA_DIR)."""
+    global _con, LOCAL_DATA_DIR
+    with _con_lock:
+        if data_dir is not None:
+            LOCAL_DATA_DIR = data_dir
+        _con = _connect(LOCAL_DATA_DIR)
+
+
+def _query(sql: str, params: Optional[list] = None) -> List[Dict[str, Any]]:
+    cur = _cursor()
+    try:
+        cur.execute(sql, params or [])
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    """thread_state_final stores naive UTC timestamps."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def get_threads(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Retrieve threads ordered by (last_message_ts, thread_id) DESC (see data.repository)."""
+    conditions = []
+    params: list = []
+    filters = filters or {}
+    for column in THREAD_FILTER_COLUMNS:
+        values = filters.get(column)
+        if values:
+            conditions.append(f"list_contains(?, {column})")
+            params.append(list(values))
+    if filters.get("since") is not None:
+        conditions.append("last_message_ts >= ?")
+        params.append(_naive_utc(filters["since"]))
+    if filters.get("until") is not None:
+        conditions.append("last_message_ts < ?")
+        params.append(_naive_utc(filters["until"]))
+    if after is not None:
+        conditions.append("(last_message_ts < ? OR (last_message_ts = ? AND thread_id < ?))")
+        after_ts = _naive_utc(after[0])
+        params.extend([after_ts, after_ts, after[1]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit)
+    return _query(f"""
+        SELECT {_THREAD_COLUMNS}
+        FROM thread_state_final
+        {where}
+        ORDER BY last_message_ts DESC, thread_id DESC
+        LIMIT ?
+        """, params)
+
+
+def get_monthly_aggregates(months: int) -> List[Dict[str, Any]]:
+    """Retrieve monthly aggregates, newest month first (see data.repository)."""
+    return _query("""
+        SELECT
+          strftime(last_message_ts, '%Y-%m') AS month,
+          COUNT(*) AS thread_count,
+          COUNT(*) FILTER (WHERE sentiment = 'Happy') AS happy_threads,
+          COUNT(*) FILTER (WHERE sentiment = 'Bit Irritated') AS bit_irritated_threads,
+          COUNT(*) FILTER (WHERE sentiment = 'Moderately Concerned') AS moderately_concerned_threads,
+          COUNT(*) FILTER (WHERE sentiment = 'Anger') AS anger_threads,
+          COUNT(*) FILTER (WHERE sentiment = 'Frustrated') AS frustrated_threads
+        FROM thread_state_final
+        WHERE last_message_ts IS NOT NULL
+        GROUP BY month
+        ORDER BY month DESC
+        LIMIT ?
+        """, [months])
+
+
+def get_aggregates(grain: str, periods: int, group_by: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Retrieve thread counts per day/week/month bucket (see data.repository)."""
+    if grain not in AGGREGATE_GRAINS:
+        raise ValueError(f"Unknown grain: {grain}. Must be one of {list(AGGREGATE_GRAINS)}")
+    group_by = list(dict.fromkeys(group_by or []))
+    unknown = [d for d in group_by if d not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {unknown}. Must be among {list(AGGREGATE_DIMENSIONS)}")
+
+    # Only whitelisted names are interpolated into the SQL
+    dimensions = "".join(f", {d}" for d in group_by)
+    start = period_start(grain, periods, datetime.utcnow().date())
+    return _query(f"""
+        SELECT
+          CAST(date_trunc('{grain}', last_message_ts) AS DATE) AS period_start{dimensions},
+          COUNT(*) AS thread_count
+        FROM thread_state_final
+        WHERE last_message_ts >= ?
+        GROUP BY period_start{dimensions}
+        ORDER BY period_start DESC{dimensions}
+        """, [datetime.combine(start, datetime.min.time())])
+
+
+async def get_threads_async(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    timeout_s: float = None,
+) -> List[Dict[str, Any]]:
+    """Run get_threads off the event loop."""
+    return await asyncio.wait_for(asyncio.to_thread(get_threads, limit, after, filters), timeout_s)
+
+
+async def get_monthly_aggregates_async(months: int, timeout_s: float = None) -> List[Dict[str, Any]]:
+    """Run get_monthly_aggregates off the event loop."""
+    return await asyncio.wait_for(asyncio.to_thread(get_monthly_aggregates, months), timeout_s)
+
+
+async def get_aggregates_async(
+    grain: str,
+    periods: int,
+    group_by: Optional[List[str]] = None,
+    timeout_s: float = None,
+) -> List[Dict[str, Any]]:
+    """Run get_aggregates off the event loop."""
+    return await asyncio.wait_for(asyncio.to_thread(get_aggregates, grain, periods, group_by), timeout_s)
@@ -0,0 +1,49 @@
+"""
+Repository backend registry.
+
+DATA_BACKEND selects the implementation of the data.repository interface
+that the API uses:
+- bigquery (default): data.bigquery_repo
+- local: data.local_repo, DuckDB over Parquet/NDJSON exports
+- fake: data.fake_repo, synthetic rows with injected latency (load tests)
+
+Backends are imported on first use, so selecting one never initializes
+another (e.g. the BigQuery client). register_backend() adds more.
+"""
+import importlib
+import os
+from types import ModuleType
+from typing import Dict, Optional
+
+DATA_BACKEND = os.getenv("DATA_BACKEND", "bigquery").lower()
+
+_BACKENDS: Dict[str, str] = {
+    "bigquery": "data.bigquery_repo",
+    "local": "data.local_repo",
+    "fake": "data.fake_repo",
+}
+
+# Functions the routes call on the selected backend
+REQUIRED_FUNCTIONS = ("get_threads_async", "get_monthly_aggregates_async", "get_aggregates_async")
+
+_loaded: Dict[str, ModuleType] = {}
+
+
+def register_backend(name: str, module_path: str) -> None:
+    """Make module_path selectable as DATA_BACKEND=name."""
+    _BACKENDS[name.lower()] = module_path
+    _loaded.pop(name.lower(), None)
+
+
+def get_repository(name: Optional[str] = None) -> ModuleType:
+    """Return the backend module for name (defaults to DATA_BACKEND)."""
+    name = (name or DATA_BACKEND).lower()
+    if name not in _loaded:
+        if name not in _BACKENDS:
+            raise ValueError(f"Unknown DATA_BACKEND: {name}. Must be one of {sorted(_BACKENDS)}")
+        module = importlib.import_module(_BACKENDS[name])
+        missing = [f for f in REQUIRED_FUNCTIONS if not hasattr(module, f)]
+        if missing:
+            raise ValueError(f"Backend {name} ({_BACKENDS[name]}) is missing {missing}")
+        _loaded[name] = module
+    return _loaded[name]
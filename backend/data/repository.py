@@ -3,16 +3,46 @@ Repository interface for thread data access.
 
 This module defines the contract that all data repositories must implement.
 No credentials or implementation details here - just the interface.
+
+Backends (see data.registry) implement these functions plus awaitable
+get_threads_async, get_monthly_aggregates_async and get_aggregates_async
+variants with the same arguments and an optional timeout_s.
 """
-from typing import List, Dict, Any
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+# Thread list filters that map directly onto a column (value lists, matched with IN)
+THREAD_FILTER_COLUMNS = ("thread_status", "sentiment", "next_action_owner")
+
+# Time grains and breakdown dimensions supported by get_aggregates
+AGGREGATE_GRAINS = ("day", "week", "month")
+AGGREGATE_DIMENSIONS = ("sentiment", "thread_status", "next_action_owner", "model_name")
+
 
+def period_start(grain: str, periods: int, today: date) -> date:
+    """First day of the oldest of the latest periods buckets ending with today's."""
+    if grain == "day":
+        return today - timedelta(days=periods - 1)
+    if grain == "week":
+        return today - timedelta(days=today.weekday()) - timedelta(weeks=periods - 1)
+    month_index = today.year * 12 + today.month - 1 - (periods - 1)
+    return date(month_index // 12, month_index % 12 + 1, 1)
 
-def get_threads(limit: int) -> List[Dict[str, Any]]:
+
+def get_threads(
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
     """
-    Retrieve a list of threads ordered by last message timestamp.
+    Retrieve a list of threads ordered by (last_message_ts, thread_id) DESC.
     
     Args:
         limit: Maximum number of threads to return
+        after: (last_message_ts, thread_id) of the previous page's last row;
+            only threads that sort after it are returned
+        filters: Optional value lists for thread_status, sentiment and
+            next_action_owner, and since/until bounds on last_message_ts
         
     Returns:
         List of thread dictionaries with fields:
@@ -39,9 +69,29 @@ def get_monthly_aggregates(months: int) -> List[Dict[str, Any]]:
         List of monthly aggregate dictionaries with fields:
         - month: str (YYYY-MM format)
         - thread_count: int
-        - pos_threads: int
-        - neutral_threads: int
-        - neg_threads: int
+        - happy_threads: int
+        - bit_irritated_threads: int
+        - moderately_concerned_threads: int
+        - anger_threads: int
+        - frustrated_threads: int
     """
     raise NotImplementedError("Subclasses must implement get_monthly_aggregates")
 
+
+def get_aggregates(grain: str, periods: int, group_by: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Retrieve thread counts per time bucket, optionally broken down by dimensions.
+    
+    Args:
+        grain: Bucket size: "day", "week" (starting Monday) or "month"
+        periods: Number of most recent buckets to return, including the current one
+        group_by: Any of "sentiment", "thread_status", "next_action_owner", "model_name"
+        
+    Returns:
+        List of dictionaries, newest bucket first, with fields:
+        - period_start: date (first day of the bucket)
+        - one field per group_by dimension: str
+        - thread_count: int
+    """
+    raise NotImplementedError("Subclasses must implement get_aggregates")
+
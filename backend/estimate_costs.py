@@ -0,0 +1,65 @@
+"""
+Dry-run the API's BigQuery hot paths and report the bytes each would scan.
+
+Each query is built exactly as the endpoints build it (same flags, e.g.
+BIGQUERY_USE_THREAD_STATE_FINAL, and typical parameters) and dry-run,
+which is free. The estimate is compared with the call site's
+maximum_bytes_billed cap (BIGQUERY_MAX_BYTES_BILLED[_<QUERY>]); the script
+exits with status 1 if any query would exceed its cap, so it can gate a
+deploy or a schema change.
+
+Usage:
+    python estimate_costs.py
+"""
+import sys
+from typing import Any, Dict, List
+
+from data import bigquery_repo
+from data.bigquery_repo import estimate_query, get_aggregates, get_monthly_aggregates, get_threads
+
+# On-demand price per TiB scanned, for a rough cost column
+PRICE_PER_TIB_USD = 6.25
+
+# (description, repository function, args) for each endpoint's typical requests
+HOT_PATHS = [
+    ("threads, first page", get_threads, (201,)),
+    ("threads, filtered", get_threads, (201, None, {"thread_status": ["open"], "sentiment": ["Anger", "Frustrated"]})),
+    ("monthly aggregates, 6 months", get_monthly_aggregates, (6,)),
+    ("aggregates, 30 days", get_aggregates, ("day", 30)),
+    ("aggregates, 12 months by sentiment", get_aggregates, ("month", 12, ["sentiment"])),
+]
+
+
+def _gib(value: int) -> str:
+    return f"{value / 1024 ** 3:.3f} GiB"
+
+
+def estimate_hot_paths() -> List[Dict[str, Any]]:
+    """Dry-run every hot path and return its estimate and cap."""
+    results = []
+    for description, fn, args in HOT_PATHS:
+        estimate = estimate_query(fn, *args)
+        cap = estimate["maximum_bytes_billed"]
+        results.append({
+            "path": description,
+            **estimate,
+            "estimated_cost_usd": round(estimate["estimated_bytes"] / 1024 ** 4 * PRICE_PER_TIB_USD, 4),
+            "over_cap": bool(cap) and estimate["estimated_bytes"] > cap,
+        })
+    return results
+
+
+def main() -> int:
+    print(f"Project: {bigquery_repo.PROJECT_ID}, Dataset: {bigquery_repo.DATASET_ID}")
+    print(f"thread_state_final: {bigquery_repo.USE_THREAD_STATE_FINAL}, "
+          f"monthly rollup: {bigquery_repo.USE_MONTHLY_ROLLUP}, views: {bigquery_repo.USE_VIEWS}\n")
+    results = estimate_hot_paths()
+    for r in results:
+        cap = _gib(r["maximum_bytes_billed"]) if r["maximum_bytes_billed"] else "uncapped"
+        flag = "  OVER CAP" if r["over_cap"] else ""
+        print(f"  {r['path']:<38} {_gib(r['estimated_bytes']):>14}  cap {cap:>14}  ~${r['estimated_cost_usd']:.4f}{flag}")
+    return 1 if any(r["over_cap"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+In-process load test for the API.
+
+Drives main.app directly over ASGI (no sockets, no HTTP client dependency)
+with a fixed number of concurrent clients, each sending requests back to
+back for a set duration. It reports per-endpoint p50/p95/p99 latency,
+overall throughput and event-loop lag (how late a 10 ms ticker wakes up),
+and can save the report as JSON and compare it against an earlier one.
+
+The data backend defaults to the latency-injecting fake repository
+(DATA_BACKEND=fake, see data/fake_repo.py); its latency is set with the
+FAKE_REPO_* environment variables.
+
+Usage:
+    python loadtest.py [--concurrency 50] [--duration 10] [--no-cache]
+                       [--path /api/threads?limit=200 ...]
+                       [--out results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+DEFAULT_PATHS = [
+    "/api/threads?limit=200",
+    "/api/threads/aggregates/monthly?months=6",
+]
+
+# Interval of the event-loop lag probe
+LAG_PROBE_INTERVAL_S = 0.01
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize_ms(values_s: List[float]) -> Dict[str, float]:
+    values = [v * 1000 for v in values_s]
+    return {
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+        "max_ms": round(max(values), 3) if values else 0.0,
+    }
+
+
+async def asgi_get(app, path: str) -> int:
+    """Send one GET through the ASGI app and return the response status."""
+    route, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": route,
+        "raw_path": route.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"loadtest")],
+        "client": ("127.0.0.1", 0),
+        "server": ("loadtest", 80),
+    }
+    status = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Only reached if the app waits for a disconnect
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _probe_loop_lag(stop: asyncio.Event, lags: List[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_INTERVAL_S)
+        lags.append(max(0.0, time.perf_counter() - started - LAG_PROBE_INTERVAL_S))
+
+
+async def run_load(app, paths: List[str], concurrency: int, duration_s: float) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {p: [] for p in paths}
+    errors: Dict[str, int] = {p: 0 for p in paths}
+    lags: List[float] = []
+    stop = asyncio.Event()
+    deadline = time.perf_counter() + duration_s
+
+    async def client(index: int) -> None:
+        i = index
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                status = await asgi_get(app, path)
+            except Exception:
+                status = 0
+            latencies[path].append(time.perf_counter() - started)
+            if status != 200:
+                errors[path] += 1
+
+    probe = asyncio.ensure_future(_probe_loop_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "requests": total,
+        "errors": sum(errors.values()),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize_ms([v for values in latencies.values() for v in values]),
+        "endpoints": {
+            path: {"requests": len(latencies[path]), "errors": errors[path], **summarize_ms(latencies[path])}
+            for path in paths
+        },
+        "event_loop_lag": summarize_ms(lags),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the change of the headline numbers against a baseline report."""
+    def _pct(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    rows = [("throughput_rps", current["throughput_rps"], baseline["throughput_rps"])]
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        rows.append((f"latency {key}", current["latency"][key], baseline["latency"][key]))
+    rows.append(("loop lag p99_ms", current["event_loop_lag"]["p99_ms"], baseline["event_loop_lag"]["p99_ms"]))
+    print("\nChange vs baseline:")
+    for name, new, old in rows:
+        print(f"  {name:<18} {old:>10} -> {new:>10}  ({_pct(new, old)})")
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="In-process API load test")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent clients (default: 50)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run (default: 10)")
+    parser.add_argument("--path", action="append", dest="paths", help="request path, repeatable")
+    parser.add_argument("--backend", default=os.getenv("DATA_BACKEND", "fake"), help="DATA_BACKEND (default: fake)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache (loads still coalesce)")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    # Must be set before the app (and data.registry) is imported
+    os.environ["DATA_BACKEND"] = args.backend
+    from api.cache import response_cache
+    from main import app
+
+    if args.no_cache:
+        response_cache.ttl_s = 0
+        response_cache.stale_s = 0
+
+    paths = args.paths or DEFAULT_PATHS
+    print(f"Load testing {paths} with {args.concurrency} clients for {args.duration}s (backend={args.backend})...")
+    result = asyncio.run(run_load(app, paths, args.concurrency, args.duration))
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "backend": args.backend,
+            "response_cache": not args.no_cache,
+            "paths": paths,
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("FAKE_REPO_", "API_CACHE_", "BIGQUERY_MAX", "BIGQUERY_QUERY"))},
+        },
+        **result,
+        "response_cache_stats": response_cache.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,17 @@ FastAPI application entry point.
 Enterprise-compliant setup:
 - No credentials in code
 - Uses Application Default Credentials for BigQuery
-- Always uses BigQuery (no mock mode)
+- Uses BigQuery unless DATA_BACKEND selects another backend (see data.registry)
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
+from api.cache import response_cache
 from api.routes import router
+from data.registry import DATA_BACKEND
+from metrics import RequestMetricsMiddleware
+from workers.metrics_registry import CONTENT_TYPE, render_metrics
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -30,8 +34,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser read the thread list's pagination cursor
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Per-route latency histograms, served at /metrics
+app.add_middleware(RequestMetricsMiddleware)
+
 # Include API routes
 app.include_router(router, prefix="/api", tags=["threads"])
 
@@ -41,7 +50,7 @@ async def root():
     """Health check endpoint."""
     return {
         "status": "healthy",
-        "data_source": "bigquery",
+        "data_source": DATA_BACKEND,
         "message": "Thread Analytics API"
     }
 
@@ -51,10 +60,19 @@ async def health():
     """Detailed health check."""
     return {
         "status": "healthy",
-        "data_source": "bigquery",
+        "data_source": DATA_BACKEND,
         "endpoints": {
             "threads": "/api/threads",
-            "monthly_aggregates": "/api/threads/aggregates/monthly"
-        }
+            "monthly_aggregates": "/api/threads/aggregates/monthly",
+            "aggregates": "/api/threads/aggregates",
+            "metrics": "/metrics"
+        },
+        "response_cache": response_cache.stats()
     }
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this instance."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
@@ -0,0 +1,75 @@
+"""
+Prometheus-style metrics for the API process.
+
+A small dependency-free registry of counters, gauges and histograms,
+rendered in the Prometheus text exposition format at /metrics (see main.py):
+- api_request_duration_seconds: per method, route template and status
+- api_response_cache_requests_total: response cache lookups per endpoint
+  and result (see api.cache)
+- bigquery_query_duration_seconds, bigquery_queries_total,
+  bigquery_bytes_processed_total, bigquery_bytes_billed_total,
+  bigquery_slot_ms_total, bigquery_cache_hits_total: per repository query,
+  plus bigquery_estimated_bytes from dry runs (see data.bigquery_repo)
+
+Values are per process; Prometheus sums them across instances. The
+primitives live in workers/metrics_registry.py, which the workers share.
+"""
+import time
+
+from workers.metrics_registry import Counter, Gauge, Histogram
+
+
+API_REQUEST_DURATION = Histogram(
+    "api_request_duration_seconds", "API request latency.", ["method", "route", "status"]
+)
+RESPONSE_CACHE_REQUESTS = Counter(
+    "api_response_cache_requests_total",
+    "Response cache lookups by result (hit, stale, miss, coalesced).",
+    ["endpoint", "result"],
+)
+BIGQUERY_QUERY_DURATION = Histogram(
+    "bigquery_query_duration_seconds", "BigQuery job duration, including fetching the rows.", ["query"]
+)
+BIGQUERY_QUERIES = Counter(
+    "bigquery_queries_total", "BigQuery jobs by outcome (ok, error, bytes_limit).", ["query", "status"]
+)
+BIGQUERY_BYTES_PROCESSED = Counter("bigquery_bytes_processed_total", "Bytes processed by BigQuery jobs.", ["query"])
+BIGQUERY_BYTES_BILLED = Counter("bigquery_bytes_billed_total", "Bytes billed for BigQuery jobs.", ["query"])
+BIGQUERY_SLOT_MS = Counter("bigquery_slot_ms_total", "Slot milliseconds used by BigQuery jobs.", ["query"])
+BIGQUERY_ESTIMATED_BYTES = Gauge(
+    "bigquery_estimated_bytes", "Bytes the query would process, from the latest dry run.", ["query"]
+)
+BIGQUERY_CACHE_HITS = Counter("bigquery_cache_hits_total", "BigQuery jobs answered from the query cache.", ["query"])
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording api_request_duration_seconds.
+
+    Requests are labelled with the matched route template (e.g.
+    /api/threads), not the raw path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            API_REQUEST_DURATION.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=status
+            )
@@ -0,0 +1,26 @@
+-- Create table: daily_thread_rollup
+-- Purpose: Thread counts per day and dimension combination for /api/threads/aggregates
+-- Source: thread_state_final
+-- Project: clariversev1
+-- Dataset: flipkart_slices
+--
+-- One row per (day, thread_status, sentiment, next_action_owner, model_name).
+-- Recomputed by workers/rollups.py for the days touched by a
+-- thread_state_final refresh plus every day of the most recent months.
+-- Week and month buckets are summed from it at query time.
+-- The workers create this table automatically if it is missing.
+
+CREATE TABLE IF NOT EXISTS `clariversev1.flipkart_slices.daily_thread_rollup` (
+  day DATE NOT NULL,
+  thread_status STRING,
+  sentiment STRING,
+  next_action_owner STRING,
+  model_name STRING,
+  thread_count INT64 NOT NULL,
+  refreshed_at TIMESTAMP NOT NULL
+)
+PARTITION BY day
+CLUSTER BY thread_status, sentiment, next_action_owner, model_name
+OPTIONS(
+  description = 'Daily thread counts by status/sentiment/owner/model, refreshed incrementally from thread_state_final'
+);
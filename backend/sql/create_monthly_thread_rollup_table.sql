@@ -0,0 +1,24 @@
+-- Create table: monthly_thread_rollup
+-- Purpose: Pre-aggregated monthly thread counts per sentiment (1-5 scale)
+-- Source: thread_state_final
+-- Project: clariversev1
+-- Dataset: flipkart_slices
+--
+-- One row per month, recomputed by workers/rollups.py only for the months
+-- touched by a thread_state_final refresh plus the most recent months.
+-- The workers create this table automatically if it is missing.
+
+CREATE TABLE IF NOT EXISTS `clariversev1.flipkart_slices.monthly_thread_rollup` (
+  month_start DATE NOT NULL,
+  month STRING NOT NULL,
+  thread_count INT64 NOT NULL,
+  happy_threads INT64 NOT NULL,
+  bit_irritated_threads INT64 NOT NULL,
+  moderately_concerned_threads INT64 NOT NULL,
+  anger_threads INT64 NOT NULL,
+  frustrated_threads INT64 NOT NULL,
+  refreshed_at TIMESTAMP NOT NULL
+)
+OPTIONS(
+  description = 'Monthly thread counts by sentiment, refreshed incrementally from thread_state_final'
+);
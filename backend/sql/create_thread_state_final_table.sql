@@ -0,0 +1,33 @@
+-- Create table: thread_state_final
+-- Purpose: Materialized latest state per thread (replaces reading v_thread_state_final)
+-- Source: thread_state (heuristic) + thread_state_explain (LLM) + message_sentiment
+-- Project: clariversev1
+-- Dataset: flipkart_slices
+--
+-- One row per thread, maintained with MERGE by workers/thread_state_final.py
+-- and refreshed for the touched threads after every sentiment/explain worker
+-- run. The workers create this table automatically if it is missing; run
+-- `python thread_state_final.py --full` once to backfill it.
+
+CREATE TABLE IF NOT EXISTS `clariversev1.flipkart_slices.thread_state_final` (
+  thread_id STRING NOT NULL,
+  last_message_ts TIMESTAMP,
+  message_count INT64,
+  thread_status STRING,
+  next_action_owner STRING,
+  status_reason STRING,
+  status_confidence FLOAT64,
+  status_source STRING,
+  sentiment STRING,
+  confidence FLOAT64,
+  prompt_version STRING,
+  model_name STRING,
+  explained_at TIMESTAMP,
+  sentiment_scored_at TIMESTAMP,
+  updated_at TIMESTAMP NOT NULL
+)
+PARTITION BY DATE(last_message_ts)
+CLUSTER BY thread_status, sentiment, next_action_owner, thread_id
+OPTIONS(
+  description = 'Latest LLM/heuristic state per thread, maintained incrementally with MERGE'
+);
@@ -97,6 +97,5 @@ FROM thread_base tb
 LEFT JOIN latest_explain le
   USING (thread_id)
 LEFT JOIN sentiment_labeled sl
-  USING (thread_id)
-ORDER BY tb.last_message_ts DESC;
+  USING (thread_id);
 
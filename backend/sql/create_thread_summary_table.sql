@@ -0,0 +1,24 @@
+-- Create table: thread_summary
+-- Purpose: Rolling per-thread summaries used as context by the explain worker
+-- Project: clariversev1
+-- Dataset: flipkart_slices
+--
+-- Append-only: a new row is written whenever older messages are folded into
+-- a thread's summary. The latest summarized_through_ts per thread and
+-- prompt_version is current. The explain worker creates this table
+-- automatically (unpartitioned) if it is missing.
+
+CREATE TABLE IF NOT EXISTS `clariversev1.flipkart_slices.thread_summary` (
+  thread_id STRING NOT NULL,
+  summary STRING,
+  summarized_through_ts TIMESTAMP,
+  summarized_messages INT64,
+  prompt_version STRING NOT NULL,
+  model_name STRING NOT NULL,
+  updated_at TIMESTAMP NOT NULL
+)
+PARTITION BY DATE(updated_at)
+CLUSTER BY thread_id
+OPTIONS(
+  description = 'Rolling thread summaries for thread state explanations, clustered by thread_id'
+);
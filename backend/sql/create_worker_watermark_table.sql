@@ -0,0 +1,18 @@
+-- Create table: worker_watermark
+-- Purpose: High-water marks for incremental work discovery by the LLM workers
+-- Project: clariversev1
+-- Dataset: flipkart_slices
+--
+-- One row per worker. watermark_ts is the event_ts up to which work has been
+-- discovered; last_full_reconcile_ts is when the last full scan completed.
+-- The workers create this table automatically if it is missing.
+
+CREATE TABLE IF NOT EXISTS `clariversev1.flipkart_slices.worker_watermark` (
+  worker STRING NOT NULL,
+  watermark_ts TIMESTAMP,
+  last_full_reconcile_ts TIMESTAMP,
+  updated_at TIMESTAMP NOT NULL
+)
+OPTIONS(
+  description = 'Incremental discovery watermarks for the sentiment/explain workers'
+);
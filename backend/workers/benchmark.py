@@ -0,0 +1,356 @@
+"""
+Offline throughput benchmark for the LLM workers.
+
+Runs the sentiment and explain workers end to end (discovery, scoring,
+writes, thread_state_final refresh) against FakeGenerativeModel and
+FakeBigQueryClient, so no Vertex or BigQuery access is needed. The fake
+model's latency, tail latency, error rate and share of malformed answers
+are configurable. For each worker it reports:
+
+- items/sec and wall-clock time
+- model calls per item, failed calls, retries and the time slept in backoff
+- for explain, thread summaries written (each one took an extra model call)
+- items answered by the local rules instead of the model (every
+  EASY_EVERY-th synthetic message is an easy one)
+- calls to and time spent in extract_json_from_response (and the array
+  variant used by batched prompts)
+- peak Python memory, as tracked by tracemalloc
+
+Reports can be saved as JSON and compared against an earlier one; with
+--max-regression the run exits non-zero when throughput or peak memory
+regressed by more than that percentage. --sweep instead runs
+score_messages at several concurrency levels, in single and batched mode.
+
+Backoff sleeps use the real retry_delay; set LLM_BACKOFF_BASE_S to shorten
+them when benchmarking high error rates.
+
+Usage:
+    python benchmark.py [messages] [latency_s] [--threads 50] [--worker sentiment|explain|all]
+                        [--error-rate 0.02] [--quota-error-rate 0.01] [--malformed-rate 0.02]
+                        [--slow-rate 0.01] [--slow-latency 2.0] [--fenced-rate 0.5]
+                        [--concurrency 16] [--batched]
+                        [--out results.json] [--baseline previous.json] [--max-regression 10]
+    python benchmark.py [messages] [latency_s] --sweep
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import explain_worker
+import sentiment
+from fakes import FakeBigQueryClient, FakeGenerativeModel
+from local_rules import LOCAL_MODEL_NAME
+from rate_limit import RateLimiter, set_rate_limiter
+from sentiment import score_messages
+from thread_context import SUMMARY_TABLE
+
+# Module functions timed during a worker run: (module, function name)
+PARSE_FUNCTIONS = [
+    (sentiment, "extract_json_from_response"),
+    (sentiment, "extract_json_array_from_response"),
+    (explain_worker, "extract_json_from_response"),
+]
+
+
+class _Probe:
+    """
+    Temporarily wrap a module-level function to count its calls and the
+    time spent in it. With sum_result, the returned values are summed too
+    (used to total the delays retry_delay hands out).
+    """
+
+    def __init__(self, module, name: str, sum_result: bool = False):
+        self.module = module
+        self.name = name
+        self.sum_result = sum_result
+        self.calls = 0
+        self.seconds = 0.0
+        self.result_total = 0.0
+        self._original = getattr(module, name)
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "_Probe":
+        original = self._original
+
+        def probed(*args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            try:
+                result = original(*args, **kwargs)
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.calls += 1
+                    self.seconds += elapsed
+                    if self.sum_result and result is not None:
+                        self.result_total += result
+
+        setattr(self.module, self.name, probed)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        setattr(self.module, self.name, self._original)
+
+
+def _synthetic_body(i: int) -> str:
+    """Distinct email bodies of varying length (roughly 60 to 900 characters)."""
+    sentence = "I am still waiting for an update on my refund request. "
+    return f"Order #{100000 + i}: " + sentence * (1 + i % 16)
+
+
+# Messages the local rules answer without a model call (see local_rules)
+EASY_BODIES = [
+    "Thanks, that resolved it!",
+    "Automatic reply: I am out of the office until Monday.",
+    "",
+]
+# Every EASY_EVERY-th synthetic message is one of EASY_BODIES
+EASY_EVERY = 5
+
+
+def sentiment_discovery_rows(count: int) -> List[Dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "thread_id": f"t-{i}",
+            "message_id": f"m-{i}",
+            "body_text": EASY_BODIES[i // EASY_EVERY % len(EASY_BODIES)] if i % EASY_EVERY == 0 else _synthetic_body(i),
+            "event_ts": now - timedelta(seconds=count - i),
+        }
+        for i in range(count)
+    ]
+
+
+def explain_discovery_rows(count: int) -> List[Dict[str, Any]]:
+    """
+    Threads of 1 to 24 messages; every fifth has a summary covering all but
+    its last three messages, the rest have none yet. Every EASY_EVERY-th
+    thread ends with an easy last message.
+    """
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(count):
+        length = 1 + (i * 7) % 24
+        messages = [
+            {"message_body": _synthetic_body(i + k), "event_ts": now - timedelta(seconds=i + k * 60)}
+            for k in range(length)
+        ]
+        if i % EASY_EVERY == 1:
+            messages[0]["message_body"] = EASY_BODIES[0]
+        summarized = i % 5 == 0 and length > 3
+        rows.append({
+            "thread_id": f"t-{i}",
+            "thread_status": "open" if i % 3 else "closed",
+            "last_message_ts": messages[0]["event_ts"],
+            "last_message_body": messages[0]["message_body"],
+            "previous_message_body": messages[1]["message_body"] if length > 1 else None,
+            "messages": messages,
+            "summary": "Customer is waiting for a refund; support asked for the order number." if summarized else None,
+            "summarized_through_ts": messages[3]["event_ts"] if summarized else None,
+            "summarized_messages": length - 3 if summarized else None,
+        })
+    return rows
+
+
+def benchmark_worker(
+    worker: str,
+    count: int,
+    model: FakeGenerativeModel,
+    concurrency: int = 16,
+    batched: bool = False,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    """Run one worker's run_batch over count synthetic items and return its metrics."""
+    bq = FakeBigQueryClient()
+    if worker == "sentiment":
+        # CTE names that only occur in each worker's discovery query
+        bq.add_query_result("latest_msg AS", sentiment_discovery_rows(count))
+        run = lambda: sentiment.run_batch(bq, model, count, concurrency, batched, cache=None)
+    else:
+        bq.add_query_result("threads_with_messages AS", explain_discovery_rows(count))
+        run = lambda: explain_worker.run_batch(bq, count, cache=None)
+
+    parse_probes = [_Probe(module, name) for module, name in PARSE_FUNCTIONS]
+    retry_probes = [_Probe(module, "retry_delay", sum_result=True) for module in (sentiment, explain_worker)]
+    previous_model = explain_worker._model
+    explain_worker._model = model
+    output = None if verbose else io.StringIO()
+
+    with contextlib.ExitStack() as stack:
+        for probe in parse_probes + retry_probes:
+            stack.enter_context(probe)
+        if output is not None:
+            stack.enter_context(contextlib.redirect_stdout(output))
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            processed = run()
+        finally:
+            elapsed = time.perf_counter() - started
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            explain_worker._model = previous_model
+
+    written = sum(len(rows) for table, rows in bq.tables.items() if not table.endswith(f".{SUMMARY_TABLE}"))
+    summaries = sum(len(rows) for table, rows in bq.tables.items() if table.endswith(f".{SUMMARY_TABLE}"))
+    parse = {}
+    for probe in parse_probes:
+        if probe.calls:
+            key = f"{probe.module.__name__}.{probe.name}"
+            parse[key] = {
+                "calls": probe.calls,
+                "total_ms": round(probe.seconds * 1000, 3),
+                "mean_us": round(probe.seconds / probe.calls * 1e6, 1),
+            }
+    return {
+        "worker": worker,
+        "items": processed,
+        "written": written,
+        "summaries_written": summaries,
+        "local_results": sum(
+            1 for rows in bq.tables.values() for r in rows if r.get("model_name") == LOCAL_MODEL_NAME
+        ),
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(written / elapsed, 2) if elapsed else 0.0,
+        "model_calls": model.calls,
+        "model_errors": model.errors,
+        "model_malformed": model.malformed,
+        "calls_per_item": round(model.calls / processed, 3) if processed else 0.0,
+        "retries": sum(p.calls for p in retry_probes),
+        "retry_sleep_s": round(sum(p.result_total for p in retry_probes), 3),
+        "parse": parse,
+        "peak_mem_mb": round(peak_bytes / (1024 * 1024), 2),
+        "bq_queries": bq.queries,
+        "bq_insert_calls": bq.insert_calls,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression_pct: Optional[float] = None) -> List[str]:
+    """
+    Print each worker's change against a baseline report and return the
+    regressions beyond max_regression_pct (throughput down or peak memory up).
+    """
+    def _pct(new: float, old: float) -> float:
+        return (new - old) / old * 100 if old else 0.0
+
+    regressions = []
+    print("\nChange vs baseline:")
+    for worker, result in current["results"].items():
+        old = baseline.get("results", {}).get(worker)
+        if old is None:
+            continue
+        throughput = _pct(result["items_per_s"], old["items_per_s"])
+        memory = _pct(result["peak_mem_mb"], old["peak_mem_mb"])
+        print(
+            f"  {worker:<10} items/s {old['items_per_s']:>9} -> {result['items_per_s']:>9} ({throughput:+.1f}%)  "
+            f"peak MB {old['peak_mem_mb']:>7} -> {result['peak_mem_mb']:>7} ({memory:+.1f}%)"
+        )
+        if max_regression_pct is not None:
+            if throughput < -max_regression_pct:
+                regressions.append(f"{worker}: throughput {throughput:+.1f}%")
+            if memory > max_regression_pct:
+                regressions.append(f"{worker}: peak memory {memory:+.1f}%")
+    return regressions
+
+
+def benchmark_scoring(messages: int = 300, latency_s: float = 0.2, concurrency_levels=(1, 4, 16, 32)) -> None:
+    items = [
+        {"thread_id": f"t-{i}", "message_id": f"m-{i}", "body_text": f"Synthetic message body {i}"}
+        for i in range(messages)
+    ]
+    # Measure the pool itself, not the configured Vertex quota
+    set_rate_limiter(RateLimiter(qps=1e6, tokens_per_minute=0))
+    for batched in (False, True):
+        for concurrency in concurrency_levels:
+            model = FakeGenerativeModel(latency_s=latency_s, jitter_s=latency_s / 4, seed=0)
+            started = time.perf_counter()
+            results = score_messages(model, items, concurrency, batched)
+            elapsed = time.perf_counter() - started
+            scored = sum(1 for r in results if r is not None)
+            print(
+                f"batched={str(batched):<5}  concurrency={concurrency:>3}  scored={scored}/{messages}  "
+                f"calls={model.calls:>4}  elapsed={elapsed:.2f}s  throughput={scored / elapsed:.1f} msg/s"
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline LLM worker benchmark")
+    parser.add_argument("messages", nargs="?", type=int, default=300, help="messages for the sentiment worker (default: 300)")
+    parser.add_argument("latency_s", nargs="?", type=float, default=0.2, help="mean model latency (default: 0.2)")
+    parser.add_argument("--threads", type=int, default=50, help="threads for the explain worker (default: 50)")
+    parser.add_argument("--worker", choices=["sentiment", "explain", "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=sentiment.SCORING_CONCURRENCY)
+    parser.add_argument("--batched", action="store_true", help="batched sentiment prompts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls failing with 503")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="share of calls failing with 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of non-JSON answers")
+    parser.add_argument("--fenced-rate", type=float, default=0.0, help="share of answers in a ```json block")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of calls taking --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the workers' own output")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, help="fail if throughput/memory regress by more than this %%")
+    parser.add_argument("--sweep", action="store_true", help="run the score_messages concurrency sweep instead")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        benchmark_scoring(args.messages, args.latency_s)
+        return 0
+
+    # Measure the workers, not the configured Vertex quota
+    set_rate_limiter(RateLimiter(qps=1e6, tokens_per_minute=0))
+    model_config = {
+        "latency_s": args.latency_s,
+        "jitter_s": args.latency_s / 4,
+        "seed": args.seed,
+        "slow_rate": args.slow_rate,
+        "slow_latency_s": args.slow_latency,
+        "error_rate": args.error_rate,
+        "quota_error_rate": args.quota_error_rate,
+        "malformed_rate": args.malformed_rate,
+        "fenced_rate": args.fenced_rate,
+    }
+    workers = ["sentiment", "explain"] if args.worker == "all" else [args.worker]
+    results = {}
+    for worker in workers:
+        count = args.messages if worker == "sentiment" else args.threads
+        print(f"Benchmarking {worker} worker with {count} items...")
+        results[worker] = benchmark_worker(
+            worker, count, FakeGenerativeModel(**model_config), args.concurrency, args.batched, args.verbose
+        )
+        print(json.dumps(results[worker], indent=2))
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "batched": args.batched,
+            "model": model_config,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print(f"REGRESSION beyond {args.max_regression}%: {'; '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
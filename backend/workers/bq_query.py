@@ -0,0 +1,183 @@
+"""
+Guarded BigQuery query path for the workers (bq_writer is the write path).
+
+Every query job the workers start goes through run_query(), which:
+- caps the job with maximum_bytes_billed: BQ_MAX_BYTES_BILLED, or
+  BQ_MAX_BYTES_BILLED_<SITE> for one call site (0 = uncapped). BigQuery
+  rejects a query that would bill more before running it, at no charge.
+- labels the job with its call site, so cost can be broken down in the
+  billing export and INFORMATION_SCHEMA.JOBS
+- records duration, bytes processed/billed and slot-ms per call site in the
+  bigquery_* metrics (see worker_metrics)
+
+With BQ_DRY_RUN_CHECK=true every query is dry-run first; the estimate is
+logged and the query is refused when it exceeds the cap. Running this
+module dry-runs the workers' discovery queries and prints their estimates:
+
+    python bq_query.py
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from worker_metrics import (
+    BIGQUERY_BYTES_BILLED,
+    BIGQUERY_BYTES_PROCESSED,
+    BIGQUERY_ESTIMATED_BYTES,
+    BIGQUERY_QUERIES,
+    BIGQUERY_QUERY_DURATION,
+    BIGQUERY_SLOT_MS,
+)
+
+MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES_BILLED", str(100 * 1024 ** 3)))
+DRY_RUN_CHECK = os.getenv("BQ_DRY_RUN_CHECK", "false").lower() == "true"
+JOB_LABELS = {"app": "thread-analytics-workers"}
+
+# Set by estimate_only(): run_query collects dry-run estimates here instead of running
+_estimates: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("bq_estimates", default=None)
+
+
+class QueryTooExpensive(RuntimeError):
+    """A dry run estimated more bytes than the call site's cap."""
+
+    def __init__(self, site: str, estimated_bytes: int, cap: int):
+        super().__init__(
+            f"Query {site} would process {estimated_bytes / 1024 ** 3:.2f} GiB, "
+            f"over its cap of {cap / 1024 ** 3:.2f} GiB"
+        )
+        self.site = site
+        self.estimated_bytes = estimated_bytes
+        self.cap = cap
+
+
+class _EstimatedJob:
+    """Stands in for a job that was only dry-run; it has no rows."""
+
+    num_dml_affected_rows = 0
+
+    def result(self, *args, **kwargs) -> list:
+        return []
+
+
+def max_bytes_billed(site: str) -> int:
+    """Billed-bytes cap for a call site (0 = uncapped)."""
+    return int(os.getenv(f"BQ_MAX_BYTES_BILLED_{site.upper()}", str(MAX_BYTES_BILLED)))
+
+
+def dry_run_bytes(bq: bigquery.Client, query: str, job_config: Optional[bigquery.QueryJobConfig] = None) -> int:
+    """Bytes the query would process, from a (free) dry run."""
+    config = bigquery.QueryJobConfig(
+        dry_run=True,
+        use_query_cache=False,
+        query_parameters=getattr(job_config, "query_parameters", None) or [],
+    )
+    return bq.query(query, job_config=config).total_bytes_processed or 0
+
+
+@contextmanager
+def estimate_only() -> Iterator[List[Dict[str, Any]]]:
+    """
+    Within the block run_query only dry-runs: it returns no rows and appends
+    {"site", "estimated_bytes", "maximum_bytes_billed"} to the yielded list.
+    """
+    estimates: List[Dict[str, Any]] = []
+    token = _estimates.set(estimates)
+    try:
+        yield estimates
+    finally:
+        _estimates.reset(token)
+
+
+def run_query(
+    bq: bigquery.Client,
+    query: str,
+    job_config: Optional[bigquery.QueryJobConfig] = None,
+    site: str = "query",
+    page_size: Optional[int] = None,
+) -> Tuple[Any, Any]:
+    """
+    Run a capped, labelled query job and wait for it.
+
+    Returns (job, rows), rows being the job's result iterator fetched
+    page_size rows at a time.
+    """
+    job_config = job_config or bigquery.QueryJobConfig()
+    cap = max_bytes_billed(site)
+    estimates = _estimates.get()
+    if estimates is not None or DRY_RUN_CHECK:
+        estimated = dry_run_bytes(bq, query, job_config)
+        BIGQUERY_ESTIMATED_BYTES.set(estimated, query=site)
+        if estimates is not None:
+            estimates.append({"site": site, "estimated_bytes": estimated, "maximum_bytes_billed": cap})
+            return _EstimatedJob(), []
+        print(f"Query {site}: dry run estimates {estimated / 1024 ** 3:.3f} GiB.")
+        if cap and estimated > cap:
+            BIGQUERY_QUERIES.inc(query=site, status="bytes_limit")
+            raise QueryTooExpensive(site, estimated, cap)
+
+    if cap > 0:
+        job_config.maximum_bytes_billed = cap
+    job_config.labels = {**JOB_LABELS, "call_site": site}
+    started = time.monotonic()
+    try:
+        job = bq.query(query, job_config=job_config)
+        rows = job.result(page_size=page_size) if page_size else job.result()
+    except Exception as e:
+        status = "bytes_limit" if "bytesBilledLimitExceeded" in str(e) else "error"
+        BIGQUERY_QUERIES.inc(query=site, status=status)
+        raise
+    finally:
+        BIGQUERY_QUERY_DURATION.observe(time.monotonic() - started, query=site)
+    BIGQUERY_QUERIES.inc(query=site, status="ok")
+    BIGQUERY_BYTES_PROCESSED.inc(job.total_bytes_processed or 0, query=site)
+    BIGQUERY_BYTES_BILLED.inc(job.total_bytes_billed or 0, query=site)
+    BIGQUERY_SLOT_MS.inc(job.slot_millis or 0, query=site)
+    return job, rows
+
+
+def main() -> int:
+    """Dry-run the workers' discovery queries; exit 1 if any exceeds its cap."""
+    # Imported here: the workers import this module
+    import combined_worker
+    import explain_worker
+    import sentiment
+
+    bq = bigquery.Client(project=sentiment.PROJECT_ID)
+    since = datetime.now(timezone.utc) - timedelta(hours=1)
+    with estimate_only() as estimates:
+        list(sentiment.fetch_latest_messages_to_score(bq, sentiment.BATCH_LIMIT))
+        list(sentiment.fetch_latest_messages_to_score(bq, sentiment.BATCH_LIMIT, since=since))
+        list(explain_worker.fetch_threads_to_explain(bq, explain_worker.BATCH_LIMIT))
+        list(explain_worker.fetch_threads_to_explain(bq, explain_worker.BATCH_LIMIT, lookback_days=0))
+        list(combined_worker.fetch_threads_to_process(bq, combined_worker.BATCH_LIMIT, since=since))
+        list(combined_worker.fetch_threads_to_process(bq, combined_worker.BATCH_LIMIT))
+
+    labels = [
+        "sentiment discovery, full scan",
+        "sentiment discovery, incremental (1h)",
+        f"explain discovery, {explain_worker.DISCOVERY_LOOKBACK_DAYS} day window",
+        "explain discovery, full scan",
+        "combined discovery, incremental (1h)",
+        "combined discovery, full sentiment scan",
+    ]
+    over = False
+    for label, estimate in zip(labels, estimates):
+        cap = estimate["maximum_bytes_billed"]
+        exceeded = bool(cap) and estimate["estimated_bytes"] > cap
+        over = over or exceeded
+        cap_text = f"{cap / 1024 ** 3:.3f} GiB" if cap else "uncapped"
+        print(
+            f"  {label:<40} {estimate['estimated_bytes'] / 1024 ** 3:>10.3f} GiB  cap {cap_text:>14}"
+            f"{'  OVER CAP' if exceeded else ''}"
+        )
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
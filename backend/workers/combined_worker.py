@@ -0,0 +1,436 @@
+"""
+Combined sentiment + explain runner.
+
+Running sentiment.py and explain_worker.py separately scans interaction_event
+twice, once per worker, for the same threads, and waits for each worker's
+model calls in turn. This runner replaces both. It does one discovery query
+that reads each thread's last CONTEXT_MAX_MESSAGES messages once and says
+which stages the thread needs:
+
+- needs_sentiment: its latest message is newer than the sentiment watermark
+  and has no message_sentiment row for sentiment.PROMPT_VERSION
+- needs_explain: it is in thread_state, its last message is in the explain
+  worker's window (EXPLAIN_DISCOVERY_LOOKBACK_DAYS) and it has no
+  thread_state_explain row for explain_worker.PROMPT_VERSION newer than it
+
+Each chunk is fanned out to both stages at once on a thread pool: sentiment
+scoring (sentiment.score_chunk, SENTIMENT_CONCURRENCY requests in flight)
+and explanation (explain_worker.explain_threads over COMBINED_EXPLAIN_CONCURRENCY
+slices). Both stages call Gemini, so they share the process-wide rate
+limiter. When both are done, the chunk's message_sentiment,
+thread_state_explain and thread_summary rows are written with one write per
+table, and thread_state_final is refreshed once at the end of the run.
+
+Rows are the same as the separate workers write (same prompt versions,
+insertIds and local-rule shortcuts). The sentiment stage reads and advances
+sentiment.py's watermark (same worker_watermark row, per shard), including
+its periodic full reconcile, so either runner can pick up where the other
+stopped. Like sentiment.py, it scores each thread's latest message only.
+
+    python combined_worker.py [batch_limit] [--daemon] [--full] [--shard i/N]
+
+Configuration (environment):
+- COMBINED_BATCH_LIMIT: Threads per run (the initial batch size in daemon mode)
+- COMBINED_FLUSH_SIZE: Threads per chunk, i.e. per bulk write
+- COMBINED_EXPLAIN_CONCURRENCY: Threads explained at once
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from google.cloud import bigquery
+
+import vertexai
+from vertexai.generative_models import GenerativeModel
+
+import explain_worker
+import sentiment
+from journal import WorkJournal, journaled, open_journal
+from llm_cache import LLMCache, open_cache
+from worker_metrics import record_run, report
+from pipeline import chunked, iter_query_rows, run_daemon, should_stop
+from sharding import Shard, resolve_shard, shard_condition, shard_params
+from thread_context import CONTEXT_MAX_MESSAGES, SUMMARY_PROMPT_VERSION, SUMMARY_TABLE, ensure_summary_table, summary_writer
+from thread_state_final import REFRESH_AFTER_WRITE, ensure_materialized_tables, refresh_after_write
+from watermark import ensure_watermark_table, max_ts, min_ts
+
+PROJECT_ID = sentiment.PROJECT_ID
+DATASET = sentiment.DATASET
+REGION = sentiment.REGION
+WORKER_NAME = "combined"
+
+BATCH_LIMIT = int(os.getenv("COMBINED_BATCH_LIMIT", "300"))
+FLUSH_SIZE = int(os.getenv("COMBINED_FLUSH_SIZE", "100"))
+EXPLAIN_CONCURRENCY = int(os.getenv("COMBINED_EXPLAIN_CONCURRENCY", "4"))
+
+
+def fetch_threads_to_process(
+    bq: bigquery.Client,
+    limit: int = BATCH_LIMIT,
+    lookback_days: int = explain_worker.DISCOVERY_LOOKBACK_DAYS,
+    since: Optional[datetime] = None,
+    shard: Optional[Shard] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield threads that need a sentiment score or an explanation, paging
+    through the results.
+
+    Rows have the columns of explain_worker.fetch_threads_to_explain plus
+    last_message_id and the needs_sentiment / needs_explain flags.
+    interaction_event is read once for both stages. The sentiment stage
+    covers threads whose latest event is newer than since, or all threads
+    with since=None (a full scan, as in
+    sentiment.fetch_latest_messages_to_score). The explain stage covers
+    threads in thread_state with messages in the last lookback_days
+    (lookback_days=0 scans all history). interaction_event is read from the
+    older of the two bounds. With a shard only the shard's threads are
+    considered (see sharding). Oldest threads come first, so a run that
+    stops before the end can still advance the sentiment watermark past
+    what it handled.
+    """
+    window_start = "TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @lookback_days DAY)"
+    event_window = sentiment_window = explain_scope = explain_window = ""
+    if since is not None:
+        sentiment_window = "AND t.last_message_ts > @since"
+    if lookback_days > 0:
+        explain_scope = f"AND t.last_message_ts >= {window_start}"
+        explain_window = f"AND created_at >= {window_start}"
+        if since is not None:
+            event_window = f"AND ie.event_ts >= LEAST(@since, {window_start})"
+    shard_filter = f"AND {shard_condition(shard, 'ie.thread_id')}" if shard else ""
+    query = f"""
+    WITH recent_messages AS (
+      SELECT
+        ie.thread_id,
+        ARRAY_AGG(
+          STRUCT(
+            ie.message_id,
+            ie.body_text AS message_body,
+            ie.event_ts
+          )
+          ORDER BY ie.event_ts DESC
+          LIMIT @context_messages
+        ) AS messages
+      FROM `{PROJECT_ID}.{DATASET}.interaction_event` ie
+      WHERE ie.thread_id IS NOT NULL
+        {event_window}
+        {shard_filter}
+      GROUP BY ie.thread_id
+    ),
+    threads_with_messages AS (
+      SELECT
+        rm.thread_id,
+        ts.thread_status,
+        ts.thread_id IS NOT NULL AS in_thread_state,
+        rm.messages,
+        rm.messages[OFFSET(0)].message_id AS last_message_id,
+        rm.messages[OFFSET(0)].event_ts AS last_message_ts,
+        rm.messages[OFFSET(0)].message_body AS last_message_body,
+        CASE
+          WHEN ARRAY_LENGTH(rm.messages) > 1 THEN rm.messages[OFFSET(1)].message_body
+          ELSE NULL
+        END AS previous_message_body
+      FROM recent_messages rm
+      LEFT JOIN `{PROJECT_ID}.{DATASET}.thread_state` ts
+        ON rm.thread_id = ts.thread_id
+    ),
+    scored_messages AS (
+      SELECT DISTINCT
+        thread_id,
+        message_id
+      FROM `{PROJECT_ID}.{DATASET}.message_sentiment`
+      WHERE prompt_version = @sentiment_prompt_version
+    ),
+    latest_explain AS (
+      SELECT
+        thread_id,
+        MAX(created_at) AS explained_at
+      FROM `{PROJECT_ID}.{DATASET}.thread_state_explain`
+      WHERE prompt_version = @explain_prompt_version
+        {explain_window}
+      GROUP BY thread_id
+    ),
+    latest_summary AS (
+      SELECT
+        thread_id,
+        ARRAY_AGG(
+          STRUCT(summary, summarized_through_ts, summarized_messages)
+          ORDER BY summarized_through_ts DESC
+          LIMIT 1
+        )[OFFSET(0)] AS latest
+      FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}`
+      WHERE prompt_version = @summary_prompt_version
+      GROUP BY thread_id
+    ),
+    needs AS (
+      SELECT
+        t.*,
+        (sm.message_id IS NULL {sentiment_window}) AS needs_sentiment,
+        (
+          t.in_thread_state {explain_scope}
+          AND (le.explained_at IS NULL OR t.last_message_ts > le.explained_at)
+        ) AS needs_explain,
+        ls.latest.summary AS summary,
+        ls.latest.summarized_through_ts AS summarized_through_ts,
+        ls.latest.summarized_messages AS summarized_messages
+      FROM threads_with_messages t
+      LEFT JOIN scored_messages sm
+        ON t.thread_id = sm.thread_id
+       AND t.last_message_id = sm.message_id
+      LEFT JOIN latest_explain le
+        ON t.thread_id = le.thread_id
+      LEFT JOIN latest_summary ls
+        ON t.thread_id = ls.thread_id
+    )
+    SELECT *
+    FROM needs
+    WHERE needs_sentiment OR needs_explain
+    ORDER BY last_message_ts ASC
+    LIMIT @limit
+    """
+    params = [
+        bigquery.ScalarQueryParameter("sentiment_prompt_version", "STRING", sentiment.PROMPT_VERSION),
+        bigquery.ScalarQueryParameter("explain_prompt_version", "STRING", explain_worker.PROMPT_VERSION),
+        bigquery.ScalarQueryParameter("summary_prompt_version", "STRING", SUMMARY_PROMPT_VERSION),
+        bigquery.ScalarQueryParameter("context_messages", "INT64", max(2, CONTEXT_MAX_MESSAGES)),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    if lookback_days > 0:
+        params.append(bigquery.ScalarQueryParameter("lookback_days", "INT64", lookback_days))
+    if since is not None:
+        params.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+    params.extend(shard_params(shard))
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    return iter_query_rows(bq, query, job_config, site="combined_discovery")
+
+
+def _sentiment_item(thread: Dict[str, Any]) -> Dict[str, Any]:
+    """The sentiment stage's view of a discovered thread: its latest message."""
+    return {
+        "thread_id": thread["thread_id"],
+        "message_id": thread["last_message_id"],
+        "body_text": thread["last_message_body"],
+        "event_ts": thread["last_message_ts"],
+    }
+
+
+class _RowBuffer:
+    """Collects rows written from several threads, to be written in bulk."""
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.rows.extend(rows)
+
+
+def process_chunk(
+    pool: ThreadPoolExecutor,
+    model: GenerativeModel,
+    chunk: List[Dict[str, Any]],
+    discovered_at: datetime,
+    cache: Optional[LLMCache] = None,
+    concurrency: int = sentiment.SCORING_CONCURRENCY,
+    batched: bool = sentiment.BATCHED_MODE,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Run the sentiment and explain stages for a chunk of discovered threads
+    concurrently on pool.
+
+    Each stage only gets the threads that need it. Returns the result rows
+    by table: {"sentiment", "explain", "summary"}, plus the sentiment items
+    that could not be scored under "unscored". Failed items have no row and
+    are discovered again on the next run.
+    """
+    sentiment_items = [_sentiment_item(t) for t in chunk if t["needs_sentiment"]]
+    explain_items = [t for t in chunk if t["needs_explain"]]
+    summaries = _RowBuffer()
+
+    scored = pool.submit(sentiment.score_chunk, model, sentiment_items, concurrency, batched, cache)
+    slices = [explain_items[i::EXPLAIN_CONCURRENCY] for i in range(min(EXPLAIN_CONCURRENCY, len(explain_items)))]
+    explained = [
+        pool.submit(explain_worker.explain_threads, items, discovered_at, cache, summaries)
+        for items in slices
+    ]
+
+    scores, model_names = scored.result()
+    sentiment_rows = sentiment.build_sentiment_rows(
+        sentiment_items, scores, datetime.now(timezone.utc).isoformat(), model_names,
+    )
+    explain_rows = [row for future in explained for row in future.result()]
+    unscored = [item for item, score in zip(sentiment_items, scores) if score is None]
+    return {"sentiment": sentiment_rows, "explain": explain_rows, "summary": summaries.rows, "unscored": unscored}
+
+
+def run_batch(
+    bq: bigquery.Client,
+    model: GenerativeModel,
+    batch_limit: int,
+    cache: Optional[LLMCache] = None,
+    stop_event: Optional[threading.Event] = None,
+    lookback_days: int = explain_worker.DISCOVERY_LOOKBACK_DAYS,
+    full_reconcile: bool = False,
+    journal: Optional[WorkJournal] = None,
+    shard: Optional[Shard] = None,
+) -> int:
+    """
+    Score and explain up to batch_limit threads, writing every FLUSH_SIZE threads.
+
+    Threads are streamed from one discovery query (see
+    fetch_threads_to_process) and processed in chunks (see process_chunk);
+    each chunk's rows are handed to the three writers, one write per table,
+    before the next chunk starts. If stop_event is set, the run ends after
+    the current chunk. The sentiment stage starts from the sentiment
+    watermark, or scans all threads when a full reconcile is due or
+    full_reconcile is set (see sentiment.plan_discovery). Once every row is
+    written the watermark is advanced as sentiment.run_batch does (see
+    sentiment.advance_watermark). With a journal, rows are journaled before they are
+    written and rows an interrupted run left behind are replayed before
+    discovery (see journal). The threads that got new sentiment or
+    explanation rows are then refreshed in thread_state_final, and the run's
+    metrics are reported (see worker_metrics.report).
+    Returns the number of threads fetched.
+    """
+    started = time.monotonic()
+    discovered_at = datetime.now(timezone.utc)
+    since = sentiment.plan_discovery(bq, discovered_at, full_reconcile, shard)
+    seen = inserted = 0
+    newest_seen = oldest_failed = None
+    stopped = False
+    sentiments = sentiment.sentiment_writer(bq)
+    explanations = explain_worker.explain_writer(bq)
+    summaries = summary_writer(bq, f"{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}")
+    touched_threads = set()
+    if journal is not None:
+        replayed = journal.replay({
+            sentiments.table_id: sentiments,
+            explanations.table_id: explanations,
+            summaries.table_id: summaries,
+        })
+        # Summaries do not feed thread_state_final
+        touched_threads.update(r["thread_id"] for r in replayed if "summary" not in r)
+    sentiments = journaled(sentiments, journal)
+    explanations = journaled(explanations, journal)
+    summaries = journaled(summaries, journal)
+
+    # One worker for the sentiment stage, one per explain slice
+    pool = ThreadPoolExecutor(max_workers=1 + EXPLAIN_CONCURRENCY)
+    try:
+        for chunk in chunked(fetch_threads_to_process(bq, batch_limit, lookback_days, since, shard), FLUSH_SIZE):
+            rows = process_chunk(pool, model, chunk, discovered_at, cache)
+            sentiments.write(rows["sentiment"])
+            explanations.write(rows["explain"])
+            summaries.write(rows["summary"])
+            touched_threads.update(r["thread_id"] for r in rows["sentiment"] + rows["explain"])
+            for thread in chunk:
+                newest_seen = max_ts(newest_seen, thread["last_message_ts"])
+            for item in rows["unscored"]:
+                oldest_failed = min_ts(oldest_failed, item["event_ts"])
+            seen += len(chunk)
+            inserted += len(rows["sentiment"]) + len(rows["explain"])
+            print(
+                f"Processed {seen} threads: {sentiments.rows_written} sentiment, "
+                f"{explanations.rows_written} explanation rows written so far..."
+            )
+            if should_stop(stop_event):
+                stopped = True
+                break
+    finally:
+        pool.shutdown(wait=True)
+        # Buffered writers (load mode) must land before the watermark moves
+        sentiments.flush()
+        explanations.flush()
+        summaries.flush()
+
+    refresh_after_write(bq, touched_threads)
+    record_run(WORKER_NAME, seen, inserted, time.monotonic() - started)
+    report(WORKER_NAME, shard.name if shard else None)
+
+    drained = seen < batch_limit and not stopped
+    sentiment.advance_watermark(bq, since, discovered_at, drained, newest_seen, oldest_failed, shard)
+
+    if not seen:
+        print("No threads to score or explain.")
+    return seen
+
+
+def main(
+    batch_limit: int = None,
+    daemon: bool = False,
+    full_scan: bool = False,
+    shard: Optional[Shard] = None,
+):
+    """
+    Score and explain threads with one discovery query.
+
+    Args:
+        batch_limit: Number of threads to process (defaults to BATCH_LIMIT);
+            in daemon mode this is the initial, adaptively resized batch size
+        daemon: Keep polling for threads until SIGTERM/SIGINT
+        full_scan: Ignore EXPLAIN_DISCOVERY_LOOKBACK_DAYS and scan all
+            history, and run a sentiment full reconcile on the first run
+        shard: Only process this shard's threads (see sharding)
+    """
+    lookback_days = 0 if full_scan else explain_worker.DISCOVERY_LOOKBACK_DAYS
+    full_reconcile = full_scan
+    if batch_limit is None:
+        batch_limit = BATCH_LIMIT
+
+    bq = bigquery.Client(project=PROJECT_ID)
+
+    sentiment.ensure_message_sentiment_table(bq)
+    explain_worker.ensure_thread_state_explain_table(bq)
+    ensure_summary_table(bq, f"{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}")
+    if sentiment.INCREMENTAL_DISCOVERY:
+        ensure_watermark_table(bq, sentiment.watermark_table_id())
+    if REFRESH_AFTER_WRITE:
+        ensure_materialized_tables(bq)
+
+    vertexai.init(project=PROJECT_ID, location=REGION)
+    model = GenerativeModel(sentiment.MODEL_NAME)
+
+    cache = open_cache()
+    journal = open_journal(WORKER_NAME, shard)
+    if shard:
+        print(f"Running as {shard.name}.")
+    try:
+        if daemon:
+            def _cycle(limit: int, stop_event: threading.Event) -> int:
+                nonlocal full_reconcile
+                seen = run_batch(bq, model, limit, cache, stop_event, lookback_days, full_reconcile, journal, shard)
+                full_reconcile = False
+                return seen
+
+            run_daemon(_cycle, initial_batch=batch_limit)
+        else:
+            run_batch(bq, model, batch_limit, cache, lookback_days=lookback_days,
+                      full_reconcile=full_reconcile, journal=journal, shard=shard)
+    finally:
+        if cache:
+            print(f"LLM cache: {cache.stats()}")
+            cache.close()
+        if journal:
+            journal.close()
+
+
+if __name__ == "__main__":
+    # Batch limit as first argument; --daemon keeps polling, --full scans all
+    # history instead of the discovery window and forces a sentiment full
+    # reconcile on the first run, --shard i/N processes only
+    # shard i of N (see sharding)
+    shard, flags = resolve_shard(sys.argv[1:])
+    args = [a for a in flags if a not in ("--daemon", "--full")]
+    batch_limit = None
+    if args:
+        try:
+            batch_limit = int(args[0])
+        except ValueError:
+            print(f"Invalid batch limit: {args[0]}. Using default: {BATCH_LIMIT}")
+
+    main(batch_limit=batch_limit, daemon="--daemon" in flags, full_scan="--full" in flags, shard=shard)
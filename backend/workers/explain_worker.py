@@ -3,8 +3,9 @@ import re
 import time
 import os
 import sys
+import threading
 from datetime import datetime, timezone
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional
 
 from google.cloud import bigquery
 
@@ -12,17 +13,46 @@ from google.cloud import bigquery
 import vertexai
 from vertexai.generative_models import GenerativeModel
 
+from bq_writer import get_writer
+from journal import WorkJournal, journaled, open_journal
+from llm_cache import LLMCache, make_key, open_cache
+from local_rules import LOCAL_MODEL_NAME, classify_threads
+from worker_metrics import LLM_PARSE_FAILURES, LLM_RETRIES, LOCAL_RULE_RESULTS, record_run, report
+from pipeline import chunked, iter_query_rows, run_daemon, should_stop
+from rate_limit import get_rate_limiter, retry_delay
+from sharding import Shard, resolve_shard, shard_condition, shard_params
+from thread_context import (
+    CONTEXT_MAX_MESSAGES,
+    SUMMARY_MAX_TOKENS,
+    SUMMARY_PROMPT_VERSION,
+    SUMMARY_TABLE,
+    build_context,
+    ensure_summary_table,
+    summary_row,
+    summary_writer,
+)
+from thread_state_final import REFRESH_AFTER_WRITE, ensure_materialized_tables, refresh_after_write
+
 PROJECT_ID = "clariversev1"
 DATASET = "flipkart_slices"
 REGION = "us-central1"
 
-PROMPT_VERSION = "thread_state_v0.1"
+PROMPT_VERSION = "thread_state_v0.2"  # Summary + earlier messages as context
 MODEL_NAME = "gemini-2.0-flash"
+WORKER_NAME = "explain"
 
 # Configurable batch limit - can be set via environment variable or command line arg
 BATCH_LIMIT = int(os.getenv("EXPLAIN_BATCH_LIMIT", "50"))
 MAX_RETRIES = 3
 
+# Explanations are inserted every FLUSH_SIZE threads instead of once at the end
+FLUSH_SIZE = int(os.getenv("EXPLAIN_FLUSH_SIZE", "25"))
+
+# Discovery only scans events and explanations from the last N days
+# (0 = full scan). A thread is (re-)explained when its last message is newer
+# than its latest explanation for PROMPT_VERSION.
+DISCOVERY_LOOKBACK_DAYS = int(os.getenv("EXPLAIN_DISCOVERY_LOOKBACK_DAYS", "30"))
+
 # Lazy initialization
 _model = None
 
@@ -58,7 +88,9 @@ def extract_json_from_response(text: str) -> dict:
 def explain_thread_state(
     heuristic_status: str,
     last_message: str,
-    prev_message: str = None
+    prev_message: str = None,
+    summary: str = None,
+    earlier_messages: List[str] = None,
 ) -> Dict[str, Any]:
     """
     Explain thread state using LLM.
@@ -66,7 +98,11 @@ def explain_thread_state(
     Args:
         heuristic_status: Current heuristic thread status (e.g., "open" or "closed")
         last_message: Body text of the last message
-        prev_message: Body text of the previous message (optional)
+        prev_message: Body text of the previous message (optional, used
+            when earlier_messages is not given)
+        summary: Rolling summary of the older messages (see thread_context)
+        earlier_messages: Bodies of the messages between the summary and
+            the last message, oldest first
     
     Returns:
         Dict with keys:
@@ -76,7 +112,9 @@ def explain_thread_state(
         - confidence: Float between 0.0 and 1.0
     """
     model = _get_model()
-    prev_message_text = prev_message if prev_message else "N/A"
+    if earlier_messages is None:
+        earlier_messages = [prev_message] if prev_message else []
+    earlier_text = "\n".join(f"[{i}] {body}" for i, body in enumerate(earlier_messages, 1)) or "N/A"
     
     prompt = f"""You are analyzing an email thread to determine its status and next action owner.
 
@@ -111,17 +149,27 @@ DECISION RULES:
    - 0.4-0.6: ambiguous but reasonable inference
    - <0.4: very unclear, default to keeping open
 
+5. Context:
+   - The thread summary covers older messages; earlier messages are more
+     recent, and the last message weighs most
+   - A question or promise in the summary that later messages did not
+     resolve keeps the thread open
+
 INPUTS:
 Heuristic status: {heuristic_status}
-Previous message: {prev_message_text}
+Thread summary: {summary or "N/A"}
+Earlier messages (oldest first):
+{earlier_text}
 Last message: {last_message}
 
 Respond with ONLY the JSON object, no markdown backticks, no explanation."""
     
+    # Retry with jittered exponential backoff; quota is shared via the rate limiter
+    limiter = get_rate_limiter()
     last_err = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = model.generate_content(prompt)
+            resp = limiter.call(model.generate_content, prompt)
             if not resp or not resp.text:
                 raise ValueError("Empty response from model")
             
@@ -157,16 +205,92 @@ Respond with ONLY the JSON object, no markdown backticks, no explanation."""
             }
         except Exception as e:
             last_err = e
+            # Unparseable or invalid answers raise ValueError (json.JSONDecodeError included)
+            if isinstance(e, ValueError):
+                LLM_PARSE_FAILURES.inc(worker=WORKER_NAME)
             if attempt < MAX_RETRIES:
-                time.sleep(1.5 * attempt)
+                LLM_RETRIES.inc(worker=WORKER_NAME)
+                time.sleep(retry_delay(e, attempt))
             else:
                 pass
     
     raise RuntimeError(f"Gemini call failed after retries: {last_err}")
 
 
-def fetch_threads_to_explain(bq: bigquery.Client, limit: int = BATCH_LIMIT) -> List[Dict[str, Any]]:
-    """Fetch threads that need explanation from BigQuery."""
+def summarize_thread(previous_summary: Optional[str], messages: List[str]) -> str:
+    """
+    Fold messages (oldest first) into a thread's rolling summary.
+    
+    Only the previous summary and the new messages are sent, so the cost of
+    an update does not grow with the length of the thread. Returns the new
+    summary text (see thread_context).
+    """
+    model = _get_model()
+    messages_text = "\n".join(f"[{i}] {body}" for i, body in enumerate(messages, 1))
+    max_words = max(20, SUMMARY_MAX_TOKENS * 3 // 4)
+    
+    prompt = f"""You maintain a running summary of a customer support email thread.
+
+Update the summary with the new messages. Keep what is still relevant: the
+customer's issue, what each side asked for or promised, what was resolved
+and what is still pending. Drop greetings, signatures and quoted text.
+Write plain text, at most {max_words} words.
+
+Current summary: {previous_summary or "N/A (start of thread)"}
+
+New messages (oldest first):
+{messages_text}
+
+Updated summary:"""
+    
+    limiter = get_rate_limiter()
+    last_err = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            resp = limiter.call(model.generate_content, prompt)
+            if not resp or not resp.text or not resp.text.strip():
+                raise ValueError("Empty response from model")
+            return resp.text.strip()
+        except Exception as e:
+            last_err = e
+            if isinstance(e, ValueError):
+                LLM_PARSE_FAILURES.inc(worker=WORKER_NAME)
+            if attempt < MAX_RETRIES:
+                LLM_RETRIES.inc(worker=WORKER_NAME)
+                time.sleep(retry_delay(e, attempt))
+    
+    raise RuntimeError(f"Gemini summary call failed after retries: {last_err}")
+
+
+def fetch_threads_to_explain(
+    bq: bigquery.Client,
+    limit: int = BATCH_LIMIT,
+    lookback_days: int = DISCOVERY_LOOKBACK_DAYS,
+    shard: Optional[Shard] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield threads that need (re-)explanation from BigQuery, paging through the results.
+    
+    A thread qualifies when it has no explanation for PROMPT_VERSION or its
+    last message is newer than its latest explanation's created_at, so
+    threads that received new messages are refreshed. With lookback_days > 0
+    both interaction_event and thread_state_explain are filtered to that
+    window, which lets BigQuery prune partitions; a thread explained before
+    the window but active within it counts as stale, as it should. Threads
+    with no activity in the window need a full scan (lookback_days=0).
+    Freshest threads come first.
+    
+    Each row carries the thread's last CONTEXT_MAX_MESSAGES messages
+    (newest first) and its latest rolling summary, from which
+    thread_context.build_context assembles the prompt context. With a
+    shard only the shard's threads are considered (see sharding).
+    """
+    if lookback_days > 0:
+        event_window = "AND ie.event_ts >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @lookback_days DAY)"
+        explain_window = "AND created_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @lookback_days DAY)"
+    else:
+        event_window = explain_window = ""
+    shard_filter = f"AND {shard_condition(shard)}" if shard else ""
     query = f"""
     WITH thread_statuses AS (
       SELECT
@@ -174,6 +298,7 @@ def fetch_threads_to_explain(bq: bigquery.Client, limit: int = BATCH_LIMIT) -> L
         thread_status
       FROM `{PROJECT_ID}.{DATASET}.thread_state`
       WHERE thread_id IS NOT NULL
+        {shard_filter}
     ),
     recent_messages AS (
       SELECT
@@ -185,46 +310,80 @@ def fetch_threads_to_explain(bq: bigquery.Client, limit: int = BATCH_LIMIT) -> L
             ie.event_ts
           )
           ORDER BY ie.event_ts DESC
-          LIMIT 2
+          LIMIT @context_messages
         ) AS messages
       FROM thread_statuses ts
       INNER JOIN `{PROJECT_ID}.{DATASET}.interaction_event` ie
         ON ts.thread_id = ie.thread_id
       WHERE ie.thread_id IS NOT NULL
+        {event_window}
       GROUP BY ie.thread_id, ts.thread_status
     ),
     threads_with_messages AS (
       SELECT
         thread_id,
         thread_status,
+        messages,
+        messages[OFFSET(0)].event_ts AS last_message_ts,
         messages[OFFSET(0)].message_body AS last_message_body,
         CASE 
           WHEN ARRAY_LENGTH(messages) > 1 THEN messages[OFFSET(1)].message_body
           ELSE NULL
         END AS previous_message_body
       FROM recent_messages
+    ),
+    latest_explain AS (
+      SELECT
+        thread_id,
+        MAX(created_at) AS explained_at
+      FROM `{PROJECT_ID}.{DATASET}.thread_state_explain`
+      WHERE prompt_version = @prompt_version
+        {explain_window}
+      GROUP BY thread_id
+    ),
+    latest_summary AS (
+      SELECT
+        thread_id,
+        ARRAY_AGG(
+          STRUCT(summary, summarized_through_ts, summarized_messages)
+          ORDER BY summarized_through_ts DESC
+          LIMIT 1
+        )[OFFSET(0)] AS latest
+      FROM `{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}`
+      WHERE prompt_version = @summary_prompt_version
+      GROUP BY thread_id
     )
     SELECT
       t.thread_id,
       t.thread_status,
+      t.last_message_ts,
       t.last_message_body,
-      t.previous_message_body
+      t.previous_message_body,
+      t.messages,
+      ls.latest.summary AS summary,
+      ls.latest.summarized_through_ts AS summarized_through_ts,
+      ls.latest.summarized_messages AS summarized_messages
     FROM threads_with_messages t
-    LEFT JOIN `{PROJECT_ID}.{DATASET}.thread_state_explain` te
-      ON t.thread_id = te.thread_id
-     AND te.prompt_version = @prompt_version
-    WHERE te.thread_id IS NULL
-    ORDER BY t.thread_id
+    LEFT JOIN latest_explain le
+      ON t.thread_id = le.thread_id
+    LEFT JOIN latest_summary ls
+      ON t.thread_id = ls.thread_id
+    WHERE le.explained_at IS NULL
+       OR t.last_message_ts > le.explained_at
+    ORDER BY t.last_message_ts DESC
     LIMIT @limit
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("prompt_version", "STRING", PROMPT_VERSION),
-            bigquery.ScalarQueryParameter("limit", "INT64", limit),
-        ]
-    )
-    rows = bq.query(query, job_config=job_config).result()
-    return [dict(r) for r in rows]
+    params = [
+        bigquery.ScalarQueryParameter("prompt_version", "STRING", PROMPT_VERSION),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+        bigquery.ScalarQueryParameter("context_messages", "INT64", max(2, CONTEXT_MAX_MESSAGES)),
+        bigquery.ScalarQueryParameter("summary_prompt_version", "STRING", SUMMARY_PROMPT_VERSION),
+    ]
+    if lookback_days > 0:
+        params.append(bigquery.ScalarQueryParameter("lookback_days", "INT64", lookback_days))
+    params.extend(shard_params(shard))
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    return iter_query_rows(bq, query, job_config, site="explain_discovery")
 
 
 def ensure_thread_state_explain_table(bq: bigquery.Client) -> None:
@@ -248,7 +407,21 @@ def ensure_thread_state_explain_table(bq: bigquery.Client) -> None:
         bq.create_table(table_ref)
 
 
-def insert_thread_state_explain(bq: bigquery.Client, rows: List[Dict[str, Any]]) -> None:
+def explain_writer(bq: bigquery.Client, mode: str = None):
+    """
+    Writer for thread_state_explain (see bq_writer). A retried chunk reuses
+    its discovery-time created_at, so thread_id + prompt_version + created_at
+    is the insertId for retry-safe streaming.
+    """
+    return get_writer(
+        bq,
+        f"{PROJECT_ID}.{DATASET}.thread_state_explain",
+        row_id=lambda r: f"{r['thread_id']}:{r['prompt_version']}:{r['created_at']}",
+        mode=mode,
+    )
+
+
+def insert_thread_state_explain(bq: bigquery.Client, rows: List[Dict[str, Any]], writer=None) -> None:
     """
     Insert thread state explanation results into BigQuery table thread_state_explain.
     
@@ -261,74 +434,238 @@ def insert_thread_state_explain(bq: bigquery.Client, rows: List[Dict[str, Any]])
     - prompt_version
     - model_name
     - created_at (UTC timestamp as ISO string)
+    
+    Rows go through writer if given, otherwise through a one-off default
+    writer that is flushed immediately.
     """
-    table_id = f"{PROJECT_ID}.{DATASET}.thread_state_explain"
-    errors = bq.insert_rows_json(table_id, rows)
-    if errors:
-        raise RuntimeError(f"BigQuery insert errors: {errors}")
+    if writer is not None:
+        writer.write(rows)
+        return
+    writer = explain_writer(bq)
+    writer.write(rows)
+    writer.flush()
+
+
+def _summary_table_id() -> str:
+    return f"{PROJECT_ID}.{DATASET}.{SUMMARY_TABLE}"
+
+
+def _cached_summarize(cache: Optional[LLMCache]):
+    """summarize_thread, reusing cached summaries of identical inputs."""
+    def summarize(previous_summary: Optional[str], messages: List[str]) -> str:
+        cache_key = make_key(SUMMARY_PROMPT_VERSION, MODEL_NAME, previous_summary, *messages)
+        cached = cache.get(cache_key) if cache else None
+        if cached is not None:
+            return cached["summary"]
+        summary = summarize_thread(previous_summary, messages)
+        if cache:
+            cache.put(cache_key, {"summary": summary})
+        return summary
+    return summarize
+
+
+def _explain_row(thread_id: str, result: Dict[str, Any], model_name: str, created_at: datetime) -> Dict[str, Any]:
+    """thread_state_explain row for an explanation result."""
+    return {
+        "thread_id": thread_id,
+        "thread_status": result["thread_status"],
+        "next_action_owner": result["next_action_owner"],
+        "status_reason": result["status_reason"],
+        "confidence": result["confidence"],
+        "prompt_version": PROMPT_VERSION,
+        "model_name": model_name,
+        "created_at": created_at.isoformat(),
+    }
+
+
+def explain_threads(
+    items: List[Dict[str, Any]],
+    created_at: datetime,
+    cache: Optional[LLMCache] = None,
+    summaries=None,
+) -> List[Dict[str, Any]]:
+    """
+    Explain a chunk of threads and build thread_state_explain rows.
+    
+    created_at should be taken before the threads were fetched, so a message
+    arriving while the chunk is explained is still newer than the stored
+    explanation and triggers a refresh on the next run. Threads whose
+    explanation fails after retries are skipped so they are picked up again
+    on the next run.
+    
+    Threads whose last message the local rules are confident about (e.g. a
+    short "thanks, resolved") are answered without a model call (see
+    local_rules). The others are explained from their rolling summary plus
+    the messages after it (see thread_context). Updated summaries are
+    written to the summaries writer; without one they are only used for
+    this prompt.
+    """
+    out_rows = []
+    summarize = _cached_summarize(cache)
+    summary_rows = []
+    local_results = classify_threads([item.get("last_message_body") for item in items])
+    
+    for item, local in zip(items, local_results):
+        thread_id = item["thread_id"]
+        heuristic_status = item.get("thread_status") or "open"
+        if local is not None:
+            LOCAL_RULE_RESULTS.inc(worker=WORKER_NAME, rule=local["rule"])
+            out_rows.append(_explain_row(thread_id, local, LOCAL_MODEL_NAME, created_at))
+            continue
+        
+        context = build_context(item, summarize)
+        if context["new_summary"] is not None:
+            summary_rows.append(summary_row(thread_id, context["new_summary"], MODEL_NAME, created_at))
+        
+        # Identical inputs (templated replies, reruns) reuse the cached explanation
+        cache_key = make_key(
+            PROMPT_VERSION, MODEL_NAME, heuristic_status, context["summary"],
+            *context["earlier_messages"], context["last_message"],
+        )
+        result = cache.get(cache_key) if cache else None
+        if result is None:
+            try:
+                result = explain_thread_state(
+                    heuristic_status=heuristic_status,
+                    last_message=context["last_message"],
+                    summary=context["summary"],
+                    earlier_messages=context["earlier_messages"],
+                )
+            except Exception as e:
+                print(f"Skipping thread {thread_id}: {e}")
+                continue
+            if cache:
+                cache.put(cache_key, result)
+        
+        out_rows.append(_explain_row(thread_id, result, MODEL_NAME, created_at))
+    
+    if summaries is not None and summary_rows:
+        summaries.write(summary_rows)
+    return out_rows
 
 
-def main(batch_limit: int = None):
+def run_batch(
+    bq: bigquery.Client,
+    batch_limit: int,
+    cache: Optional[LLMCache] = None,
+    stop_event: Optional[threading.Event] = None,
+    lookback_days: int = DISCOVERY_LOOKBACK_DAYS,
+    journal: Optional[WorkJournal] = None,
+    shard: Optional[Shard] = None,
+) -> int:
+    """
+    Explain up to batch_limit threads, inserting every FLUSH_SIZE rows.
+    
+    Threads are streamed from BigQuery and explained in chunks; each chunk is
+    handed to the writer before the next starts, so with streaming writes a
+    crash only loses the chunk in flight (load mode buffers up to
+    BQ_LOAD_FLUSH_ROWS). If stop_event is set, the run ends after the
+    current chunk. The explained threads are then refreshed in
+    thread_state_final, and the run's metrics are reported (see
+    worker_metrics.report). Updated thread summaries are written alongside.
+    With a journal, rows are journaled before they are written, and rows an
+    interrupted run left behind are replayed before discovery, so their
+    threads are not explained again (see journal). With a shard, only the
+    shard's threads are discovered (see sharding).
+    Returns the number of threads fetched.
+    """
+    started = time.monotonic()
+    seen = inserted = 0
+    discovered_at = datetime.now(timezone.utc)
+    writer = explain_writer(bq)
+    summaries = summary_writer(bq, _summary_table_id())
+    touched_threads = set()
+    if journal is not None:
+        replayed = journal.replay({writer.table_id: writer, summaries.table_id: summaries})
+        # Only explanations (not summaries) feed thread_state_final
+        touched_threads.update(r["thread_id"] for r in replayed if "thread_status" in r)
+    writer = journaled(writer, journal)
+    summaries = journaled(summaries, journal)
+    
+    try:
+        for chunk in chunked(fetch_threads_to_explain(bq, batch_limit, lookback_days, shard), FLUSH_SIZE):
+            out_rows = explain_threads(chunk, discovered_at, cache, summaries)
+            if out_rows:
+                insert_thread_state_explain(bq, out_rows, writer)
+                touched_threads.update(r["thread_id"] for r in out_rows)
+            seen += len(chunk)
+            inserted += len(out_rows)
+            print(f"Processed {seen} threads, explained {inserted} so far...")
+            if should_stop(stop_event):
+                break
+    finally:
+        writer.flush()
+        summaries.flush()
+    
+    refresh_after_write(bq, touched_threads)
+    record_run(WORKER_NAME, seen, inserted, time.monotonic() - started)
+    report(WORKER_NAME, shard.name if shard else None)
+    
+    if inserted:
+        print(f"Inserted {inserted} explanation rows into thread_state_explain.")
+    return seen
+
+
+def main(
+    batch_limit: int = None,
+    daemon: bool = False,
+    full_scan: bool = False,
+    shard: Optional[Shard] = None,
+):
     """
     Main function to process thread state explanations.
     
     Args:
-        batch_limit: Number of threads to process (defaults to BATCH_LIMIT)
+        batch_limit: Number of threads to process (defaults to BATCH_LIMIT);
+            in daemon mode this is the initial, adaptively resized batch size
+        daemon: Keep polling for threads to explain until SIGTERM/SIGINT
+        full_scan: Ignore DISCOVERY_LOOKBACK_DAYS and scan all history
+        shard: Only explain this shard's threads (see sharding)
     """
+    lookback_days = 0 if full_scan else DISCOVERY_LOOKBACK_DAYS
     if batch_limit is None:
         batch_limit = BATCH_LIMIT
     
     bq = bigquery.Client(project=PROJECT_ID)
     
     ensure_thread_state_explain_table(bq)
+    ensure_summary_table(bq, _summary_table_id())
+    if REFRESH_AFTER_WRITE:
+        ensure_materialized_tables(bq)
     
     vertexai.init(project=PROJECT_ID, location=REGION)
     
-    to_explain = fetch_threads_to_explain(bq, batch_limit)
-    if not to_explain:
-        return
-    
-    out_rows = []
-    now_ts = datetime.now(timezone.utc)
-    
-    for i, item in enumerate(to_explain, start=1):
-        thread_id = item["thread_id"]
-        heuristic_status = item.get("thread_status") or "open"
-        last_message = item.get("last_message_body") or ""
-        prev_message = item.get("previous_message_body")
-        
-        result = explain_thread_state(
-            heuristic_status=heuristic_status,
-            last_message=last_message,
-            prev_message=prev_message
-        )
-        
-        out_rows.append({
-            "thread_id": thread_id,
-            "thread_status": result["thread_status"],
-            "next_action_owner": result["next_action_owner"],
-            "status_reason": result["status_reason"],
-            "confidence": result["confidence"],
-            "prompt_version": PROMPT_VERSION,
-            "model_name": MODEL_NAME,
-            "created_at": now_ts.isoformat(),
-        })
-        
-        if i % 10 == 0:
-            print(f"Processed {i}/{len(to_explain)} threads...")
-    
-    if out_rows:
-        insert_thread_state_explain(bq, out_rows)
-        print(f"Inserted {len(out_rows)} explanation rows into thread_state_explain.")
+    cache = open_cache()
+    journal = open_journal(WORKER_NAME, shard)
+    if shard:
+        print(f"Running as {shard.name}.")
+    try:
+        if daemon:
+            run_daemon(
+                lambda limit, stop_event: run_batch(bq, limit, cache, stop_event, lookback_days, journal, shard),
+                initial_batch=batch_limit,
+            )
+        else:
+            run_batch(bq, batch_limit, cache, lookback_days=lookback_days, journal=journal, shard=shard)
+    finally:
+        if cache:
+            print(f"LLM cache: {cache.stats()}")
+            cache.close()
+        if journal:
+            journal.close()
 
 
 if __name__ == "__main__":
-    # Allow batch limit to be set via command line argument
+    # Allow batch limit to be set via command line argument; --daemon keeps polling,
+    # --full scans all history instead of the discovery window, --shard i/N
+    # explains only shard i of N (see sharding)
+    shard, flags = resolve_shard(sys.argv[1:])
+    args = [a for a in flags if a not in ("--daemon", "--full")]
     batch_limit = None
-    if len(sys.argv) > 1:
+    if args:
         try:
-            batch_limit = int(sys.argv[1])
+            batch_limit = int(args[0])
         except ValueError:
-            print(f"Invalid batch limit: {sys.argv[1]}. Using default: {BATCH_LIMIT}")
+            print(f"Invalid batch limit: {args[0]}. Using default: {BATCH_LIMIT}")
     
-    main(batch_limit=batch_limit)
+    main(batch_limit=batch_limit, daemon="--daemon" in flags, full_scan="--full" in flags, shard=shard)
@@ -0,0 +1,261 @@
+"""
+Local stand-ins for Vertex AI and BigQuery used to exercise the workers offline.
+
+FakeGenerativeModel mimics the part of vertexai.generative_models.GenerativeModel
+the workers rely on (generate_content(prompt).text). It sleeps to simulate
+network latency and returns deterministic, valid JSON for the sentiment
+(single and batched) and the thread-state prompts, and plain text for the
+thread summary prompt. Optionally a share of calls is slow, fails like
+Vertex does (503 / 429) or returns text that is not JSON, so retry and
+backoff paths can be measured.
+
+FakeBigQueryClient keeps written rows in memory and mirrors the write-side
+semantics bq_writer depends on: insertId deduplication for streaming inserts
+and Conflict on a reused load job id. query() answers from canned result
+sets (add_query_result), so discovery queries can be fed synthetic rows;
+other queries (MERGE, watermark reads) return no rows.
+
+No credentials or network access are needed.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import Conflict, ResourceExhausted, ServiceUnavailable
+
+
+class FakeResponse:
+    """Minimal response object exposing .text like the Vertex SDK."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in replacement for GenerativeModel with simulated latency.
+
+    Args:
+        latency_s: Mean latency per generate_content call, in seconds
+        jitter_s: Uniform +/- jitter applied to the latency
+        seed: Seed for the RNG (for repeatable benchmarks)
+        slow_rate: Share of calls that take slow_latency_s instead (tail latency)
+        slow_latency_s: Latency of a slow call, in seconds
+        error_rate: Share of calls that raise ServiceUnavailable (503)
+        quota_error_rate: Share of calls that raise ResourceExhausted (429)
+        malformed_rate: Share of calls that answer with text that is not JSON
+        fenced_rate: Share of valid answers wrapped in a ```json block
+    """
+
+    def __init__(
+        self,
+        latency_s: float = 0.2,
+        jitter_s: float = 0.05,
+        seed: Optional[int] = None,
+        slow_rate: float = 0.0,
+        slow_latency_s: float = 2.0,
+        error_rate: float = 0.0,
+        quota_error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        fenced_rate: float = 0.0,
+    ):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.slow_rate = slow_rate
+        self.slow_latency_s = slow_latency_s
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self.malformed_rate = malformed_rate
+        self.fenced_rate = fenced_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.malformed = 0
+
+    def _sleep(self) -> str:
+        """Wait the simulated latency and return the outcome drawn for this call."""
+        with self._lock:
+            self.calls += 1
+            if self._rng.random() < self.slow_rate:
+                delay = self.slow_latency_s
+            else:
+                delay = self.latency_s + self._rng.uniform(-self.jitter_s, self.jitter_s)
+            draw = self._rng.random()
+            if draw < self.error_rate:
+                outcome = "error"
+            elif draw < self.error_rate + self.quota_error_rate:
+                outcome = "quota"
+            elif draw < self.error_rate + self.quota_error_rate + self.malformed_rate:
+                outcome = "malformed"
+            else:
+                outcome = "fenced" if self._rng.random() < self.fenced_rate else "ok"
+            if outcome in ("error", "quota"):
+                self.errors += 1
+            elif outcome == "malformed":
+                self.malformed += 1
+        if delay > 0:
+            time.sleep(delay)
+        return outcome
+
+    def generate_content(self, prompt: str) -> FakeResponse:
+        outcome = self._sleep()
+        if outcome == "error":
+            raise ServiceUnavailable("503 The service is currently unavailable (simulated).")
+        if outcome == "quota":
+            raise ResourceExhausted("429 Quota exceeded for aiplatform.googleapis.com (simulated).")
+        if outcome == "malformed":
+            return FakeResponse("I'm sorry, I can't classify this email right now.")
+
+        if prompt.rstrip().endswith("Updated summary:"):
+            new_messages = prompt.rsplit("New messages (oldest first):", 1)[-1].count("\n[")
+            return FakeResponse(f"Simulated summary, updated with {new_messages} messages.")
+        if "thread_status" in prompt:
+            digest = _digest(prompt)
+            closed = digest % 3 == 0
+            payload = {
+                "thread_status": "closed" if closed else "open",
+                "next_action_owner": "none" if closed else ("org", "customer")[digest % 2],
+                "status_reason": "Simulated explanation from the fake model.",
+                "confidence": round(0.5 + (digest % 50) / 100, 2),
+            }
+        elif "<<<EMAIL id=" in prompt:
+            payload = [
+                {"id": int(email_id), **_fake_sentiment(body)}
+                for email_id, body in _BATCH_EMAIL_RE.findall(prompt)
+            ]
+        else:
+            payload = _fake_sentiment(prompt.rsplit("Email text:", 1)[-1].strip())
+        if outcome == "fenced":
+            return FakeResponse(f"```json\n{json.dumps(payload, indent=2)}\n```")
+        return FakeResponse(json.dumps(payload))
+
+
+_BATCH_EMAIL_RE = re.compile(r"<<<EMAIL id=(\d+)>>>\n(.*?)\n<<<END EMAIL id=\1>>>", re.DOTALL)
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+
+
+def _fake_sentiment(body: str) -> dict:
+    """Deterministic score for an email body, identical in single and batched mode."""
+    digest = _digest(body.strip())
+    return {"sentiment": digest % 5 + 1, "confidence": round(0.5 + (digest % 50) / 100, 2)}
+
+
+class FakeLoadJob:
+    """Completed load job; result() returns immediately."""
+
+    state = "DONE"
+    error_result = None
+
+    def __init__(self, job_id: str, output_rows: int):
+        self.job_id = job_id
+        self.output_rows = output_rows
+
+    def result(self, *args, **kwargs) -> "FakeLoadJob":
+        return self
+
+
+class FakeQueryJob:
+    """Completed query job; result() returns the matched rows."""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self._rows = rows
+        self.num_dml_affected_rows = 0
+        self.total_bytes_processed = 0
+        self.total_bytes_billed = 0
+        self.slot_millis = 0
+        self.cache_hit = False
+
+    def result(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return self._rows
+
+
+class FakeBigQueryClient:
+    """
+    In-memory stand-in for bigquery.Client.
+
+    Args:
+        insert_latency_s: Simulated latency per insert/load request, in seconds
+        query_latency_s: Simulated latency per query, in seconds
+    """
+
+    def __init__(self, insert_latency_s: float = 0.0, query_latency_s: float = 0.0):
+        self.insert_latency_s = insert_latency_s
+        self.query_latency_s = query_latency_s
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.insert_calls = 0
+        self.load_jobs = 0
+        self.queries = 0
+        self._query_results: List[Tuple[str, List[Dict[str, Any]]]] = []
+        self._row_ids = set()
+        self._jobs: Dict[str, FakeLoadJob] = {}
+        self._lock = threading.Lock()
+
+    def add_query_result(self, marker: str, rows: List[Dict[str, Any]]) -> None:
+        """Answer queries whose text contains marker with rows (first match wins)."""
+        self._query_results.append((marker, rows))
+
+    def query(self, query: str, job_config: Any = None) -> FakeQueryJob:
+        """
+        Return the rows registered for the first marker found in query,
+        truncated to the @limit parameter if there is one.
+        """
+        if self.query_latency_s:
+            time.sleep(self.query_latency_s)
+        with self._lock:
+            self.queries += 1
+        rows: List[Dict[str, Any]] = []
+        for marker, result in self._query_results:
+            if marker in query:
+                rows = result
+                break
+        for param in getattr(job_config, "query_parameters", None) or []:
+            if getattr(param, "name", None) == "limit":
+                rows = rows[:param.value]
+        return FakeQueryJob([dict(r) for r in rows])
+
+    def get_table(self, table_id: str) -> str:
+        return table_id
+
+    def create_table(self, table: Any) -> Any:
+        return table
+
+    def insert_rows_json(self, table: str, json_rows: List[Dict[str, Any]], row_ids: Optional[List[str]] = None) -> list:
+        if self.insert_latency_s:
+            time.sleep(self.insert_latency_s)
+        with self._lock:
+            self.insert_calls += 1
+            for i, row in enumerate(json_rows):
+                if row_ids is not None:
+                    key = (table, row_ids[i])
+                    if key in self._row_ids:
+                        continue
+                    self._row_ids.add(key)
+                self.tables[table].append(dict(row))
+        return []
+
+    def load_table_from_file(self, file_obj, destination: str, job_id: str = None, job_config: Any = None) -> FakeLoadJob:
+        if self.insert_latency_s:
+            time.sleep(self.insert_latency_s)
+        with self._lock:
+            if job_id is not None:
+                if job_id in self._jobs:
+                    raise Conflict(f"Already Exists: Job {job_id}")
+            rows = [json.loads(line) for line in file_obj.read().decode("utf-8").splitlines() if line]
+            self.load_jobs += 1
+            self.tables[destination].extend(rows)
+            job = FakeLoadJob(job_id, len(rows))
+            if job_id is not None:
+                self._jobs[job_id] = job
+        return job
+
+    def get_job(self, job_id: str) -> FakeLoadJob:
+        return self._jobs[job_id]
@@ -0,0 +1,203 @@
+"""
+Local write-ahead journal for worker result rows.
+
+Scored rows used to live only in memory until BigQuery accepted them, so a
+crash or a preempted VM lost every paid LLM result that had not been
+uploaded yet. With a journal, each row is committed to a local SQLite file
+before it is handed to the BigQuery writer, and is deleted once the writer
+has sent it:
+
+- JournaledWriter wraps a bq_writer writer (same write()/flush()
+  interface) and journals every row it is given.
+- WorkJournal.replay() re-sends whatever a previous run left pending. The
+  workers call it at the start of run_batch, before discovery, so the
+  replayed rows are already in BigQuery when discovery runs. The messages
+  and threads they cover are therefore skipped rather than scored again.
+
+Delivery is at-least-once. A crash between a successful send and its
+acknowledgement replays rows that already landed. Streaming inserts carry
+insertIds, so a replay soon after the crash is deduplicated by BigQuery.
+
+The journal is off unless WORKER_JOURNAL_DIR is set. Point it at a disk
+that survives a restart (a persistent volume for spot or preemptible VMs,
+not a container's ephemeral filesystem), or replay has nothing to replay.
+
+Configuration (environment):
+- WORKER_JOURNAL_DIR: Directory of the journal files, one per worker and
+  shard (unset or empty disables the journal)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from worker_metrics import JOURNAL_ROWS_REPLAYED
+from sharding import Shard, shard_key
+
+JOURNAL_DIR = os.getenv("WORKER_JOURNAL_DIR", "")
+
+
+class WorkJournal:
+    """
+    SQLite-backed queue of rows waiting to be written to BigQuery.
+
+    Safe to share between threads of one process; use one journal file per
+    worker process.
+    """
+
+    def __init__(self, path: str, worker: str = ""):
+        self.path = path
+        self.worker = worker
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Every append is committed before the row is sent; FULL makes that durable across power loss
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              table_id TEXT NOT NULL,
+              row TEXT NOT NULL,
+              created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def append(self, table_id: str, rows: List[Dict[str, Any]]) -> List[int]:
+        """Durably record rows for table_id and return their journal ids."""
+        now = time.time()
+        ids = []
+        with self._lock:
+            for row in rows:
+                cursor = self._conn.execute(
+                    "INSERT INTO journal (table_id, row, created_at) VALUES (?, ?, ?)",
+                    (table_id, json.dumps(row, default=str), now),
+                )
+                ids.append(cursor.lastrowid)
+            self._conn.commit()
+        return ids
+
+    def ack(self, ids: List[int]) -> None:
+        """Forget rows that have been written to BigQuery."""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM journal WHERE id = ?", [(i,) for i in ids])
+            self._conn.commit()
+
+    def pending(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Unacknowledged rows by table, each row with its journal id as "_journal_id"."""
+        with self._lock:
+            records = self._conn.execute("SELECT id, table_id, row FROM journal ORDER BY id").fetchall()
+        by_table: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for journal_id, table_id, row in records:
+            by_table[table_id].append({**json.loads(row), "_journal_id": journal_id})
+        return dict(by_table)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def replay(self, writers: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Write the rows a previous run left pending through writers (by
+        table id), acknowledge them and return them. Rows of a table with no
+        writer stay in the journal.
+        """
+        replayed = []
+        for table_id, records in self.pending().items():
+            writer = writers.get(table_id)
+            if writer is None:
+                print(f"WARNING: {len(records)} journaled rows for {table_id} have no writer; leaving them.")
+                continue
+            ids = [r.pop("_journal_id") for r in records]
+            writer.write(records)
+            writer.flush()
+            self.ack(ids)
+            JOURNAL_ROWS_REPLAYED.inc(len(records), worker=self.worker or "unknown")
+            print(f"Replayed {len(records)} journaled rows into {table_id}.")
+            replayed.extend(records)
+        return replayed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JournaledWriter:
+    """
+    Journal rows before handing them to writer, and acknowledge them once
+    writer has sent them. The rows are sent once writer.rows_written grows:
+    at once for streaming, and when a load job flushes the buffer.
+
+    After a failed write nothing more is acknowledged, since it is unknown
+    which rows made it; the next run replays them all.
+    """
+
+    def __init__(self, writer, journal: WorkJournal):
+        self.writer = writer
+        self.journal = journal
+        self.table_id = writer.table_id
+        self._unacked: List[int] = []
+        self._failed = False
+
+    @property
+    def rows_written(self) -> int:
+        return self.writer.rows_written
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        self._unacked.extend(self.journal.append(self.table_id, rows))
+        before = self.writer.rows_written
+        try:
+            self.writer.write(rows)
+        except Exception:
+            self._failed = True
+            raise
+        if self.writer.rows_written > before:
+            self._ack()
+
+    def flush(self) -> None:
+        try:
+            self.writer.flush()
+        except Exception:
+            self._failed = True
+            raise
+        self._ack()
+
+    def _ack(self) -> None:
+        if self._failed:
+            return
+        self.journal.ack(self._unacked)
+        self._unacked = []
+
+
+def journal_path(worker: str) -> str:
+    return os.path.join(JOURNAL_DIR, f".{worker}_journal.sqlite3")
+
+
+def open_journal(worker: str, shard: Optional[Shard] = None) -> Optional[WorkJournal]:
+    """Open the worker's (shard's) journal, or return None if it is disabled or unavailable."""
+    if not JOURNAL_DIR:
+        return None
+    path = journal_path(shard_key(worker, shard))
+    try:
+        journal = WorkJournal(path, worker)
+    except sqlite3.Error as e:
+        print(f"WARNING: work journal disabled, could not open {path}: {e}")
+        return None
+    pending = journal.pending_count()
+    if pending:
+        print(f"Work journal {path} has {pending} rows from an interrupted run; they will be replayed.")
+    return journal
+
+
+def journaled(writer, journal: Optional[WorkJournal]):
+    """writer wrapped in a JournaledWriter, or writer itself without a journal."""
+    return JournaledWriter(writer, journal) if journal is not None else writer
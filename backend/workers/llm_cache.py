@@ -0,0 +1,142 @@
+"""
+Persistent content-hash cache for LLM classifications.
+
+Results are stored in a local SQLite file keyed by a SHA-256 of the prompt
+version, model name and the whitespace-normalized inputs, so identical
+emails (auto-replies, templated closures, reruns after a crash) are only
+sent to Gemini once. The file is bounded by size; when it grows past
+max_bytes the least recently used entries are evicted.
+
+The cache is off unless LLM_CACHE_PATH is set. Workers that should share
+results (e.g. sharded copies on one host) must point at the same file.
+
+Configuration (environment):
+- LLM_CACHE_PATH: SQLite file location (unset or empty disables the cache)
+- LLM_CACHE_MAX_MB: Size budget before LRU eviction kicks in
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+
+# Evict down to this fraction of max_bytes so we don't evict on every put
+_EVICT_TARGET = 0.9
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def make_key(prompt_version: str, model_name: str, *inputs: Optional[str]) -> str:
+    """Build a cache key from the prompt version, model name and normalized inputs."""
+    h = hashlib.sha256()
+    for part in (prompt_version, model_name, *inputs):
+        h.update(normalize_text(part).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite-backed key/value cache with size-based LRU eviction.
+
+    Safe to share between threads of one process.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+              key TEXT PRIMARY KEY,
+              value TEXT NOT NULL,
+              size INTEGER NOT NULL,
+              last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Store value under key, evicting least recently used entries if over budget."""
+        payload = json.dumps(value)
+        size = len(key) + len(payload)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time()),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        target = int(self.max_bytes * _EVICT_TARGET)
+        cursor = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC")
+        victims = []
+        for key, size in cursor:
+            if self._size <= target:
+                break
+            victims.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus the current cache footprint."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._size,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_cache() -> Optional[LLMCache]:
+    """Open the configured cache, or return None if it is disabled or unavailable."""
+    if not CACHE_PATH:
+        return None
+    try:
+        return LLMCache()
+    except sqlite3.Error as e:
+        print(f"WARNING: LLM cache disabled, could not open {CACHE_PATH}: {e}")
+        return None
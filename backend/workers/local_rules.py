@@ -0,0 +1,156 @@
+"""
+Local rules that classify trivially easy messages without calling Gemini.
+
+Empty bodies, auto-replies and short thank-you or "resolved" notes are a
+large share of traffic and always get the same answer from the model. A few
+regular expressions catch them, and the result is tagged with
+LOCAL_MODEL_NAME. Anything the rules are less sure of than MIN_CONFIDENCE
+goes to the LLM as before. Local results keep the worker's prompt_version,
+so discovery treats them as done; model_name tells them apart.
+
+The rules only ever answer "easy" cases: a message with a question, a
+complaint, a promise or anything longer than SHORT_MESSAGE_CHARS is left
+to the model.
+
+Configuration (environment):
+- LOCAL_RULES: "false" sends every message to the LLM
+- LOCAL_RULES_MIN_CONFIDENCE: Lowest confidence at which a local result is
+  used (the rules emit 0.9 to 1.0)
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+LOCAL_MODEL_NAME = "local-rules-v1"
+
+ENABLED = os.getenv("LOCAL_RULES", "true").lower() == "true"
+MIN_CONFIDENCE = float(os.getenv("LOCAL_RULES_MIN_CONFIDENCE", "0.9"))
+
+# Longer messages always go to the model
+SHORT_MESSAGE_CHARS = 280
+
+# Start of the quoted history of a reply: "On ... wrote:", "-----Original Message-----"
+# or a "From:" header line; quoted "> " lines are dropped wherever they are
+_QUOTE_MARKER_RE = re.compile(
+    r"^\s*On .{0,200}wrote:\s*$|^\s*-{2,}\s*Original Message\s*-{2,}|^\s*From:\s.*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_QUOTE_LINE_RE = re.compile(r"^\s*>.*$", re.MULTILINE)
+
+_AUTO_REPLY_RE = re.compile(
+    r"\b(out of (the )?office|automatic reply|auto[- ]?reply|this is an automated|"
+    r"do not reply to this|we have received your (request|email|message|query|complaint)|"
+    r"your (ticket|request|case|complaint) (number|id|no\.?|#)|thank you for contacting)\b",
+    re.IGNORECASE,
+)
+_GRATITUDE_RE = re.compile(r"\b(thanks?|thank you|thx|ty|much appreciated|appreciate it|cheers)\b", re.IGNORECASE)
+_RESOLVED_RE = re.compile(
+    r"\b(resolved|all set|all good|sorted( out)?|works? (now|fine)|working (now|fine)|fixed|"
+    r"received (it|the refund|my refund|the replacement)|no further (action|help|questions)|"
+    r"(you )?can close|please close)\b",
+    re.IGNORECASE,
+)
+# Anything that suggests the conversation is not over
+_OPEN_CUE_RE = re.compile(
+    r"(\?|\b(not|never|still|again|waiting|yet|but|however|why|when|problem|issue with|broken|wrong|"
+    r"please (help|check|send|update|confirm)|i('ll| will)|we('ll| will)|will (send|share|check|get back|update)|"
+    r"let me know|follow[- ]?up)\b|n't\b)",
+    re.IGNORECASE,
+)
+_NEGATIVE_RE = re.compile(
+    r"\b(worst|unacceptable|angry|furious|disappoint\w*|frustrat\w*|terrible|horrible|ridiculous|"
+    r"complain\w*|escalat\w*|fraud|scam|no response|still (not|no|waiting))\b",
+    re.IGNORECASE,
+)
+
+
+def strip_quoted(text: Optional[str]) -> str:
+    """
+    The new part of an email: quoted reply history removed, whitespace collapsed.
+
+    The history is cut at the first quote marker that follows new content, so
+    a message that starts with a marker (e.g. a forwarded "From:" header) is
+    kept whole.
+    """
+    text = _QUOTE_LINE_RE.sub("", text or "")
+    for marker in _QUOTE_MARKER_RE.finditer(text):
+        if any(c.isalnum() for c in text[:marker.start()]):
+            text = text[:marker.start()]
+            break
+    return " ".join(text.split())
+
+
+def _is_short_closing(text: str) -> bool:
+    """A short note that thanks or confirms, with no question, complaint or promise."""
+    return (
+        len(text) <= SHORT_MESSAGE_CHARS
+        and bool(_GRATITUDE_RE.search(text) or _RESOLVED_RE.search(text))
+        and not _OPEN_CUE_RE.search(text)
+        and not _NEGATIVE_RE.search(text)
+    )
+
+
+def classify_sentiment(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Sentiment for an easy message, or None to defer to the LLM.
+
+    Returns {"sentiment", "confidence", "rule"} with sentiment on the 1-5
+    scale of the sentiment prompt (3 for unclear, as the prompt instructs).
+    Only a blank body is "empty"; one with nothing left after stripping the
+    quoted history is deferred.
+    """
+    if not (text or "").strip():
+        return {"sentiment": 3, "confidence": 1.0, "rule": "empty"}
+    body = strip_quoted(text)
+    if not any(c.isalnum() for c in body):
+        return None
+    if _AUTO_REPLY_RE.search(body) and not _NEGATIVE_RE.search(body):
+        return {"sentiment": 3, "confidence": 0.95, "rule": "auto_reply"}
+    if _is_short_closing(body):
+        resolved = bool(_RESOLVED_RE.search(body))
+        both = resolved and bool(_GRATITUDE_RE.search(body))
+        return {"sentiment": 1, "confidence": 0.95 if both else 0.9, "rule": "thanks_resolved" if resolved else "thanks"}
+    return None
+
+
+def classify_thread(last_message: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Thread state from an easy last message, or None to defer to the LLM.
+
+    Returns the same keys as explain_worker.explain_thread_state plus "rule".
+    Only a short note confirming the issue is resolved closes a thread; an
+    empty message, an automatic acknowledgement or a bare "thanks" says too
+    little about the thread, so they are deferred.
+    """
+    body = strip_quoted(last_message)
+    if _is_short_closing(body) and _RESOLVED_RE.search(body):
+        return {
+            "thread_status": "closed",
+            "next_action_owner": "none",
+            "status_reason": "The last message confirms the issue is resolved.",
+            "confidence": 0.95 if _GRATITUDE_RE.search(body) else 0.9,
+            "rule": "thanks_resolved",
+        }
+    return None
+
+
+def classify_sentiments(texts: List[Optional[str]], min_confidence: float = MIN_CONFIDENCE) -> List[Optional[Dict[str, Any]]]:
+    """classify_sentiment for each text, keeping results at or above min_confidence."""
+    if not ENABLED:
+        return [None] * len(texts)
+    results = []
+    for text in texts:
+        result = classify_sentiment(text)
+        results.append(result if result is not None and result["confidence"] >= min_confidence else None)
+    return results
+
+
+def classify_threads(last_messages: List[Optional[str]], min_confidence: float = MIN_CONFIDENCE) -> List[Optional[Dict[str, Any]]]:
+    """classify_thread for each last message, keeping results at or above min_confidence."""
+    if not ENABLED:
+        return [None] * len(last_messages)
+    results = []
+    for text in last_messages:
+        result = classify_thread(text)
+        results.append(result if result is not None and result["confidence"] >= min_confidence else None)
+    return results
@@ -0,0 +1,150 @@
+"""
+Streaming and daemon helpers shared by the LLM workers.
+
+Rows are paged out of BigQuery lazily and processed in bounded chunks, so a
+worker holds at most one page plus one chunk of results in memory and every
+completed chunk is written before the next one starts.
+
+In daemon mode a worker keeps its BigQuery client, model and cache alive and
+polls for new work. The batch size grows while a backlog remains and cycles
+finish within the target time, and shrinks when the backlog drains or model
+latency makes cycles too long. SIGTERM/SIGINT stop the loop after the chunk
+in flight has been flushed.
+"""
+import os
+import signal
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from google.cloud import bigquery
+
+from bq_query import run_query
+
+# Rows fetched per BigQuery results page
+PAGE_SIZE = int(os.getenv("WORKER_PAGE_SIZE", "500"))
+
+# Daemon mode settings
+POLL_INTERVAL_S = float(os.getenv("WORKER_POLL_INTERVAL_S", "60"))
+TARGET_CYCLE_S = float(os.getenv("WORKER_TARGET_CYCLE_S", "120"))
+MIN_BATCH_LIMIT = int(os.getenv("WORKER_MIN_BATCH_LIMIT", "10"))
+MAX_BATCH_LIMIT = int(os.getenv("WORKER_MAX_BATCH_LIMIT", "5000"))
+
+
+def iter_query_rows(
+    bq: bigquery.Client,
+    query: str,
+    job_config: bigquery.QueryJobConfig,
+    page_size: int = PAGE_SIZE,
+    site: str = "query",
+) -> Iterator[Dict[str, Any]]:
+    """
+    Run a query (through bq_query.run_query, as call site site) and yield
+    result rows as dicts, fetching one page at a time.
+    """
+    _, rows = run_query(bq, query, job_config, site=site, page_size=page_size)
+    for row in rows:
+        yield dict(row)
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield successive lists of at most size items from iterable."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def should_stop(stop_event: Optional[threading.Event]) -> bool:
+    """True once a graceful shutdown has been requested."""
+    return stop_event is not None and stop_event.is_set()
+
+
+def install_stop_handlers() -> threading.Event:
+    """Return an event that is set on SIGTERM or SIGINT. Must run on the main thread."""
+    stop_event = threading.Event()
+
+    def _handle(signum, _frame):
+        print(f"Received signal {signum}; finishing in-flight rows before exiting...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _handle)
+    signal.signal(signal.SIGINT, _handle)
+    return stop_event
+
+
+class AdaptiveBatchSizer:
+    """
+    Pick the next batch size from the outcome of the previous cycle.
+
+    - Backlog remaining (the batch came back full): grow, at most 2x per
+      cycle, up to what fits in target_cycle_s at the observed per-row time.
+    - Backlog drained (fewer rows than requested): shrink towards twice what
+      was actually found.
+    - The result is always clamped to [minimum, maximum].
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = MIN_BATCH_LIMIT,
+        maximum: int = MAX_BATCH_LIMIT,
+        target_cycle_s: float = TARGET_CYCLE_S,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_cycle_s = target_cycle_s
+        self.size = self._clamp(initial)
+
+    def _clamp(self, size: int) -> int:
+        return max(self.minimum, min(self.maximum, int(size)))
+
+    def update(self, processed: int, elapsed_s: float) -> int:
+        if processed >= self.size:
+            proposed = self.size * 2
+        else:
+            proposed = processed * 2
+        if processed > 0 and elapsed_s > 0:
+            per_row_s = elapsed_s / processed
+            proposed = min(proposed, int(self.target_cycle_s / per_row_s))
+        self.size = self._clamp(proposed)
+        return self.size
+
+
+def run_daemon(
+    run_once: Callable[[int, threading.Event], int],
+    initial_batch: int,
+    stop_event: Optional[threading.Event] = None,
+    poll_interval_s: float = POLL_INTERVAL_S,
+) -> None:
+    """
+    Call run_once(batch_limit, stop_event) repeatedly until a stop is requested.
+
+    run_once must return the number of rows it fetched. When it returns fewer
+    than requested the backlog is drained and the loop sleeps poll_interval_s
+    before polling again; otherwise the next cycle starts immediately. Errors
+    in a cycle are logged and retried after the poll interval.
+    """
+    if stop_event is None:
+        stop_event = install_stop_handlers()
+    sizer = AdaptiveBatchSizer(initial_batch)
+
+    while not stop_event.is_set():
+        requested = sizer.size
+        started = time.monotonic()
+        try:
+            processed = run_once(requested, stop_event)
+        except Exception as e:
+            print(f"ERROR in worker cycle: {e}")
+            stop_event.wait(poll_interval_s)
+            continue
+        elapsed = time.monotonic() - started
+        next_size = sizer.update(processed, elapsed)
+        print(f"Cycle processed {processed}/{requested} rows in {elapsed:.1f}s; next batch size {next_size}.")
+        if processed < requested:
+            stop_event.wait(poll_interval_s)
+
+    print("Daemon stopped.")
@@ -0,0 +1,217 @@
+"""
+Client-side rate limiting for Gemini calls, shared by both LLM workers.
+
+Every model call goes through RateLimiter.call(), which combines:
+- A request token bucket (LLM_QPS) and an input-token bucket
+  (LLM_TOKENS_PER_MINUTE, estimated from prompt length). 0 disables either
+  limit; negative values are rejected.
+- Adaptive rate: on a quota error (429 / ResourceExhausted) the request
+  rate is halved; every success recovers it additively towards LLM_QPS.
+  Separate processes do not share buckets, so this is what lets several
+  concurrent runs settle just under the project quota.
+- A circuit breaker that fails fast after LLM_BREAKER_THRESHOLD consecutive
+  failures and lets a trial call through after LLM_BREAKER_RESET_S.
+
+Retry loops sleep retry_delay() between attempts: jittered exponential
+backoff, or until the breaker half-opens if it is open.
+
+Every call's latency is recorded in llm_call_duration_seconds (see worker_metrics).
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from worker_metrics import LLM_CALL_DURATION
+
+LLM_QPS = float(os.getenv("LLM_QPS", "10"))  # 0 disables
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))  # 0 disables
+BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1.0"))
+BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "30"))
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+if LLM_QPS < 0 or LLM_TOKENS_PER_MINUTE < 0:
+    raise ValueError(f"LLM_QPS and LLM_TOKENS_PER_MINUTE must be >= 0 (0 disables), got {LLM_QPS} and {LLM_TOKENS_PER_MINUTE}")
+
+# Rough input-token estimate for budget accounting
+CHARS_PER_TOKEN = 4
+
+# Never throttle below this fraction of the configured QPS
+_MIN_RATE_FRACTION = 0.05
+
+
+def backoff_delay(attempt: int, base_s: float = BACKOFF_BASE_S, max_s: float = BACKOFF_MAX_S) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(max_s, base_s * 2**(attempt-1))]."""
+    return random.uniform(0, min(max_s, base_s * (2 ** (attempt - 1))))
+
+
+def is_quota_error(err: Exception) -> bool:
+    """True for Vertex quota/rate errors (HTTP 429, ResourceExhausted)."""
+    text = f"{type(err).__name__} {err}"
+    return "429" in text or "ResourceExhausted" in text or "Quota exceeded" in text
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+    def __init__(self, retry_after_s: float):
+        super().__init__(f"Circuit breaker open; retry in {retry_after_s:.1f}s")
+        self.retry_after_s = retry_after_s
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until enough tokens are available."""
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        if rate_per_s <= 0:
+            raise ValueError(f"TokenBucket rate must be positive, got {rate_per_s}")
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait_s = (amount - self._tokens) / self.rate_per_s
+            time.sleep(wait_s)
+
+
+class CircuitBreaker:
+    """Open after threshold consecutive failures; half-open after reset_s."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_s: float = BREAKER_RESET_S):
+        self.threshold = threshold
+        self.reset_s = reset_s
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_s - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(max(remaining, 0.0))
+            # Half-open: let exactly one trial call through
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    print(f"Circuit breaker opened after {self._failures} consecutive failures.")
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class RateLimiter:
+    """
+    QPS + tokens-per-minute limiter with AIMD rate adaptation and a circuit breaker.
+
+    qps=0 or tokens_per_minute=0 disables that limit (and, for qps, the
+    adaptation); negative values raise ValueError.
+    """
+
+    def __init__(
+        self,
+        qps: float = LLM_QPS,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        if qps < 0 or tokens_per_minute < 0:
+            raise ValueError(f"LLM_QPS and LLM_TOKENS_PER_MINUTE must be >= 0, got {qps} and {tokens_per_minute}")
+        self.max_qps = qps
+        self.requests = TokenBucket(qps, capacity=max(1.0, qps)) if qps else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute) if tokens_per_minute else None
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+
+    def _on_success(self) -> None:
+        self.breaker.record_success()
+        if self.requests is None:
+            return
+        with self._lock:
+            # Additive increase: recover ~1 QPS per second of sustained success
+            step = 1.0 / max(self.requests.rate_per_s, 1.0)
+            self.requests.rate_per_s = min(self.max_qps, self.requests.rate_per_s + step)
+
+    def _on_failure(self, err: Exception) -> None:
+        self.breaker.record_failure()
+        if is_quota_error(err) and self.requests is not None:
+            with self._lock:
+                floor = self.max_qps * _MIN_RATE_FRACTION
+                self.requests.rate_per_s = max(floor, self.requests.rate_per_s / 2)
+                print(f"Quota error; request rate lowered to {self.requests.rate_per_s:.2f} QPS.")
+
+    @property
+    def current_qps(self) -> float:
+        return self.requests.rate_per_s if self.requests is not None else float("inf")
+
+    def call(self, fn: Callable[..., Any], prompt: str) -> Any:
+        """Wait for quota, call fn(prompt) and feed the outcome back into the limiter."""
+        self.breaker.before_call()
+        if self.requests is not None:
+            self.requests.acquire()
+        if self.tokens is not None:
+            self.tokens.acquire(len(prompt) / CHARS_PER_TOKEN)
+        started = time.monotonic()
+        try:
+            result = fn(prompt)
+        except Exception as e:
+            LLM_CALL_DURATION.observe(
+                time.monotonic() - started, outcome="quota_error" if is_quota_error(e) else "error"
+            )
+            self._on_failure(e)
+            raise
+        LLM_CALL_DURATION.observe(time.monotonic() - started, outcome="ok")
+        self._on_success()
+        return result
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter shared by every worker thread."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def set_rate_limiter(limiter: RateLimiter) -> None:
+    """Replace the process-wide limiter (e.g. to lift limits in offline benchmarks)."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+
+
+def retry_delay(err: Exception, attempt: int) -> float:
+    """Delay before the next attempt: backoff, or until the breaker half-opens."""
+    delay = backoff_delay(attempt)
+    if isinstance(err, CircuitOpenError):
+        delay = max(delay, err.retry_after_s)
+    return delay
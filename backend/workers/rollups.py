@@ -0,0 +1,288 @@
+"""
+Pre-aggregated rollups over thread_state_final.
+
+- monthly_thread_rollup: one row per month with the thread count and the
+  per-sentiment counts for the 1-5 scale, so the monthly endpoint reads at
+  most 24 small rows instead of regrouping every thread.
+- daily_thread_rollup: thread counts per day and (thread_status, sentiment,
+  next_action_owner, model_name). The aggregates endpoint sums it up to
+  day/week/month buckets and any subset of those dimensions; a day has at
+  most a few hundred combinations, so charts read kilobytes.
+
+A refresh only recomputes the periods that can have changed: those of the
+refreshed threads, the periods they were counted in before the refresh
+(previous_days, read by thread_state_final before its MERGE: a thread that
+gets a new message moves out of its old period), plus everything in the
+latest ROLLUP_RECENT_MONTHS months. A full refresh recomputes every period
+with threads as well as every period already in the rollup.
+"""
+import os
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Sequence
+
+from google.cloud import bigquery
+
+from bq_query import run_query
+
+PROJECT_ID = "clariversev1"
+DATASET = "flipkart_slices"
+
+THREAD_STATE_FINAL_TABLE = "thread_state_final"
+MONTHLY_ROLLUP_TABLE = "monthly_thread_rollup"
+DAILY_ROLLUP_TABLE = "daily_thread_rollup"
+
+ROLLUP_RECENT_MONTHS = int(os.getenv("ROLLUP_RECENT_MONTHS", "2"))
+
+# Breakdown dimensions stored in daily_thread_rollup
+ROLLUP_DIMENSIONS = ["thread_status", "sentiment", "next_action_owner", "model_name"]
+
+# (column, thread_state_final.sentiment label) for the 1-5 scale
+SENTIMENT_COUNT_COLUMNS = [
+    ("happy_threads", "Happy"),
+    ("bit_irritated_threads", "Bit Irritated"),
+    ("moderately_concerned_threads", "Moderately Concerned"),
+    ("anger_threads", "Anger"),
+    ("frustrated_threads", "Frustrated"),
+]
+
+
+# Rollup table and period column for each _periods_to_refresh granularity
+_ROLLUP_PERIOD_COLUMNS = {
+    "MONTH": (MONTHLY_ROLLUP_TABLE, "month_start"),
+    "DAY": (DAILY_ROLLUP_TABLE, "day"),
+}
+
+
+def _table_id(name: str) -> str:
+    return f"{PROJECT_ID}.{DATASET}.{name}"
+
+
+def ensure_monthly_rollup_table(bq: bigquery.Client) -> None:
+    """Create the monthly_thread_rollup table if it doesn't exist."""
+    table_id = _table_id(MONTHLY_ROLLUP_TABLE)
+    try:
+        bq.get_table(table_id)
+    except Exception:
+        print(f"Creating table {table_id}...")
+        schema = [
+            bigquery.SchemaField("month_start", "DATE", mode="REQUIRED"),
+            bigquery.SchemaField("month", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("thread_count", "INTEGER", mode="REQUIRED"),
+        ] + [
+            bigquery.SchemaField(column, "INTEGER", mode="REQUIRED")
+            for column, _ in SENTIMENT_COUNT_COLUMNS
+        ] + [
+            bigquery.SchemaField("refreshed_at", "TIMESTAMP", mode="REQUIRED"),
+        ]
+        bq.create_table(bigquery.Table(table_id, schema=schema))
+        print(f"Table {table_id} created successfully.")
+
+
+def ensure_daily_rollup_table(bq: bigquery.Client) -> None:
+    """Create the daily_thread_rollup table if it doesn't exist."""
+    table_id = _table_id(DAILY_ROLLUP_TABLE)
+    try:
+        bq.get_table(table_id)
+    except Exception:
+        print(f"Creating table {table_id}...")
+        schema = [
+            bigquery.SchemaField("day", "DATE", mode="REQUIRED"),
+        ] + [
+            bigquery.SchemaField(dimension, "STRING") for dimension in ROLLUP_DIMENSIONS
+        ] + [
+            bigquery.SchemaField("thread_count", "INTEGER", mode="REQUIRED"),
+            bigquery.SchemaField("refreshed_at", "TIMESTAMP", mode="REQUIRED"),
+        ]
+        table = bigquery.Table(table_id, schema=schema)
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY, field="day"
+        )
+        table.clustering_fields = ROLLUP_DIMENSIONS
+        bq.create_table(table)
+        print(f"Table {table_id} created successfully.")
+
+
+def ensure_rollup_tables(bq: bigquery.Client) -> None:
+    """Create every rollup table that is missing."""
+    ensure_monthly_rollup_table(bq)
+    ensure_daily_rollup_table(bq)
+
+
+def _periods_to_refresh(
+    bq: bigquery.Client,
+    granularity: str,
+    thread_ids: Optional[Iterable[str]],
+    since: Optional[datetime],
+    previous_days: Sequence[date] = (),
+) -> List[date]:
+    """
+    First days of the periods (granularity DAY or MONTH) touched by
+    thread_ids / rows updated since, the periods of previous_days, plus every
+    period of the recent months. A full refresh (neither thread_ids nor
+    since) adds every period already in the granularity's rollup table, so
+    periods that lost all their threads are recounted too.
+    """
+    params = [
+        bigquery.ScalarQueryParameter("recent_months", "INT64", ROLLUP_RECENT_MONTHS),
+        bigquery.ArrayQueryParameter("previous_days", "DATE", sorted(set(previous_days))),
+    ]
+    rolled_up = ""
+    if thread_ids is not None:
+        condition = "thread_id IN UNNEST(@thread_ids)"
+        params.append(bigquery.ArrayQueryParameter("thread_ids", "STRING", sorted(set(thread_ids))))
+    elif since is not None:
+        condition = "updated_at >= @since"
+        params.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+    else:
+        condition = "TRUE"
+        table, column = _ROLLUP_PERIOD_COLUMNS[granularity]
+        rolled_up = f"""
+    UNION DISTINCT
+    SELECT DISTINCT {column} FROM `{_table_id(table)}`"""
+    query = f"""
+    SELECT DISTINCT DATE_TRUNC(DATE(last_message_ts), {granularity}) AS period_start
+    FROM `{_table_id(THREAD_STATE_FINAL_TABLE)}`
+    WHERE last_message_ts IS NOT NULL AND {condition}
+    UNION DISTINCT
+    SELECT DATE_TRUNC(day, {granularity}) FROM UNNEST(@previous_days) AS day
+    UNION DISTINCT
+    SELECT period_start
+    FROM UNNEST(GENERATE_DATE_ARRAY(
+      DATE_SUB(DATE_TRUNC(CURRENT_DATE(), MONTH), INTERVAL @recent_months - 1 MONTH),
+      CURRENT_DATE(),
+      INTERVAL 1 {granularity}
+    )) AS period_start{rolled_up}
+    """
+    _, rows = run_query(
+        bq, query, bigquery.QueryJobConfig(query_parameters=params), site=f"rollup_periods_{granularity.lower()}"
+    )
+    return sorted(row["period_start"] for row in rows)
+
+
+def refresh_monthly_rollup(
+    bq: bigquery.Client,
+    thread_ids: Optional[Iterable[str]] = None,
+    since: Optional[datetime] = None,
+    previous_days: Sequence[date] = (),
+) -> None:
+    """
+    Recompute the rollup rows for the months that thread_ids (or the
+    thread_state_final rows updated at or after since) fall in, the months
+    of previous_days (where those threads were counted before), plus the
+    recent months; with neither, recompute every month.
+    """
+    months = _periods_to_refresh(bq, "MONTH", thread_ids, since, previous_days)
+    if not months:
+        return
+
+    counts = ",\n          ".join(
+        f"COUNTIF(sentiment = '{label}') AS {column}" for column, label in SENTIMENT_COUNT_COLUMNS
+    )
+    source_counts = ",\n        ".join(
+        f"COALESCE(a.{column}, 0) AS {column}" for column, _ in SENTIMENT_COUNT_COLUMNS
+    )
+    updates = ",\n      ".join(f"{column} = s.{column}" for column, _ in SENTIMENT_COUNT_COLUMNS)
+    columns = ", ".join(column for column, _ in SENTIMENT_COUNT_COLUMNS)
+    values = ", ".join(f"s.{column}" for column, _ in SENTIMENT_COUNT_COLUMNS)
+
+    query = f"""
+    MERGE `{_table_id(MONTHLY_ROLLUP_TABLE)}` r
+    USING (
+      SELECT
+        m AS month_start,
+        FORMAT_DATE('%Y-%m', m) AS month,
+        COALESCE(a.thread_count, 0) AS thread_count,
+        {source_counts}
+      FROM UNNEST(@months) AS m
+      LEFT JOIN (
+        SELECT
+          DATE_TRUNC(DATE(last_message_ts), MONTH) AS month_start,
+          COUNT(*) AS thread_count,
+          {counts}
+        FROM `{_table_id(THREAD_STATE_FINAL_TABLE)}`
+        -- Prunes thread_state_final partitions older than the oldest month
+        WHERE DATE(last_message_ts) >= @min_month
+        GROUP BY month_start
+      ) a
+      ON a.month_start = m
+    ) s
+    ON r.month_start = s.month_start
+    WHEN MATCHED THEN UPDATE SET
+      thread_count = s.thread_count,
+      {updates},
+      refreshed_at = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT (month_start, month, thread_count, {columns}, refreshed_at)
+    VALUES (s.month_start, s.month, s.thread_count, {values}, CURRENT_TIMESTAMP())
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("months", "DATE", months),
+            bigquery.ScalarQueryParameter("min_month", "DATE", months[0]),
+        ]
+    )
+    run_query(bq, query, job_config, site="monthly_rollup_merge")
+    print(f"monthly_thread_rollup refreshed for {len(months)} months ({months[0]:%Y-%m} to {months[-1]:%Y-%m}).")
+
+
+def refresh_daily_rollup(
+    bq: bigquery.Client,
+    thread_ids: Optional[Iterable[str]] = None,
+    since: Optional[datetime] = None,
+    previous_days: Sequence[date] = (),
+) -> None:
+    """
+    Recompute daily_thread_rollup for the days that thread_ids (or the
+    thread_state_final rows updated at or after since) fall in, previous_days
+    (where those threads were counted before), plus every day of the recent
+    months; with neither, recompute every day.
+
+    Dimension values can be NULL, which MERGE can't match on, so the days
+    are replaced with DELETE + INSERT in one transaction.
+    """
+    days = _periods_to_refresh(bq, "DAY", thread_ids, since, previous_days)
+    if not days:
+        return
+
+    dimensions = ", ".join(ROLLUP_DIMENSIONS)
+    query = f"""
+    BEGIN TRANSACTION;
+
+    DELETE FROM `{_table_id(DAILY_ROLLUP_TABLE)}`
+    WHERE day IN UNNEST(@days);
+
+    INSERT INTO `{_table_id(DAILY_ROLLUP_TABLE)}` (day, {dimensions}, thread_count, refreshed_at)
+    SELECT
+      DATE(last_message_ts) AS day,
+      {dimensions},
+      COUNT(*) AS thread_count,
+      CURRENT_TIMESTAMP() AS refreshed_at
+    FROM `{_table_id(THREAD_STATE_FINAL_TABLE)}`
+    -- The range prunes thread_state_final partitions; IN keeps only the listed days
+    WHERE DATE(last_message_ts) BETWEEN @min_day AND @max_day
+      AND DATE(last_message_ts) IN UNNEST(@days)
+    GROUP BY day, {dimensions};
+
+    COMMIT TRANSACTION;
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("days", "DATE", days),
+            bigquery.ScalarQueryParameter("min_day", "DATE", days[0]),
+            bigquery.ScalarQueryParameter("max_day", "DATE", days[-1]),
+        ]
+    )
+    run_query(bq, query, job_config, site="daily_rollup_refresh")
+    print(f"daily_thread_rollup refreshed for {len(days)} days ({days[0]} to {days[-1]}).")
+
+
+def refresh_rollups(
+    bq: bigquery.Client,
+    thread_ids: Optional[Iterable[str]] = None,
+    since: Optional[datetime] = None,
+    previous_days: Sequence[date] = (),
+) -> None:
+    """Refresh every rollup for the given scope (see refresh_monthly_rollup)."""
+    if thread_ids is not None:
+        thread_ids = set(thread_ids)
+    refresh_monthly_rollup(bq, thread_ids, since, previous_days)
+    refresh_daily_rollup(bq, thread_ids, since, previous_days)
@@ -1,8 +1,12 @@
 import json
+import os
 import re
+import sys
+import threading
 import time
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 from google.cloud import bigquery
 
@@ -10,6 +14,17 @@ from google.cloud import bigquery
 import vertexai
 from vertexai.generative_models import GenerativeModel
 
+from bq_writer import get_writer
+from journal import WorkJournal, journaled, open_journal
+from llm_cache import LLMCache, make_key, open_cache
+from local_rules import LOCAL_MODEL_NAME, classify_sentiments
+from worker_metrics import LLM_PARSE_FAILURES, LLM_RETRIES, LOCAL_RULE_RESULTS, record_run, report
+from pipeline import chunked, iter_query_rows, run_daemon, should_stop
+from rate_limit import get_rate_limiter, retry_delay
+from sharding import Shard, resolve_shard, shard_condition, shard_key, shard_params
+from thread_state_final import REFRESH_AFTER_WRITE, ensure_materialized_tables, refresh_after_write
+from watermark import WATERMARK_TABLE, ensure_watermark_table, get_watermark, max_ts, min_ts, save_watermark
+
 PROJECT_ID = "clariversev1"
 DATASET = "flipkart_slices"
 REGION = "us-central1"
@@ -17,40 +32,90 @@ REGION = "us-central1"
 PROMPT_VERSION = "sentiment_v0.2"  # Updated to 1-5 scale
 MODEL_NAME = "gemini-2.0-flash"  # Updated to valid model name
 
-BATCH_LIMIT = 300  # number of threads/messages to score per run
+BATCH_LIMIT = int(os.getenv("SENTIMENT_BATCH_LIMIT", "300"))  # number of threads/messages to score per run
 MAX_RETRIES = 3
 
+# Scored rows are inserted every FLUSH_SIZE messages instead of once at the end
+FLUSH_SIZE = int(os.getenv("SENTIMENT_FLUSH_SIZE", "100"))
+
+# Incremental discovery only looks at threads with events newer than the
+# stored watermark (minus a lookback for late-arriving events) and falls back
+# to a full scan every FULL_RECONCILE_HOURS.
+INCREMENTAL_DISCOVERY = os.getenv("SENTIMENT_INCREMENTAL", "true").lower() == "true"
+WATERMARK_LOOKBACK_MINUTES = int(os.getenv("SENTIMENT_WATERMARK_LOOKBACK_MINUTES", "60"))
+FULL_RECONCILE_HOURS = float(os.getenv("SENTIMENT_FULL_RECONCILE_HOURS", "24"))
+WORKER_NAME = "sentiment"
+
+# Number of Gemini requests kept in flight at once
+SCORING_CONCURRENCY = int(os.getenv("SENTIMENT_CONCURRENCY", "16"))
+
+# Batched mode packs several emails into one prompt to amortize the rubric.
+# Packing stops at whichever limit is hit first.
+BATCHED_MODE = os.getenv("SENTIMENT_BATCHED", "false").lower() == "true"
+MAX_MESSAGES_PER_PROMPT = int(os.getenv("SENTIMENT_MAX_MESSAGES_PER_PROMPT", "25"))
+MAX_PROMPT_BODY_CHARS = int(os.getenv("SENTIMENT_MAX_PROMPT_BODY_CHARS", "20000"))
+
+SENTIMENT_SCALE = """\
+1 – Happy: The customer expresses satisfaction, appreciation, or a clearly positive experience.
+2 – Bit Irritated: The customer shows mild annoyance or impatience without strong emotional distress.
+3 – Moderately Concerned: The customer expresses concern or worry that has not escalated into frustration or anger.
+4 – Anger: The customer shows clear frustration or anger, often using strong or confrontational language.
+5 – Frustrated: The customer is extremely upset, indicating repeated issues, delays, or severe dissatisfaction."""
+
 
-def fetch_latest_messages_to_score(bq: bigquery.Client) -> List[Dict[str, Any]]:
+def fetch_latest_messages_to_score(
+    bq: bigquery.Client,
+    limit: int = BATCH_LIMIT,
+    since: Optional[datetime] = None,
+    shard: Optional[Shard] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the latest unscored message of each thread, paging through the results.
+
+    With since=None this is a full scan over interaction_event. With a since
+    timestamp only threads whose latest event is newer are considered (a
+    thread's latest message is necessarily one of its new events). Either
+    way messages come oldest first, so a run that stops before the end can
+    still advance the watermark past what it handled.
+    With a shard only the shard's threads are considered (see sharding).
+    """
+    conditions = [shard_condition(shard)]
+    if since is not None:
+        conditions.append("event_ts > @since")
+    conditions = [c for c in conditions if c]
+    event_filter = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     query = f"""
     WITH latest_msg AS (
       SELECT
         thread_id,
         ARRAY_AGG(STRUCT(message_id, body_text, event_ts) ORDER BY event_ts DESC LIMIT 1)[OFFSET(0)] AS lm
       FROM `{PROJECT_ID}.{DATASET}.interaction_event`
+      {event_filter}
       GROUP BY thread_id
     )
     SELECT
       latest_msg.thread_id AS thread_id,
       lm.message_id AS message_id,
-      lm.body_text AS body_text
+      lm.body_text AS body_text,
+      lm.event_ts AS event_ts
     FROM latest_msg
     LEFT JOIN `{PROJECT_ID}.{DATASET}.message_sentiment` ms
       ON ms.thread_id = latest_msg.thread_id
      AND ms.message_id = latest_msg.lm.message_id
      AND ms.prompt_version = @prompt_version
     WHERE ms.message_id IS NULL
-    ORDER BY lm.event_ts DESC
+    ORDER BY lm.event_ts ASC
     LIMIT @limit
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("prompt_version", "STRING", PROMPT_VERSION),
-            bigquery.ScalarQueryParameter("limit", "INT64", BATCH_LIMIT),
-        ]
-    )
-    rows = bq.query(query, job_config=job_config).result()
-    return [dict(r) for r in rows]
+    params = [
+        bigquery.ScalarQueryParameter("prompt_version", "STRING", PROMPT_VERSION),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    if since is not None:
+        params.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+    params.extend(shard_params(shard))
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    return iter_query_rows(bq, query, job_config, site="sentiment_discovery")
 
 
 def extract_json_from_response(text: str) -> dict:
@@ -72,6 +137,18 @@ def extract_json_from_response(text: str) -> dict:
     return json.loads(text)
 
 
+def _validate_sentiment(data: dict) -> Tuple[int, float]:
+    """Validate a parsed model result and return (sentiment_score, confidence_float)."""
+    sentiment = int(data.get("sentiment", 0))
+    confidence = float(data.get("confidence", 0.0))
+
+    if sentiment not in (1, 2, 3, 4, 5):
+        raise ValueError(f"Invalid sentiment: {sentiment}. Must be 1-5.")
+    if not (0.0 <= confidence <= 1.0):
+        raise ValueError(f"Invalid confidence: {confidence}. Must be 0.0-1.0.")
+    return sentiment, confidence
+
+
 def call_gemini_sentiment(model: GenerativeModel, text: str) -> Tuple[int, float]:
     """
     Returns (sentiment_score, confidence_float).
@@ -92,11 +169,7 @@ Given the email text, return JSON with:
 - confidence: number between 0 and 1
 
 Sentiment Scale:
-1 – Happy: The customer expresses satisfaction, appreciation, or a clearly positive experience.
-2 – Bit Irritated: The customer shows mild annoyance or impatience without strong emotional distress.
-3 – Moderately Concerned: The customer expresses concern or worry that has not escalated into frustration or anger.
-4 – Anger: The customer shows clear frustration or anger, often using strong or confrontational language.
-5 – Frustrated: The customer is extremely upset, indicating repeated issues, delays, or severe dissatisfaction.
+{SENTIMENT_SCALE}
 
 Rules:
 - Choose the sentiment score (1-5) that best matches the customer's emotional state.
@@ -107,35 +180,188 @@ Rules:
 Email text:
 {text}
 """
-    # Simple retry logic
+    # Retry with jittered exponential backoff; quota is shared via the rate limiter
+    limiter = get_rate_limiter()
     last_err = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = model.generate_content(prompt)
+            resp = limiter.call(model.generate_content, prompt)
             if not resp or not resp.text:
                 raise ValueError("Empty response from model")
             
             raw = resp.text.strip()
             data = extract_json_from_response(raw)
             
-            sentiment = int(data.get("sentiment", 0))
-            confidence = float(data.get("confidence", 0.0))
-            
-            if sentiment not in (1, 2, 3, 4, 5):
-                raise ValueError(f"Invalid sentiment: {sentiment}. Must be 1-5.")
-            if not (0.0 <= confidence <= 1.0):
-                raise ValueError(f"Invalid confidence: {confidence}. Must be 0.0-1.0.")
-            return sentiment, confidence
+            return _validate_sentiment(data)
         except Exception as e:
             last_err = e
+            # Unparseable or invalid answers raise ValueError (json.JSONDecodeError included)
+            if isinstance(e, ValueError):
+                LLM_PARSE_FAILURES.inc(worker=WORKER_NAME)
             if attempt < MAX_RETRIES:
+                LLM_RETRIES.inc(worker=WORKER_NAME)
                 print(f"Attempt {attempt} failed: {e}. Retrying...")
-                time.sleep(1.5 * attempt)
+                time.sleep(retry_delay(e, attempt))
             else:
                 print(f"Final error - Response was: {resp.text if 'resp' in locals() else 'No response'}")
     raise RuntimeError(f"Gemini call failed after retries: {last_err}")
 
 
+def extract_json_array_from_response(text: str) -> list:
+    """Extract a JSON array from response, handling markdown code blocks and extra text."""
+    text = text.strip()
+    if not text:
+        raise ValueError("Empty response from model")
+
+    # Try to find the array in markdown code blocks
+    json_match = re.search(r'```(?:json)?\s*(\[.*\])\s*```', text, re.DOTALL)
+    if json_match:
+        text = json_match.group(1)
+
+    # Otherwise take everything between the first '[' and the last ']'
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON array found in response")
+
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, list):
+        raise ValueError("Response is not a JSON array")
+    return data
+
+
+def build_batch_prompt(texts: List[str]) -> str:
+    """Build one prompt that classifies several emails, identified as 1..N."""
+    emails = "\n\n".join(
+        f"<<<EMAIL id={i}>>>\n{text}\n<<<END EMAIL id={i}>>>"
+        for i, text in enumerate(texts, start=1)
+    )
+    return f"""
+You are a strict sentiment classifier.
+
+Task:
+You are given {len(texts)} emails, each wrapped in <<<EMAIL id=N>>> markers.
+Return a JSON array with exactly one object per email, each with:
+- id: the integer id of the email
+- sentiment: an integer between 1 and 5
+- confidence: number between 0 and 1
+
+Sentiment Scale:
+{SENTIMENT_SCALE}
+
+Rules:
+- Classify every email independently; do not let one email influence another.
+- Choose the sentiment score (1-5) that best matches the customer's emotional state.
+- Use 3 if the sentiment is truly mixed or unclear.
+- Confidence reflects your certainty in the classification (0.0 to 1.0).
+- Output MUST be a valid JSON array only. No extra text.
+
+Emails:
+{emails}
+"""
+
+
+def parse_batch_response(text: str, expected: int) -> Dict[int, Tuple[int, float]]:
+    """
+    Parse a batched response into {id: (sentiment_score, confidence_float)}.
+
+    Entries with an unknown id or that fail validation are dropped, so the
+    caller can tell which emails still need to be scored.
+    """
+    parsed: Dict[int, Tuple[int, float]] = {}
+    for entry in extract_json_array_from_response(text):
+        try:
+            entry_id = int(entry.get("id"))
+            if 1 <= entry_id <= expected:
+                parsed[entry_id] = _validate_sentiment(entry)
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return parsed
+
+
+def pack_batches(
+    texts: List[str],
+    max_messages: int = MAX_MESSAGES_PER_PROMPT,
+    max_chars: int = MAX_PROMPT_BODY_CHARS,
+) -> List[List[int]]:
+    """
+    Greedily group text indices into prompts bounded by count and total length.
+
+    Short emails are packed densely; long ones get fewer neighbours. An email
+    longer than max_chars is placed in a prompt by itself.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for idx, text in enumerate(texts):
+        size = len(text)
+        if current and (len(current) >= max_messages or current_chars + size > max_chars):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(idx)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def call_gemini_sentiment_batch(model: GenerativeModel, texts: List[str]) -> List[Optional[Tuple[int, float]]]:
+    """
+    Score several emails with as few prompts as possible.
+
+    Sends all texts in one prompt. When the response is malformed or misses
+    some ids, the missing emails are retried: together if some were answered,
+    otherwise as two halves. A single remaining email goes through
+    call_gemini_sentiment with its normal retries. Returns results aligned
+    with texts; None marks an email that could not be scored.
+    """
+    results: List[Optional[Tuple[int, float]]] = [None] * len(texts)
+    _score_batch_into(model, texts, list(range(len(texts))), results)
+    return results
+
+
+def _score_batch_into(
+    model: GenerativeModel,
+    texts: List[str],
+    indices: List[int],
+    results: List[Optional[Tuple[int, float]]],
+) -> None:
+    if not indices:
+        return
+    if len(indices) == 1:
+        idx = indices[0]
+        try:
+            results[idx] = call_gemini_sentiment(model, texts[idx])
+        except Exception as e:
+            print(f"Single-message fallback failed: {e}")
+        return
+
+    parsed: Dict[int, Tuple[int, float]] = {}
+    try:
+        resp = get_rate_limiter().call(model.generate_content, build_batch_prompt([texts[i] for i in indices]))
+        if not resp or not resp.text:
+            raise ValueError("Empty response from model")
+        parsed = parse_batch_response(resp.text, len(indices))
+    except Exception as e:
+        if isinstance(e, ValueError):
+            LLM_PARSE_FAILURES.inc(worker=WORKER_NAME)
+        print(f"Batch of {len(indices)} failed: {e}. Splitting...")
+
+    missing = []
+    for pos, idx in enumerate(indices, start=1):
+        if pos in parsed:
+            results[idx] = parsed[pos]
+        else:
+            missing.append(idx)
+
+    if len(missing) < len(indices):
+        # Partial answer: retry only what is missing
+        _score_batch_into(model, texts, missing, results)
+    else:
+        mid = len(missing) // 2
+        _score_batch_into(model, texts, missing[:mid], results)
+        _score_batch_into(model, texts, missing[mid:], results)
+
+
 def ensure_message_sentiment_table(bq: bigquery.Client) -> None:
     """Create the message_sentiment table if it doesn't exist."""
     table_id = f"{PROJECT_ID}.{DATASET}.message_sentiment"
@@ -159,54 +385,364 @@ def ensure_message_sentiment_table(bq: bigquery.Client) -> None:
         print(f"Table {table_id} created successfully.")
 
 
-def insert_sentiments(bq: bigquery.Client, rows: List[Dict[str, Any]]) -> None:
-    table_id = f"{PROJECT_ID}.{DATASET}.message_sentiment"
-    errors = bq.insert_rows_json(table_id, rows)  # streaming insert
-    if errors:
-        raise RuntimeError(f"BigQuery insert errors: {errors}")
-
-
-def main():
-    bq = bigquery.Client(project=PROJECT_ID)
-
-    # Ensure table exists
-    ensure_message_sentiment_table(bq)
+def sentiment_writer(bq: bigquery.Client, mode: str = None):
+    """
+    Writer for message_sentiment (see bq_writer). A message is scored once per
+    prompt version, so that pair is the insertId for retry-safe streaming.
+    """
+    return get_writer(
+        bq,
+        f"{PROJECT_ID}.{DATASET}.message_sentiment",
+        row_id=lambda r: f"{r['message_id']}:{r['prompt_version']}",
+        mode=mode,
+    )
 
-    # Init Vertex AI
-    vertexai.init(project=PROJECT_ID, location=REGION)
-    model = GenerativeModel(MODEL_NAME)
 
-    to_score = fetch_latest_messages_to_score(bq)
-    if not to_score:
-        print("No new latest messages to score.")
+def insert_sentiments(bq: bigquery.Client, rows: List[Dict[str, Any]], writer=None) -> None:
+    """Write rows through writer, or through a one-off default writer that is flushed immediately."""
+    if writer is not None:
+        writer.write(rows)
         return
+    writer = sentiment_writer(bq)
+    writer.write(rows)
+    writer.flush()
+
+
+def score_messages(
+    model: GenerativeModel,
+    items: List[Dict[str, Any]],
+    concurrency: int = SCORING_CONCURRENCY,
+    batched: bool = BATCHED_MODE,
+    cache: Optional[LLMCache] = None,
+) -> List[Optional[Tuple[int, float]]]:
+    """
+    Score message bodies concurrently with a bounded thread pool.
+
+    Bodies found in the cache are not sent to the model, and identical bodies
+    within the batch are scored once. In single mode each remaining body goes
+    through call_gemini_sentiment, so per-row retry and validation are
+    unchanged. In batched mode bodies are packed into multi-email prompts
+    (see pack_batches) and each prompt is one pool task. Results are returned
+    in the same order as items; a message that failed after all retries
+    yields None.
+    """
+    results: List[Optional[Tuple[int, float]]] = [None] * len(items)
+    if not items:
+        return results
+
+    # Map each distinct body to the rows that share it, skipping cache hits
+    pending: Dict[str, List[int]] = {}
+    texts: List[str] = []
+    for idx, item in enumerate(items):
+        text = item.get("body_text") or ""
+        key = make_key(PROMPT_VERSION, MODEL_NAME, text)
+        if key in pending:
+            pending[key].append(idx)
+            continue
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            results[idx] = (cached["sentiment"], cached["confidence"])
+        else:
+            pending[key] = [idx]
+            texts.append(text)
+    keys = list(pending)
+    if not keys:
+        return results
+
+    groups = pack_batches(texts) if batched else [[i] for i in range(len(texts))]
+
+    def _score_group(indices: List[int]) -> List[Optional[Tuple[int, float]]]:
+        if len(indices) == 1:
+            return [call_gemini_sentiment(model, texts[indices[0]])]
+        return call_gemini_sentiment_batch(model, [texts[i] for i in indices])
+
+    workers = max(1, min(concurrency, len(groups)))
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_score_group, indices): indices for indices in groups}
+        for future in as_completed(futures):
+            indices = futures[future]
+            try:
+                for i, score in zip(indices, future.result()):
+                    if score is None:
+                        continue
+                    for idx in pending[keys[i]]:
+                        results[idx] = score
+                    if cache:
+                        cache.put(keys[i], {"sentiment": score[0], "confidence": score[1]})
+            except Exception as e:
+                print(f"Skipping message {items[pending[keys[indices[0]]][0]].get('message_id')}: {e}")
+            previous, done = done, done + len(indices)
+            if done // 20 > previous // 20:
+                print(f"Scored {done}/{len(texts)} distinct messages...")
+    return results
+
+
+def score_chunk(
+    model: GenerativeModel,
+    items: List[Dict[str, Any]],
+    concurrency: int = SCORING_CONCURRENCY,
+    batched: bool = BATCHED_MODE,
+    cache: Optional[LLMCache] = None,
+) -> Tuple[List[Optional[Tuple[int, float]]], List[str]]:
+    """
+    Score items, answering easy messages with the local rules first.
 
+    Messages the rules are confident about (empty bodies, auto-replies,
+    short thank-you notes; see local_rules) never reach Gemini; the rest go
+    through score_messages. Returns (scores, model_names) aligned with items.
+    """
+    local = classify_sentiments([item.get("body_text") for item in items])
+    remote = [i for i, result in enumerate(local) if result is None]
+    scores: List[Optional[Tuple[int, float]]] = [None] * len(items)
+    model_names = [MODEL_NAME] * len(items)
+    for i, result in enumerate(local):
+        if result is not None:
+            scores[i] = (result["sentiment"], result["confidence"])
+            model_names[i] = LOCAL_MODEL_NAME
+            LOCAL_RULE_RESULTS.inc(worker=WORKER_NAME, rule=result["rule"])
+    remote_scores = score_messages(model, [items[i] for i in remote], concurrency, batched, cache)
+    for i, score in zip(remote, remote_scores):
+        scores[i] = score
+    return scores, model_names
+
+
+def build_sentiment_rows(
+    items: List[Dict[str, Any]],
+    scores: List[Optional[Tuple[int, float]]],
+    created_at: str,
+    model_names: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Turn scored items into message_sentiment rows, dropping failed ones."""
     out_rows = []
-    now_ts = datetime.now(timezone.utc).isoformat()
-
-    for i, item in enumerate(to_score, start=1):
-        thread_id = item["thread_id"]
-        message_id = item["message_id"]
-        body_text = item.get("body_text") or ""
-
-        sentiment, confidence = call_gemini_sentiment(model, body_text)
-
+    for i, (item, score) in enumerate(zip(items, scores)):
+        if score is None:
+            continue
+        sentiment, confidence = score
         out_rows.append({
-            "message_id": message_id,
-            "thread_id": thread_id,
+            "message_id": item["message_id"],
+            "thread_id": item["thread_id"],
             "sentiment": sentiment,
             "confidence": confidence,
             "prompt_version": PROMPT_VERSION,
-            "model_name": MODEL_NAME,
-            "created_at": now_ts,
+            "model_name": model_names[i] if model_names else MODEL_NAME,
+            "created_at": created_at,
         })
+    return out_rows
+
+
+def watermark_table_id() -> str:
+    return f"{PROJECT_ID}.{DATASET}.{WATERMARK_TABLE}"
+
+
+def plan_discovery(
+    bq: bigquery.Client,
+    run_started: datetime,
+    full_reconcile: bool,
+    shard: Optional[Shard] = None,
+) -> Optional[datetime]:
+    """Return the incremental lower bound for this run, or None for a full scan."""
+    if not INCREMENTAL_DISCOVERY or full_reconcile:
+        return None
+    state = get_watermark(bq, watermark_table_id(), shard_key(WORKER_NAME, shard))
+    last_full = state["last_full_reconcile_ts"]
+    if state["watermark_ts"] is None or last_full is None:
+        return None
+    if run_started - last_full > timedelta(hours=FULL_RECONCILE_HOURS):
+        print("Full reconcile is due; scanning all threads.")
+        return None
+    return state["watermark_ts"] - timedelta(minutes=WATERMARK_LOOKBACK_MINUTES)
+
+
+def advance_watermark(
+    bq: bigquery.Client,
+    since: Optional[datetime],
+    run_started: datetime,
+    drained: bool,
+    newest_seen: Optional[datetime],
+    oldest_failed: Optional[datetime],
+    shard: Optional[Shard] = None,
+) -> None:
+    """
+    Save the watermark after a run that discovered from since (see plan_discovery).
+
+    The watermark moves to run_started if the run drained the backlog,
+    otherwise to newest_seen, but never past oldest_failed. Only valid when
+    messages were discovered oldest first and their rows have been written.
+    """
+    if not INCREMENTAL_DISCOVERY:
+        return
+    new_watermark = run_started if drained else newest_seen
+    if oldest_failed is not None:
+        new_watermark = min_ts(new_watermark, oldest_failed - timedelta(microseconds=1))
+    watermark_key = shard_key(WORKER_NAME, shard)
+    if since is None:
+        # Messages come oldest first, so even a partial full scan handled
+        # everything up to new_watermark; incremental runs continue from there.
+        save_watermark(bq, watermark_table_id(), watermark_key, watermark_ts=new_watermark,
+                       full_reconcile_ts=run_started, rewind=True)
+    elif new_watermark is not None:
+        save_watermark(bq, watermark_table_id(), watermark_key, watermark_ts=new_watermark)
+
+
+def run_batch(
+    bq: bigquery.Client,
+    model: GenerativeModel,
+    batch_limit: int,
+    concurrency: int,
+    batched: bool,
+    cache: Optional[LLMCache] = None,
+    stop_event: Optional[threading.Event] = None,
+    full_reconcile: bool = False,
+    journal: Optional[WorkJournal] = None,
+    shard: Optional[Shard] = None,
+) -> int:
+    """
+    Score up to batch_limit messages, inserting every FLUSH_SIZE rows.
+
+    Messages are streamed from BigQuery and scored in chunks, easy ones by
+    the local rules (see score_chunk); each chunk is handed to the writer
+    before the next is scored, so with streaming writes a crash only loses
+    the chunk in flight (load mode buffers up to BQ_LOAD_FLUSH_ROWS). If
+    stop_event is set, the run ends after the current chunk.
+
+    With INCREMENTAL_DISCOVERY the run scans only events past the stored
+    watermark and then advances it: to the run start if the backlog was
+    drained, otherwise to the newest event handled, but never past the
+    oldest message that failed. A full scan runs when no watermark exists,
+    when full_reconcile is set, or every FULL_RECONCILE_HOURS. It sets the
+    watermark the same way (moving it back to a failed message if need be)
+    and records the reconcile even if it did not drain: it handled every
+    message up to the new watermark, and the incremental runs that follow
+    page through the rest.
+    With a journal, rows are journaled before they are written, and rows an
+    interrupted run left behind are replayed before discovery, so their
+    messages are not scored again (see journal). With a shard, only the
+    shard's threads are discovered and the watermark is kept per shard
+    (see sharding).
+    The threads that got new rows are then refreshed in thread_state_final,
+    and the run's metrics are reported (see worker_metrics.report).
+    Returns the number of messages fetched.
+    """
+    run_started = datetime.now(timezone.utc)
+    started = time.monotonic()
+    since = plan_discovery(bq, run_started, full_reconcile, shard)
+    seen = inserted = 0
+    newest_seen = oldest_failed = None
+    stopped = False
+    touched_threads = set()
+
+    writer = sentiment_writer(bq)
+    if journal is not None:
+        touched_threads.update(r["thread_id"] for r in journal.replay({writer.table_id: writer}))
+    writer = journaled(writer, journal)
 
-        if i % 20 == 0:
-            print(f"Scored {i}/{len(to_score)} messages...")
+    try:
+        for chunk in chunked(fetch_latest_messages_to_score(bq, batch_limit, since, shard), FLUSH_SIZE):
+            scores, model_names = score_chunk(model, chunk, concurrency, batched, cache)
+            out_rows = build_sentiment_rows(chunk, scores, datetime.now(timezone.utc).isoformat(), model_names)
+            if out_rows:
+                insert_sentiments(bq, out_rows, writer)
+                touched_threads.update(r["thread_id"] for r in out_rows)
+            for item, score in zip(chunk, scores):
+                newest_seen = max_ts(newest_seen, item.get("event_ts"))
+                if score is None:
+                    oldest_failed = min_ts(oldest_failed, item.get("event_ts"))
+            seen += len(chunk)
+            inserted += len(out_rows)
+            print(f"Scored {inserted}/{seen} messages so far...")
+            if should_stop(stop_event):
+                stopped = True
+                break
+    finally:
+        # Buffered writers (load mode) must land before the watermark moves
+        writer.flush()
+
+    refresh_after_write(bq, touched_threads)
+    record_run(WORKER_NAME, seen, inserted, time.monotonic() - started)
+    report(WORKER_NAME, shard.name if shard else None)
+
+    drained = seen < batch_limit and not stopped
+    advance_watermark(bq, since, run_started, drained, newest_seen, oldest_failed, shard)
+
+    if not seen:
+        print("No new latest messages to score.")
+        return 0
+
+    failed = seen - inserted
+    if failed:
+        print(f"{failed} messages failed scoring and will be retried on the next run.")
+    print(f"Inserted {inserted} sentiment rows into message_sentiment.")
+    return seen
+
+
+def main(
+    concurrency: int = None,
+    batched: bool = None,
+    batch_limit: int = None,
+    daemon: bool = False,
+    full_reconcile: bool = False,
+    shard: Optional[Shard] = None,
+):
+    """
+    Score the latest unscored message of each thread.
+
+    Args:
+        concurrency: Number of Gemini requests in flight (defaults to SCORING_CONCURRENCY)
+        batched: Pack several emails per prompt (defaults to BATCHED_MODE)
+        batch_limit: Number of messages to score per run (defaults to BATCH_LIMIT);
+            in daemon mode this is the initial, adaptively resized batch size
+        daemon: Keep polling for new messages until SIGTERM/SIGINT
+        full_reconcile: Scan all threads on the first run instead of only
+            those touched since the watermark
+        shard: Only score this shard's threads (see sharding)
+    """
+    if concurrency is None:
+        concurrency = SCORING_CONCURRENCY
+    if batched is None:
+        batched = BATCHED_MODE
+    if batch_limit is None:
+        batch_limit = BATCH_LIMIT
 
-    insert_sentiments(bq, out_rows)
-    print(f"Inserted {len(out_rows)} sentiment rows into message_sentiment.")
+    bq = bigquery.Client(project=PROJECT_ID)
+
+    # Ensure tables exist
+    ensure_message_sentiment_table(bq)
+    if INCREMENTAL_DISCOVERY:
+        ensure_watermark_table(bq, watermark_table_id())
+    if REFRESH_AFTER_WRITE:
+        ensure_materialized_tables(bq)
+
+    # Init Vertex AI
+    vertexai.init(project=PROJECT_ID, location=REGION)
+    model = GenerativeModel(MODEL_NAME)
+
+    cache = open_cache()
+    journal = open_journal(WORKER_NAME, shard)
+    if shard:
+        print(f"Running as {shard.name}.")
+    try:
+        if daemon:
+            def _cycle(limit: int, stop_event: threading.Event) -> int:
+                nonlocal full_reconcile
+                seen = run_batch(bq, model, limit, concurrency, batched, cache, stop_event, full_reconcile, journal, shard)
+                full_reconcile = False
+                return seen
+
+            run_daemon(_cycle, initial_batch=batch_limit)
+        else:
+            run_batch(bq, model, batch_limit, concurrency, batched, cache,
+                      full_reconcile=full_reconcile, journal=journal, shard=shard)
+    finally:
+        if cache:
+            print(f"LLM cache: {cache.stats()}")
+            cache.close()
+        if journal:
+            journal.close()
 
 
 if __name__ == "__main__":
-    main()
+    # --daemon keeps polling; --full forces a full reconcile on the first run;
+    # --shard i/N scores only shard i of N (see sharding)
+    shard, args = resolve_shard(sys.argv[1:])
+    main(daemon="--daemon" in args, full_reconcile="--full" in args, shard=shard)
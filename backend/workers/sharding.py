@@ -0,0 +1,102 @@
+"""
+Hash partitioning of the workers' discovery by thread_id.
+
+Two copies of a worker used to discover the same rows and score them twice.
+With a shard, a worker only discovers threads in its partition:
+
+    ABS(MOD(FARM_FINGERPRINT(thread_id), shard_count)) = shard_index
+
+so N workers started as shards 0/N ... N-1/N split the backlog with no
+overlap and no coordination, and every thread stays with one worker. State
+that tracks a worker's progress (the sentiment watermark, the work journal,
+the Pushgateway grouping) is kept per shard (see shard_key).
+
+The shard comes from, in order:
+- --shard i/N on the command line
+- the WORKER_SHARD environment variable ("i/N")
+- CLOUD_RUN_TASK_INDEX / CLOUD_RUN_TASK_COUNT, so a Cloud Run job run with
+  --tasks N shards itself
+
+Indexes are 0-based. Changing N moves threads between shards. Each new
+shard starts with a full scan, since it has no watermark yet.
+"""
+import os
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from google.cloud import bigquery
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    @property
+    def name(self) -> str:
+        return f"shard-{self.index}-of-{self.count}"
+
+
+def parse_shard(spec: str) -> Optional[Shard]:
+    """Parse "i/N"; a single shard ("0/1") means no sharding and returns None."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {spec!r}: expected i/N, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {spec!r}: index must be in 0..N-1")
+    return Shard(index, count) if count > 1 else None
+
+
+def shard_from_env() -> Optional[Shard]:
+    """The shard from WORKER_SHARD or the Cloud Run job task index/count, if any."""
+    spec = os.getenv("WORKER_SHARD", "")
+    if spec:
+        return parse_shard(spec)
+    if os.getenv("CLOUD_RUN_TASK_COUNT"):
+        return parse_shard(f"{os.getenv('CLOUD_RUN_TASK_INDEX', '0')}/{os.environ['CLOUD_RUN_TASK_COUNT']}")
+    return None
+
+
+def resolve_shard(argv: Sequence[str]) -> Tuple[Optional[Shard], List[str]]:
+    """
+    Take --shard i/N (or --shard=i/N) out of argv.
+
+    Returns (shard, remaining arguments); without --shard the shard comes
+    from the environment (see shard_from_env).
+    """
+    remaining = []
+    spec = None
+    args = list(argv)
+    i = 0
+    while i < len(args):
+        if args[i] == "--shard" and i + 1 < len(args):
+            spec = args[i + 1]
+            i += 2
+            continue
+        if args[i].startswith("--shard="):
+            spec = args[i].split("=", 1)[1]
+        else:
+            remaining.append(args[i])
+        i += 1
+    return (parse_shard(spec) if spec is not None else shard_from_env()), remaining
+
+
+def shard_condition(shard: Optional[Shard], column: str = "thread_id") -> str:
+    """SQL condition selecting the shard's rows (empty without a shard); see shard_params."""
+    if shard is None:
+        return ""
+    return f"ABS(MOD(FARM_FINGERPRINT({column}), @shard_count)) = @shard_index"
+
+
+def shard_params(shard: Optional[Shard]) -> List[bigquery.ScalarQueryParameter]:
+    """Query parameters used by shard_condition."""
+    if shard is None:
+        return []
+    return [
+        bigquery.ScalarQueryParameter("shard_index", "INT64", shard.index),
+        bigquery.ScalarQueryParameter("shard_count", "INT64", shard.count),
+    ]
+
+
+def shard_key(name: str, shard: Optional[Shard]) -> str:
+    """name, qualified with the shard (e.g. "sentiment-shard-0-of-4") when sharded."""
+    return name if shard is None else f"{name}-{shard.name}"
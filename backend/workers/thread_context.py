@@ -0,0 +1,184 @@
+"""
+Rolling per-thread context for the explain worker.
+
+Judging a thread by its last two messages misreads long threads, and sending
+the whole thread makes the prompt grow with every message. Instead each
+thread keeps a rolling summary in the thread_summary table, and the explain
+prompt gets the summary, the most recent messages it does not cover yet and
+the last message, within CONTEXT_TOKEN_BUDGET tokens:
+
+- discovery returns the thread's latest summary and its last
+  CONTEXT_MAX_MESSAGES messages (see explain_worker.fetch_threads_to_explain)
+- messages the summary already covers (event_ts <= summarized_through_ts)
+  are dropped
+- if the remaining messages don't fit the budget, the oldest are folded into
+  the summary with one model call that sees only the previous summary and
+  those messages, never the whole thread, and a new summary row is written
+
+The prompt therefore stays bounded however long a thread gets, and a new
+message costs at most one incremental summary update. Messages older than
+the last CONTEXT_MAX_MESSAGES that were never summarized (threads that
+predate the summary table) are not read. Tokens are estimated at
+CHARS_PER_TOKEN characters each; there is no tokenizer dependency.
+
+Summary rows are append-only; the latest summarized_through_ts per thread
+wins. Bumping SUMMARY_PROMPT_VERSION starts every summary from scratch.
+"""
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from google.cloud import bigquery
+
+from bq_writer import get_writer
+
+SUMMARY_TABLE = "thread_summary"
+SUMMARY_PROMPT_VERSION = "thread_summary_v0.1"
+
+# Prompt budget for summary + earlier messages + last message
+CONTEXT_TOKEN_BUDGET = int(os.getenv("EXPLAIN_CONTEXT_TOKEN_BUDGET", "1500"))
+# Longest summary kept; the summary prompt asks for less
+SUMMARY_MAX_TOKENS = int(os.getenv("EXPLAIN_SUMMARY_MAX_TOKENS", "250"))
+# The last message (and each message folded into a summary) is cut to this
+MESSAGE_MAX_TOKENS = int(os.getenv("EXPLAIN_MESSAGE_MAX_TOKENS", "600"))
+# Messages per thread returned by discovery
+CONTEXT_MAX_MESSAGES = int(os.getenv("EXPLAIN_CONTEXT_MAX_MESSAGES", "20"))
+
+CHARS_PER_TOKEN = 4
+
+# summarize(previous_summary, messages oldest first) -> new summary text
+Summarize = Callable[[Optional[str], List[str]], str]
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token count of text (CHARS_PER_TOKEN characters per token)."""
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int) -> str:
+    """Cut text to about max_tokens, keeping the start (replies quote below)."""
+    text = text or ""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + " [...]"
+
+
+def build_context(item: Dict[str, Any], summarize: Optional[Summarize] = None) -> Dict[str, Any]:
+    """
+    Build the explain prompt context for a discovered thread.
+
+    item is a discovery row: "messages" (newest first, each with
+    message_body and event_ts) and the thread's "summary",
+    "summarized_through_ts" and "summarized_messages" (None if it has no
+    summary yet). Rows without "messages" fall back to last_message_body
+    and previous_message_body.
+
+    Returns a dict with:
+    - summary: summary of the older messages, or None
+    - earlier_messages: bodies between the summary and the last message,
+      oldest first
+    - last_message: body of the last message, truncated to MESSAGE_MAX_TOKENS
+    - new_summary: {"summary", "summarized_through_ts",
+      "summarized_messages"} when messages were folded into the summary,
+      to be saved with summary_row(); otherwise None
+
+    If summarize is None or fails, messages that don't fit are dropped
+    instead and the previous summary is kept.
+    """
+    messages = list(reversed(item.get("messages") or []))
+    if not messages:
+        messages = [
+            {"message_body": body, "event_ts": None}
+            for body in (item.get("previous_message_body"), item.get("last_message_body"))
+            if body is not None
+        ] or [{"message_body": "", "event_ts": None}]
+
+    summary = item.get("summary")
+    through = item.get("summarized_through_ts")
+    pending = [m for m in messages if through is None or m["event_ts"] is None or m["event_ts"] > through]
+    # Nothing new (e.g. re-explaining under a new prompt version): still show the last message
+    pending = pending or messages[-1:]
+    last_message = truncate_to_tokens(pending[-1]["message_body"], MESSAGE_MAX_TOKENS)
+    history = pending[:-1]
+
+    # Keep the newest earlier messages that fit next to the summary and the last message
+    available = CONTEXT_TOKEN_BUDGET - estimate_tokens(last_message) - estimate_tokens(summary)
+    keep: List[Dict[str, Any]] = []
+    for message in reversed(history):
+        cost = estimate_tokens(message["message_body"])
+        if cost > available:
+            break
+        keep.insert(0, message)
+        available -= cost
+    fold = history[:len(history) - len(keep)]
+    if fold:
+        # The summary may grow to SUMMARY_MAX_TOKENS; make room for it
+        growth = max(0, SUMMARY_MAX_TOKENS - estimate_tokens(summary))
+        while keep and available < growth:
+            available += estimate_tokens(keep[0]["message_body"])
+            fold.append(keep.pop(0))
+
+    new_summary = None
+    if fold and summarize is not None:
+        try:
+            text = summarize(summary, [truncate_to_tokens(m["message_body"], MESSAGE_MAX_TOKENS) for m in fold])
+            summary = truncate_to_tokens(text.strip(), SUMMARY_MAX_TOKENS)
+            new_summary = {
+                "summary": summary,
+                "summarized_through_ts": fold[-1]["event_ts"],
+                "summarized_messages": (item.get("summarized_messages") or 0) + len(fold),
+            }
+        except Exception as e:
+            print(f"Summary update failed for thread {item.get('thread_id')}, dropping {len(fold)} older messages: {e}")
+
+    return {
+        "summary": summary,
+        "earlier_messages": [m["message_body"] or "" for m in keep],
+        "last_message": last_message,
+        "new_summary": new_summary,
+    }
+
+
+def ensure_summary_table(bq: bigquery.Client, table_id: str) -> None:
+    """Create the thread_summary table if it doesn't exist (see sql/create_thread_summary_table.sql)."""
+    try:
+        bq.get_table(table_id)
+    except Exception:
+        schema = [
+            bigquery.SchemaField("thread_id", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("summary", "STRING"),
+            bigquery.SchemaField("summarized_through_ts", "TIMESTAMP"),
+            bigquery.SchemaField("summarized_messages", "INT64"),
+            bigquery.SchemaField("prompt_version", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("model_name", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("updated_at", "TIMESTAMP", mode="REQUIRED"),
+        ]
+        bq.create_table(bigquery.Table(table_id, schema=schema))
+
+
+def summary_writer(bq: bigquery.Client, table_id: str, mode: str = None):
+    """
+    Writer for thread_summary (see bq_writer). thread_id + prompt_version +
+    summarized_through_ts is the insertId, so a retried chunk does not
+    duplicate a summary.
+    """
+    return get_writer(
+        bq,
+        table_id,
+        row_id=lambda r: f"{r['thread_id']}:{r['prompt_version']}:{r['summarized_through_ts']}",
+        mode=mode,
+    )
+
+
+def summary_row(thread_id: str, new_summary: Dict[str, Any], model_name: str, updated_at) -> Dict[str, Any]:
+    """thread_summary row for a summary returned by build_context."""
+    through = new_summary["summarized_through_ts"]
+    return {
+        "thread_id": thread_id,
+        "summary": new_summary["summary"],
+        "summarized_through_ts": through.isoformat() if hasattr(through, "isoformat") else through,
+        "summarized_messages": new_summary["summarized_messages"],
+        "prompt_version": SUMMARY_PROMPT_VERSION,
+        "model_name": model_name,
+        "updated_at": updated_at.isoformat(),
+    }
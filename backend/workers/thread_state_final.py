@@ -0,0 +1,299 @@
+"""
+Materialized latest state per thread (thread_state_final).
+
+v_thread_state_final recomputes the latest explanation and sentiment of
+every thread from the full history tables on each read. This module keeps
+the same result in a table instead, one row per thread, maintained with
+MERGE:
+
+- After each run, the sentiment and explain workers refresh only the
+  threads they just wrote (THREAD_STATE_FINAL_REFRESH, default on).
+- Running this script refreshes threads whose thread_state,
+  message_sentiment or thread_state_explain rows changed since its watermark
+  (this also picks up thread_state updates made by ingestion). Schedule it
+  alongside ingestion; --full rebuilds every thread and removes threads that
+  no longer exist.
+
+The table is partitioned on DATE(last_message_ts) and clustered on the
+columns the API filters by, so the thread list reads a few small blocks
+instead of the history tables. Every refresh also updates the affected
+periods of the rollups (see rollups).
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from bq_query import run_query
+from rollups import ensure_rollup_tables, refresh_rollups
+from watermark import WATERMARK_TABLE, ensure_watermark_table, get_watermark, save_watermark
+
+PROJECT_ID = "clariversev1"
+DATASET = "flipkart_slices"
+
+THREAD_STATE_FINAL_TABLE = "thread_state_final"
+WORKER_NAME = "thread_state_final"
+
+# Refresh the touched threads at the end of each worker run
+REFRESH_AFTER_WRITE = os.getenv("THREAD_STATE_FINAL_REFRESH", "true").lower() == "true"
+# Incremental refreshes re-read this much history before the watermark
+REFRESH_LOOKBACK_MINUTES = int(os.getenv("THREAD_STATE_FINAL_LOOKBACK_MINUTES", "60"))
+
+# Same label mapping as v_thread_state_final
+SENTIMENT_LABEL_SQL = """
+      CASE
+        WHEN SAFE_CAST(ls.s.sentiment AS INT64) = 1 THEN 'Happy'
+        WHEN SAFE_CAST(ls.s.sentiment AS INT64) = 2 THEN 'Bit Irritated'
+        WHEN SAFE_CAST(ls.s.sentiment AS INT64) = 3 THEN 'Moderately Concerned'
+        WHEN SAFE_CAST(ls.s.sentiment AS INT64) = 4 THEN 'Anger'
+        WHEN SAFE_CAST(ls.s.sentiment AS INT64) = 5 THEN 'Frustrated'
+        WHEN LOWER(CAST(ls.s.sentiment AS STRING)) = 'happy' THEN 'Happy'
+        WHEN LOWER(CAST(ls.s.sentiment AS STRING)) = 'bit irritated' THEN 'Bit Irritated'
+        WHEN LOWER(CAST(ls.s.sentiment AS STRING)) = 'moderately concerned' THEN 'Moderately Concerned'
+        WHEN LOWER(CAST(ls.s.sentiment AS STRING)) = 'anger' THEN 'Anger'
+        WHEN LOWER(CAST(ls.s.sentiment AS STRING)) = 'frustrated' THEN 'Frustrated'
+        ELSE CAST(ls.s.sentiment AS STRING)
+      END"""
+
+
+def _table_id(name: str) -> str:
+    return f"{PROJECT_ID}.{DATASET}.{name}"
+
+
+def ensure_thread_state_final_table(bq: bigquery.Client) -> None:
+    """Create the thread_state_final table if it doesn't exist."""
+    table_id = _table_id(THREAD_STATE_FINAL_TABLE)
+    try:
+        bq.get_table(table_id)
+    except Exception:
+        print(f"Creating table {table_id}...")
+        schema = [
+            bigquery.SchemaField("thread_id", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("last_message_ts", "TIMESTAMP"),
+            bigquery.SchemaField("message_count", "INTEGER"),
+            bigquery.SchemaField("thread_status", "STRING"),
+            bigquery.SchemaField("next_action_owner", "STRING"),
+            bigquery.SchemaField("status_reason", "STRING"),
+            bigquery.SchemaField("status_confidence", "FLOAT"),
+            bigquery.SchemaField("status_source", "STRING"),
+            bigquery.SchemaField("sentiment", "STRING"),
+            bigquery.SchemaField("confidence", "FLOAT"),
+            bigquery.SchemaField("prompt_version", "STRING"),
+            bigquery.SchemaField("model_name", "STRING"),
+            bigquery.SchemaField("explained_at", "TIMESTAMP"),
+            bigquery.SchemaField("sentiment_scored_at", "TIMESTAMP"),
+            bigquery.SchemaField("updated_at", "TIMESTAMP", mode="REQUIRED"),
+        ]
+        table = bigquery.Table(table_id, schema=schema)
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY, field="last_message_ts"
+        )
+        table.clustering_fields = ["thread_status", "sentiment", "next_action_owner", "thread_id"]
+        bq.create_table(table)
+        print(f"Table {table_id} created successfully.")
+
+
+def ensure_materialized_tables(bq: bigquery.Client) -> None:
+    """Create thread_state_final and the rollups built from it, if missing."""
+    ensure_thread_state_final_table(bq)
+    ensure_rollup_tables(bq)
+
+
+def _scope(
+    thread_ids: Optional[Iterable[str]],
+    since: Optional[datetime],
+) -> Tuple[Optional[str], list]:
+    """SQL selecting the thread_ids of a refresh and its parameters; None for all threads."""
+    params = []
+    if thread_ids is not None:
+        scope = "SELECT thread_id FROM UNNEST(@thread_ids) AS thread_id"
+        params.append(bigquery.ArrayQueryParameter("thread_ids", "STRING", sorted(set(thread_ids))))
+    elif since is not None:
+        # message_sentiment.created_at may be a STRING when the worker created the table
+        scope = f"""
+          SELECT thread_id FROM `{_table_id('thread_state')}` WHERE computed_at >= @since
+          UNION DISTINCT
+          SELECT thread_id FROM `{_table_id('message_sentiment')}` WHERE SAFE_CAST(created_at AS TIMESTAMP) >= @since
+          UNION DISTINCT
+          SELECT thread_id FROM `{_table_id('thread_state_explain')}` WHERE created_at >= @since"""
+        params.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+    else:
+        scope = None
+    return scope, params
+
+
+def _previous_days(bq: bigquery.Client, scope: str, params: list) -> List[date]:
+    """Days (DATE(last_message_ts)) the threads in scope are stored under now."""
+    query = f"""
+    SELECT DISTINCT DATE(last_message_ts) AS day
+    FROM `{_table_id(THREAD_STATE_FINAL_TABLE)}`
+    WHERE last_message_ts IS NOT NULL
+      AND thread_id IN ({scope})
+    """
+    _, rows = run_query(
+        bq, query, bigquery.QueryJobConfig(query_parameters=params), site="thread_state_final_previous_days"
+    )
+    return [row["day"] for row in rows]
+
+
+def refresh_thread_state_final(
+    bq: bigquery.Client,
+    thread_ids: Optional[Iterable[str]] = None,
+    since: Optional[datetime] = None,
+) -> List[date]:
+    """
+    MERGE the latest state of a set of threads into thread_state_final.
+
+    The set is thread_ids if given, else every thread with a thread_state,
+    message_sentiment or thread_state_explain row changed at or after since,
+    else all threads (a full rebuild, which also deletes threads that are no
+    longer in thread_state).
+
+    Returns the days the threads were stored under before the MERGE (empty
+    for a full rebuild), so refresh_rollups can recount the periods they
+    moved out of.
+    """
+    scope, params = _scope(thread_ids, since)
+    previous_days = _previous_days(bq, scope, params) if scope else []
+
+    in_scope = "AND thread_id IN (SELECT thread_id FROM scope)" if scope else ""
+    scope_cte = f"scope AS ({scope})," if scope else ""
+    # A full rebuild sees every thread, so anything missing from the source is gone
+    delete_missing = "WHEN NOT MATCHED BY SOURCE THEN DELETE" if scope is None else ""
+
+    query = f"""
+    MERGE `{_table_id(THREAD_STATE_FINAL_TABLE)}` f
+    USING (
+      WITH {scope_cte}
+      thread_base AS (
+        SELECT thread_id, last_message_ts, message_count, thread_status
+        FROM `{_table_id('thread_state')}`
+        WHERE thread_id IS NOT NULL {in_scope}
+      ),
+      latest_explain AS (
+        SELECT
+          thread_id,
+          ARRAY_AGG(
+            STRUCT(thread_status, next_action_owner, status_reason, confidence, created_at)
+            ORDER BY created_at DESC
+            LIMIT 1
+          )[OFFSET(0)] AS e
+        FROM `{_table_id('thread_state_explain')}`
+        WHERE thread_id IS NOT NULL {in_scope}
+        GROUP BY thread_id
+      ),
+      latest_sentiment AS (
+        SELECT
+          thread_id,
+          ARRAY_AGG(
+            STRUCT(sentiment, confidence, prompt_version, model_name, created_at)
+            ORDER BY created_at DESC
+            LIMIT 1
+          )[OFFSET(0)] AS s
+        FROM `{_table_id('message_sentiment')}`
+        WHERE thread_id IS NOT NULL {in_scope}
+        GROUP BY thread_id
+      )
+      SELECT
+        t.thread_id,
+        t.last_message_ts,
+        t.message_count,
+        COALESCE(le.e.thread_status, t.thread_status) AS thread_status,
+        le.e.next_action_owner,
+        le.e.status_reason,
+        le.e.confidence AS status_confidence,
+        IF(le.e.thread_status IS NOT NULL, 'llm', 'heuristic') AS status_source,
+        {SENTIMENT_LABEL_SQL} AS sentiment,
+        ls.s.confidence,
+        ls.s.prompt_version,
+        ls.s.model_name,
+        le.e.created_at AS explained_at,
+        SAFE_CAST(ls.s.created_at AS TIMESTAMP) AS sentiment_scored_at
+      FROM thread_base t
+      LEFT JOIN latest_explain le USING (thread_id)
+      LEFT JOIN latest_sentiment ls USING (thread_id)
+    ) src
+    ON f.thread_id = src.thread_id
+    WHEN MATCHED THEN UPDATE SET
+      last_message_ts = src.last_message_ts,
+      message_count = src.message_count,
+      thread_status = src.thread_status,
+      next_action_owner = src.next_action_owner,
+      status_reason = src.status_reason,
+      status_confidence = src.status_confidence,
+      status_source = src.status_source,
+      sentiment = src.sentiment,
+      confidence = src.confidence,
+      prompt_version = src.prompt_version,
+      model_name = src.model_name,
+      explained_at = src.explained_at,
+      sentiment_scored_at = src.sentiment_scored_at,
+      updated_at = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT (
+      thread_id, last_message_ts, message_count, thread_status, next_action_owner,
+      status_reason, status_confidence, status_source, sentiment, confidence,
+      prompt_version, model_name, explained_at, sentiment_scored_at, updated_at
+    ) VALUES (
+      src.thread_id, src.last_message_ts, src.message_count, src.thread_status, src.next_action_owner,
+      src.status_reason, src.status_confidence, src.status_source, src.sentiment, src.confidence,
+      src.prompt_version, src.model_name, src.explained_at, src.sentiment_scored_at, CURRENT_TIMESTAMP()
+    )
+    {delete_missing}
+    """
+    job, _ = run_query(
+        bq, query, bigquery.QueryJobConfig(query_parameters=params), site="thread_state_final_merge"
+    )
+    print(f"thread_state_final refreshed ({job.num_dml_affected_rows} rows affected).")
+    return previous_days
+
+
+def refresh_after_write(bq: bigquery.Client, thread_ids: Iterable[str]) -> None:
+    """
+    Refresh the threads a worker run just wrote. Failures are logged, not
+    raised: the results are already stored and the scheduled refresh picks
+    the threads up on its next run.
+    """
+    thread_ids = set(thread_ids)
+    if not REFRESH_AFTER_WRITE or not thread_ids:
+        return
+    try:
+        previous_days = refresh_thread_state_final(bq, thread_ids=thread_ids)
+        refresh_rollups(bq, thread_ids=thread_ids, previous_days=previous_days)
+    except Exception as e:
+        print(f"WARNING: Failed to refresh thread_state_final/rollups for {len(thread_ids)} threads: {e}")
+
+
+def main(full: bool = False):
+    """
+    Refresh thread_state_final (and the rollups) from the rows changed
+    since the last refresh.
+
+    Args:
+        full: Rebuild every thread (also runs when no watermark exists yet)
+    """
+    bq = bigquery.Client(project=PROJECT_ID)
+    ensure_materialized_tables(bq)
+    watermark_table_id = _table_id(WATERMARK_TABLE)
+    ensure_watermark_table(bq, watermark_table_id)
+
+    run_started = datetime.now(timezone.utc)
+    state = get_watermark(bq, watermark_table_id, WORKER_NAME)
+    if full or state["watermark_ts"] is None:
+        print("Rebuilding thread_state_final for all threads...")
+        refresh_thread_state_final(bq)
+        refresh_rollups(bq)
+        save_watermark(bq, watermark_table_id, WORKER_NAME,
+                       watermark_ts=run_started, full_reconcile_ts=run_started)
+    else:
+        since = state["watermark_ts"] - timedelta(minutes=REFRESH_LOOKBACK_MINUTES)
+        print(f"Refreshing threads changed since {since.isoformat()}...")
+        previous_days = refresh_thread_state_final(bq, since=since)
+        # Rows the MERGE above just touched, and the periods they left
+        refresh_rollups(bq, since=run_started, previous_days=previous_days)
+        save_watermark(bq, watermark_table_id, WORKER_NAME, watermark_ts=run_started)
+
+
+if __name__ == "__main__":
+    main(full="--full" in sys.argv[1:])
@@ -0,0 +1,109 @@
+"""
+High-water marks for incremental work discovery.
+
+Each worker keeps one row in the worker_watermark table:
+- watermark_ts: every event at or before this timestamp has been handled
+  (minus a small lookback that absorbs late-arriving events)
+- last_full_reconcile_ts: when the worker last completed a full scan
+
+The table lives in BigQuery rather than on local disk so Cloud Run jobs and
+separate runs share the same state. Updates use MERGE (DML), which also
+avoids the streaming buffer delay on freshly inserted rows.
+"""
+from typing import Any, Dict, Optional
+
+from google.cloud import bigquery
+
+from bq_query import run_query
+
+WATERMARK_TABLE = "worker_watermark"
+
+
+def ensure_watermark_table(bq: bigquery.Client, table_id: str) -> None:
+    """Create the worker_watermark table if it doesn't exist."""
+    try:
+        bq.get_table(table_id)
+    except Exception:
+        schema = [
+            bigquery.SchemaField("worker", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("watermark_ts", "TIMESTAMP"),
+            bigquery.SchemaField("last_full_reconcile_ts", "TIMESTAMP"),
+            bigquery.SchemaField("updated_at", "TIMESTAMP", mode="REQUIRED"),
+        ]
+        bq.create_table(bigquery.Table(table_id, schema=schema))
+
+
+def get_watermark(bq: bigquery.Client, table_id: str, worker: str) -> Dict[str, Any]:
+    """Return {"watermark_ts", "last_full_reconcile_ts"} for worker (None when unset)."""
+    query = f"""
+    SELECT watermark_ts, last_full_reconcile_ts
+    FROM `{table_id}`
+    WHERE worker = @worker
+    LIMIT 1
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("worker", "STRING", worker)]
+    )
+    _, rows = run_query(bq, query, job_config, site="watermark_read")
+    rows = list(rows)
+    if not rows:
+        return {"watermark_ts": None, "last_full_reconcile_ts": None}
+    return dict(rows[0])
+
+
+def save_watermark(
+    bq: bigquery.Client,
+    table_id: str,
+    worker: str,
+    watermark_ts=None,
+    full_reconcile_ts=None,
+    rewind: bool = False,
+) -> None:
+    """
+    Upsert the worker's state. None leaves a field unchanged, and the
+    watermark never moves backwards unless rewind is set (a full reconcile
+    that found an older failure).
+    """
+    query = f"""
+    MERGE `{table_id}` w
+    USING (SELECT @worker AS worker) s
+    ON w.worker = s.worker
+    WHEN MATCHED THEN UPDATE SET
+      watermark_ts = CASE
+        WHEN @watermark_ts IS NULL THEN w.watermark_ts
+        WHEN w.watermark_ts IS NULL OR @rewind THEN @watermark_ts
+        ELSE GREATEST(w.watermark_ts, @watermark_ts)
+      END,
+      last_full_reconcile_ts = COALESCE(@full_reconcile_ts, w.last_full_reconcile_ts),
+      updated_at = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN
+      INSERT (worker, watermark_ts, last_full_reconcile_ts, updated_at)
+      VALUES (@worker, @watermark_ts, @full_reconcile_ts, CURRENT_TIMESTAMP())
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("worker", "STRING", worker),
+            bigquery.ScalarQueryParameter("watermark_ts", "TIMESTAMP", watermark_ts),
+            bigquery.ScalarQueryParameter("full_reconcile_ts", "TIMESTAMP", full_reconcile_ts),
+            bigquery.ScalarQueryParameter("rewind", "BOOL", rewind),
+        ]
+    )
+    run_query(bq, query, job_config, site="watermark_save")
+
+
+def max_ts(a: Optional[Any], b: Optional[Any]) -> Optional[Any]:
+    """max() that treats None as missing."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def min_ts(a: Optional[Any], b: Optional[Any]) -> Optional[Any]:
+    """min() that treats None as missing."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
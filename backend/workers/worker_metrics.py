@@ -0,0 +1,99 @@
+"""
+Prometheus-style metrics for the LLM workers.
+
+Built on the primitives in metrics_registry, which the API shares.
+Recorded:
+- llm_call_duration_seconds: every Gemini call, by outcome (see rate_limit)
+- llm_retries_total, llm_parse_failures_total: per worker; a parse failure
+  is a response that could not be parsed or failed validation
+- local_rule_results_total: items answered by the local rules, per worker
+  and rule (see local_rules)
+- journal_rows_replayed_total: rows an interrupted run left in the work
+  journal and the next run re-sent (see journal)
+- worker_rows_written_total, worker_items_total, worker_rows_per_second,
+  worker_run_duration_seconds: per worker run
+- bigquery_query_duration_seconds, bigquery_queries_total,
+  bigquery_bytes_processed_total, bigquery_bytes_billed_total,
+  bigquery_slot_ms_total, bigquery_estimated_bytes: per query call site
+  (see bq_query)
+
+Batch workers are not scraped, so report() publishes the values at the end
+of every run: pushed to a Prometheus Pushgateway if METRICS_PUSHGATEWAY_URL
+is set, and logged as one "METRICS {...}" JSON line unless METRICS_LOG=false.
+"""
+import json
+import os
+import urllib.request
+
+from metrics_registry import CONTENT_TYPE, Counter, Gauge, Histogram, render_metrics, snapshot
+
+METRICS_PUSHGATEWAY_URL = os.getenv("METRICS_PUSHGATEWAY_URL", "")
+METRICS_LOG = os.getenv("METRICS_LOG", "true").lower() == "true"
+PUSH_TIMEOUT_S = 5
+
+# Latency buckets in seconds for Gemini calls, and for everything else (worker runs)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+RUN_BUCKETS = (0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+LLM_CALL_DURATION = Histogram(
+    "llm_call_duration_seconds", "Gemini call latency by outcome (ok, quota_error, error).", ["outcome"],
+    buckets=LLM_BUCKETS,
+)
+LLM_RETRIES = Counter("llm_retries_total", "Gemini calls retried after a failure.", ["worker"])
+LLM_PARSE_FAILURES = Counter(
+    "llm_parse_failures_total", "Gemini responses that could not be parsed or failed validation.", ["worker"]
+)
+LOCAL_RULE_RESULTS = Counter(
+    "local_rule_results_total", "Items classified by the local rules instead of Gemini.", ["worker", "rule"]
+)
+JOURNAL_ROWS_REPLAYED = Counter(
+    "journal_rows_replayed_total", "Rows of an interrupted run re-sent from the work journal.", ["worker"]
+)
+WORKER_ROWS_WRITTEN = Counter("worker_rows_written_total", "Result rows written.", ["worker"])
+WORKER_ITEMS = Counter("worker_items_total", "Items fetched for processing.", ["worker"])
+WORKER_ROWS_PER_SECOND = Gauge("worker_rows_per_second", "Rows written per second in the last run.", ["worker"])
+WORKER_RUN_DURATION = Histogram(
+    "worker_run_duration_seconds", "Duration of a worker run.", ["worker"], buckets=RUN_BUCKETS
+)
+BIGQUERY_QUERY_DURATION = Histogram(
+    "bigquery_query_duration_seconds", "BigQuery job duration until the first page of rows.", ["query"],
+    buckets=RUN_BUCKETS,
+)
+BIGQUERY_QUERIES = Counter(
+    "bigquery_queries_total", "BigQuery jobs by outcome (ok, error, bytes_limit).", ["query", "status"]
+)
+BIGQUERY_BYTES_PROCESSED = Counter("bigquery_bytes_processed_total", "Bytes processed by BigQuery jobs.", ["query"])
+BIGQUERY_BYTES_BILLED = Counter("bigquery_bytes_billed_total", "Bytes billed for BigQuery jobs.", ["query"])
+BIGQUERY_SLOT_MS = Counter("bigquery_slot_ms_total", "Slot milliseconds used by BigQuery jobs.", ["query"])
+BIGQUERY_ESTIMATED_BYTES = Gauge(
+    "bigquery_estimated_bytes", "Bytes the query would process, from the latest dry run.", ["query"]
+)
+
+
+def record_run(worker: str, items: int, rows: int, elapsed_s: float) -> None:
+    """Record the outcome of one worker run (one batch, or one daemon cycle)."""
+    WORKER_ITEMS.inc(items, worker=worker)
+    WORKER_ROWS_WRITTEN.inc(rows, worker=worker)
+    WORKER_ROWS_PER_SECOND.set(rows / elapsed_s if elapsed_s > 0 else 0.0, worker=worker)
+    WORKER_RUN_DURATION.observe(elapsed_s, worker=worker)
+
+
+def report(job: str, instance: str = None) -> None:
+    """
+    Push the metrics to the Pushgateway and/or log them; failures only warn.
+    instance (e.g. the shard) keeps parallel workers of one job apart.
+    """
+    if METRICS_PUSHGATEWAY_URL:
+        url = f"{METRICS_PUSHGATEWAY_URL.rstrip('/')}/metrics/job/{job}"
+        if instance:
+            url += f"/instance/{instance}"
+        request = urllib.request.Request(
+            url, data=render_metrics().encode("utf-8"), method="PUT", headers={"Content-Type": CONTENT_TYPE}
+        )
+        try:
+            urllib.request.urlopen(request, timeout=PUSH_TIMEOUT_S).close()
+        except Exception as e:
+            print(f"WARNING: Failed to push metrics to {url}: {e}")
+    if METRICS_LOG:
+        labels = {"job": job, "instance": instance} if instance else {"job": job}
+        print(f"METRICS {json.dumps({**labels, **snapshot()})}")
@@ -52,6 +52,89 @@ export async function getThreads(limit: number = 10): Promise<Thread[]> {
   return response.json();
 }
 
+export interface ThreadFilters {
+  thread_status?: string[];
+  sentiment?: string[];
+  next_action_owner?: string[];
+  since?: string;
+  until?: string;
+}
+
+export interface ThreadPage {
+  threads: Thread[];
+  nextCursor: string | null;
+}
+
+/**
+ * Fetch one page of threads. Pass the previous page's nextCursor to continue.
+ */
+export async function getThreadsPage(
+  limit: number = 50,
+  cursor: string | null = null,
+  filters: ThreadFilters = {}
+): Promise<ThreadPage> {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set('cursor', cursor);
+  for (const key of ['thread_status', 'sentiment', 'next_action_owner'] as const) {
+    for (const value of filters[key] ?? []) params.append(key, value);
+  }
+  if (filters.since) params.set('since', filters.since);
+  if (filters.until) params.set('until', filters.until);
+
+  const response = await fetch(`${API_BASE_URL}/api/threads?${params}`, {
+    method: 'GET',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+  });
+
+  if (!response.ok) {
+    throw new Error(`Failed to fetch threads: ${response.statusText}`);
+  }
+
+  return {
+    threads: await response.json(),
+    nextCursor: response.headers.get('X-Next-Cursor'),
+  };
+}
+
+export type AggregateGrain = 'day' | 'week' | 'month';
+export type AggregateDimension = 'sentiment' | 'thread_status' | 'next_action_owner' | 'model_name';
+
+export interface AggregateRow {
+  period_start: string;
+  thread_count: number;
+  sentiment?: string | null;
+  thread_status?: string | null;
+  next_action_owner?: string | null;
+  model_name?: string | null;
+}
+
+/**
+ * Fetch thread counts per day/week/month, optionally broken down by dimensions
+ */
+export async function getAggregates(
+  grain: AggregateGrain = 'day',
+  periods: number = 30,
+  groupBy: AggregateDimension[] = []
+): Promise<AggregateRow[]> {
+  const params = new URLSearchParams({ grain, periods: String(periods) });
+  for (const dimension of groupBy) params.append('group_by', dimension);
+
+  const response = await fetch(`${API_BASE_URL}/api/threads/aggregates?${params}`, {
+    method: 'GET',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+  });
+
+  if (!response.ok) {
+    throw new Error(`Failed to fetch aggregates: ${response.statusText}`);
+  }
+
+  return response.json();
+}
+
 /**
  * Fetch monthly aggregates from the API
  */